@@ -1,4 +1,8 @@
-from marshmallow import Schema, fields
+from marshmallow import Schema, ValidationError, fields, validate, validates_schema
+
+COMPRESSION_METHODS = ["stored", "deflated", "bzip2", "lzma"]
+# the compression levels accepted by each method that uses a level
+COMPRESSION_LEVELS = {"deflated": (0, 9), "bzip2": (1, 9)}
 
 
 class ResourceSchema(Schema):
@@ -9,6 +13,7 @@ class ResourceSchema(Schema):
 class FileSchema(Schema):
     key = fields.Str(required=True)
     description = fields.Str(required=True)
+    deduplicate = fields.Boolean()
 
 
 class FilesSchema(Schema):
@@ -27,6 +32,76 @@ class TimeoutsSchema(Schema):
     delete = fields.Integer()
 
 
+class PollingSchema(Schema):
+    interval = fields.Integer()
+
+
+class CachingSchema(Schema):
+    status_ttl = fields.Integer()
+    status_max_entries = fields.Integer()
+    file_index_max_entries = fields.Integer(validate=validate.Range(min=0))
+
+
+class JobListSchema(Schema):
+    keyset_threshold = fields.Integer(validate=validate.Range(min=0))
+
+
+class SubmissionSchema(Schema):
+    asynchronous = fields.Boolean()
+    workers = fields.Integer()
+    retries = fields.Integer()
+    retry_delay = fields.Integer()
+    stale_after = fields.Integer(validate=validate.Range(min=0))
+
+
+class CompressionSchema(Schema):
+    method = fields.Str(validate=validate.OneOf(COMPRESSION_METHODS))
+    level = fields.Integer(allow_none=True, validate=validate.Range(0, 9))
+    extensions = fields.Dict(
+        keys=fields.Str(),
+        values=fields.Str(validate=validate.OneOf(COMPRESSION_METHODS)),
+    )
+    max_size = fields.Integer(allow_none=True)
+    probe = fields.Boolean()
+    probe_ratio = fields.Float()
+    workers = fields.Integer(validate=validate.Range(min=1))
+
+    @validates_schema
+    def validate_level(self, data, **kwargs):
+        # the level is used for the default method and any given for extensions
+        level = data.get("level")
+        if level is None:
+            return
+        methods = {data.get("method", "stored"), *data.get("extensions", {}).values()}
+        for method in sorted(methods & COMPRESSION_LEVELS.keys()):
+            low, high = COMPRESSION_LEVELS[method]
+            if not low <= level <= high:
+                raise ValidationError(
+                    f"Must be from {low} to {high} for {method}.", "level"
+                )
+
+
+class TarSchema(Schema):
+    zstd_level = fields.Integer(validate=validate.Range(1, 22))
+    gzip_level = fields.Integer(validate=validate.Range(0, 9))
+    threads = fields.Integer(validate=validate.Range(min=-1))
+
+
+class ArchiveCacheSchema(Schema):
+    enabled = fields.Boolean()
+    directory = fields.Str(allow_none=True)
+    max_size = fields.Integer(validate=validate.Range(min=0))
+    build_on_complete = fields.Boolean()
+    workers = fields.Integer(validate=validate.Range(min=1))
+
+
+class SendfileSchema(Schema):
+    header = fields.Str(
+        allow_none=True, validate=validate.OneOf(["X-Sendfile", "X-Accel-Redirect"])
+    )
+    location = fields.Str()
+
+
 class SoftwareSchema(Schema):
     name = fields.Str(required=True)
     input_files = fields.Nested(FilesSchema, required=True)
@@ -44,6 +119,14 @@ class ConfigSchema(Schema):
     cluster = fields.Str(required=True)
     config_link = fields.Str()
     timeouts = fields.Nested(TimeoutsSchema)
+    polling = fields.Nested(PollingSchema)
+    caching = fields.Nested(CachingSchema)
+    submission = fields.Nested(SubmissionSchema)
+    job_list = fields.Nested(JobListSchema)
+    compression = fields.Nested(CompressionSchema)
+    tar = fields.Nested(TarSchema)
+    archive_cache = fields.Nested(ArchiveCacheSchema)
+    sendfile = fields.Nested(SendfileSchema)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class MainConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "main"
+
+    def ready(self):
+        if getattr(settings, "START_STATUS_POLLER", False):
+            from .poller import start_poller
+
+            start_poller()
@@ -0,0 +1,274 @@
+"""A disk cache of pre-built download archives for completed jobs. The working
+directory of a completed job rarely changes so its archive is built once, by a
+pool of background threads, and then sent as a plain file on each download.
+
+Each archive is named after its job and a fingerprint of the paths, sizes and
+modification times of the files in the working directory, so an archive is
+replaced if the directory changes. The fingerprint is remembered for
+FINGERPRINT_TTL seconds, unless the job status or the modification time of the
+working directory changes, so that the directory is not walked again for each of
+the requests of a resumed or parallel download. The total size of the cache is
+limited with the least recently used archives evicted first.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+
+from .portal_config import get_portal_settings
+from .utils import walk_files
+from .zip_stream import CompressionPolicy, zipfile_generator
+
+logger = logging.getLogger(__name__)
+
+# the number of job fingerprints remembered by each cache and for how many seconds
+FINGERPRINT_ENTRIES = 10000
+FINGERPRINT_TTL = 5
+
+
+class ArchiveCache:
+    """Pre-built zip archives of job working directories stored in `directory`.
+
+    An archive is only built by one thread of a process at a time. Archives are
+    written to a temporary file and moved into place once complete so a partially
+    built archive is never served.
+    """
+
+    def __init__(self, directory, max_size, compression, workers=1):
+        """
+        args:
+          directory (Path): where to store archives
+          max_size (int): the maximum total size of the archives in bytes
+          compression (dict): keyword arguments for CompressionPolicy
+          workers (int): the number of threads used to build archives
+        """
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.compression = compression
+        self.workers = workers
+        self._building = set()
+        self._fingerprints = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def fingerprint(self, job):
+        """Return a fingerprint of the contents of a job working directory. This
+        changes if any file is added, removed or modified, or if the compression
+        settings change.
+
+        args:
+          job (Job): the job of interest
+
+        returns:
+          (str): the fingerprint as a hex digest
+        """
+        digest = hashlib.sha256(repr(sorted(self.compression.items())).encode())
+        for path in walk_files(job.work_dir):
+            stat = os.stat(path)
+            relative = path.relative_to(job.work_dir)
+            digest.update(f"{relative}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode())
+        return digest.hexdigest()
+
+    def current_fingerprint(self, job):
+        """Return the fingerprint of a job working directory. The directory is only
+        walked if the fingerprint was computed more than FINGERPRINT_TTL seconds ago
+        or the job status or the modification time of the directory changed since.
+
+        args:
+          job (Job): the job of interest
+
+        returns:
+          (str): the fingerprint as a hex digest
+        """
+        # taken before walking so a change during the walk is seen next time
+        key = (job.status, os.stat(job.work_dir).st_mtime_ns)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._fingerprints.get(job.pk)
+            if (
+                cached is not None
+                and cached[0] == key
+                and now - cached[1] < FINGERPRINT_TTL
+            ):
+                self._fingerprints.move_to_end(job.pk)
+                return cached[2]
+        fingerprint = self.fingerprint(job)
+        with self._lock:
+            self._fingerprints[job.pk] = (key, now, fingerprint)
+            self._fingerprints.move_to_end(job.pk)
+            while len(self._fingerprints) > FINGERPRINT_ENTRIES:
+                self._fingerprints.popitem(last=False)
+        return fingerprint
+
+    def path(self, job, fingerprint):
+        """The location of the archive of `job` for the given fingerprint
+
+        args:
+          job (Job): the job of interest
+          fingerprint (str): as returned by `fingerprint`
+
+        returns:
+          (Path): the archive path
+        """
+        return self.directory / f"{job.job_number}-{fingerprint[:16]}.zip"
+
+    def get(self, job):
+        """Return the archive of a job if it is up to date. The archive is marked
+        as recently used.
+
+        args:
+          job (Job): the job of interest
+
+        returns:
+          (tuple): the archive path and fingerprint, or None if there is no up to
+            date archive
+        """
+        try:
+            fingerprint = self.current_fingerprint(job)
+        except FileNotFoundError:
+            return None
+        path = self.path(job, fingerprint)
+        try:
+            # the modification time of an archive records when it was last used
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path, fingerprint
+
+    def enqueue(self, job):
+        """Build the archive of a job in the background unless it is already being
+        built by this process.
+
+        args:
+          job (Job): the job to archive
+
+        returns:
+          (Future or None): completes once the archive is built
+        """
+        with self._lock:
+            if job.pk in self._building:
+                return None
+            self._building.add(job.pk)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="archive"
+                )
+        return self._executor.submit(self._worker, job)
+
+    def _worker(self, job):
+        try:
+            self.build(job)
+        except Exception:
+            logger.exception(f"Exception building archive: Job pk {job.pk}")
+        finally:
+            with self._lock:
+                self._building.discard(job.pk)
+
+    def build(self, job):
+        """Build the archive of a job unless an up to date archive exists. Older
+        archives of the job are removed and the cache trimmed to `max_size`. The new
+        archive is discarded if the working directory changed whilst it was built.
+
+        args:
+          job (Job): the job to archive
+
+        returns:
+          (Path or None): the archive path or None if it was not kept
+        """
+        fingerprint = self.fingerprint(job)
+        path = self.path(job, fingerprint)
+        if path.exists():
+            return path
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            dir=self.directory, suffix=".tmp", delete=False
+        ) as f:
+            try:
+                for chunk in zipfile_generator(
+                    job.work_dir.name,
+                    walk_files(job.work_dir),
+                    CompressionPolicy(**self.compression),
+                    root=job.work_dir,
+                ):
+                    f.write(chunk)
+            except BaseException:
+                os.unlink(f.name)
+                raise
+        if self.fingerprint(job) != fingerprint:
+            os.unlink(f.name)
+            return None
+        os.replace(f.name, path)
+        self.remove(job, keep=path)
+        self.evict()
+        return path if path.exists() else None
+
+    def remove(self, job, keep=None):
+        """Delete the archives of a job.
+
+        args:
+          job (Job): the job of interest
+          keep (Path): an archive not to delete
+        """
+        if keep is None:
+            with self._lock:
+                self._fingerprints.pop(job.pk, None)
+        for path in self.directory.glob(f"{job.job_number}-*.zip"):
+            if path != keep:
+                path.unlink(missing_ok=True)
+
+    def evict(self):
+        """Delete the least recently used archives until the total size of the
+        cache is no more than `max_size`.
+        """
+        archives = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".zip"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                archives.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in archives)
+        for _, size, path in sorted(archives):
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_archive_cache():
+    """Return the ArchiveCache for the current process, creating it if required.
+
+    returns:
+      (ArchiveCache or None): the cache configured by the portal config or None if
+        the cache is not enabled
+    """
+    global _cache
+    portal_settings = get_portal_settings()
+    config = portal_settings.ARCHIVE_CACHE
+    if not config["enabled"]:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ArchiveCache(
+                config["directory"] or settings.JOBS_DIR / "archives",
+                config["max_size"],
+                portal_settings.COMPRESSION,
+                config["workers"],
+            )
+        return _cache
@@ -1,6 +1,19 @@
 import django_filters
 
 from .models import Job
+from .resources import get_resource_choices
+from .software import get_software_choices
+
+
+def _choices(field, configured):
+    # the configured values plus those of past jobs that may no longer be
+    # configured, without querying all jobs on every request
+    def choices():
+        values = Job.objects.distinct_values(field)
+        values.update(value for _, value in configured())
+        return [(value, value) for value in sorted(values) if value]
+
+    return choices
 
 
 class JobFilter(django_filters.FilterSet):
@@ -17,5 +30,9 @@ class JobFilter(django_filters.FilterSet):
         exclude=True,
         label="Description does not contain",
     )
-    resources = django_filters.AllValuesFilter()
-    software = django_filters.AllValuesFilter()
+    resources = django_filters.ChoiceFilter(
+        choices=_choices("resources", get_resource_choices)
+    )
+    software = django_filters.ChoiceFilter(
+        choices=_choices("software", get_software_choices)
+    )
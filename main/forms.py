@@ -1,6 +1,12 @@
+import os
+import zipfile
+from itertools import chain
+
 from django import forms
+from django.core.exceptions import SuspiciousFileOperation, ValidationError
+from django.core.files.utils import validate_file_name
 
-from .models import CustomConfig, CustomResource, Job, Profile, Project
+from .models import CustomConfig, CustomResource, Job, Profile, Project, StagedUpload
 from .resources import get_resource_choices
 from .software import get_software_choices
 
@@ -8,6 +14,10 @@ from .software import get_software_choices
 class SubmissionForm(forms.Form):
     """Used in the final step before job submission in the create_job view. Form fields
     are generated based on the software configuration provided.
+
+    Each input file may be uploaded with the form or ahead of time as a StagedUpload.
+    Staged uploads are referred to by id using a hidden field named after the input
+    with the suffix "_upload".
     """
 
     required_css_class = "required"
@@ -25,12 +35,164 @@ class SubmissionForm(forms.Form):
             max_length=200, label="Description", required=False
         )
         input_files = software["input_files"]
-        for spec in input_files["required"]:
-            self.fields[spec["key"]] = forms.FileField(label=spec["description"])
-        for spec in input_files["optional"]:
-            self.fields[spec["key"]] = forms.FileField(
-                label=spec["description"], required=False
+        self.input_keys = []
+        for spec in chain(input_files["required"], input_files["optional"]):
+            key = spec["key"]
+            self.input_keys.append(key)
+            self.fields[key] = forms.FileField(
+                label=spec["description"], required=spec in input_files["required"]
             )
+            self.fields[f"{key}_upload"] = forms.UUIDField(
+                required=False, widget=forms.HiddenInput
+            )
+            if self.data.get(f"{key}_upload"):
+                self.fields[key].required = False
+        self.staged_uploads = {}
+
+    def clean(self):
+        cleaned_data = super().clean()
+        for key in self.input_keys:
+            upload_id = cleaned_data.get(f"{key}_upload")
+            if not upload_id:
+                continue
+            upload = StagedUpload.objects.filter(pk=upload_id).first()
+            if upload is None or not upload.complete:
+                self.add_error(key, "Upload incomplete or not found.")
+            else:
+                self.staged_uploads[key] = upload
+        return cleaned_data
+
+    def has_input(self, key):
+        """Whether a file was provided for the input `key`.
+
+        args:
+          key (str): the input to check
+
+        returns:
+          (bool): True if the file was uploaded with the form or staged
+        """
+        return bool(self.cleaned_data.get(key)) or key in self.staged_uploads
+
+    def input_files(self):
+        """Return the files provided for each input. Staged uploads take precedence
+        over files uploaded with the form.
+
+        returns:
+          (dict): mapping of input key to file object with a `name` attribute
+        """
+        files = {
+            key: self.cleaned_data[key]
+            for key in self.input_keys
+            if self.cleaned_data.get(key)
+        }
+        files.update(
+            (key, upload.as_file()) for key, upload in self.staged_uploads.items()
+        )
+        return files
+
+
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+
+class BulkSubmissionForm(SubmissionForm):
+    """Used to submit many jobs at once that differ only in the file provided for one
+    input, e.g. for a parameter sweep. The files for the varied input may be uploaded
+    individually or as a zip archive. Any other input files are shared between all
+    of the jobs.
+    """
+
+    def __init__(self, software, *args, **kwargs):
+        """
+        args:
+          software (dict): The software package on which to base the form. Must follow
+            config_validation.SoftwareSchema.
+          *args: passed through to base class init method
+          **kwargs: passed through to base class init method
+        """
+        super().__init__(software, *args, **kwargs)
+        input_files = software["input_files"]
+        self.required_keys = [spec["key"] for spec in input_files["required"]]
+        self.fields["sweep_key"] = forms.ChoiceField(
+            label="Input varied between jobs",
+            choices=[
+                (spec["key"], spec["description"])
+                for spec in chain(input_files["required"], input_files["optional"])
+            ],
+        )
+        self.fields["sweep_files"] = forms.FileField(
+            label="Files for the varied input (one job per file)",
+            required=False,
+            widget=MultipleFileInput(attrs={"multiple": True}),
+        )
+        self.fields["sweep_archive"] = forms.FileField(
+            label="Zip archive of files for the varied input (one job per file)",
+            required=False,
+        )
+        self.fields["use_array"] = forms.BooleanField(
+            label="Submit as a single job array",
+            required=False,
+        )
+        # whether a required file is needed depends on which input is varied
+        for key in self.required_keys:
+            self.fields[key].required = False
+
+    def clean_sweep_archive(self):
+        archive = self.cleaned_data["sweep_archive"]
+        if archive and not zipfile.is_zipfile(archive):
+            raise ValidationError("Not a valid zip archive.")
+        if archive:
+            archive.seek(0)
+            if not _archive_members(zipfile.ZipFile(archive)):
+                raise ValidationError("The zip archive does not contain any files.")
+        return archive
+
+    def clean(self):
+        cleaned_data = super().clean()
+        sweep_key = cleaned_data.get("sweep_key")
+        for key in self.required_keys:
+            if key != sweep_key and not self.has_input(key):
+                self.add_error(key, "This field is required.")
+        if not (self.files.getlist("sweep_files") or cleaned_data.get("sweep_archive")):
+            raise ValidationError("Files for the varied input must be provided.")
+        return cleaned_data
+
+    def sweep_inputs(self):
+        """Return the files provided for the varied input, one for each job. Files in
+        a zip archive are read directly from the archive. Hidden files and metadata
+        added by macOS are ignored.
+
+        returns:
+          (list): file objects with a `name` attribute
+        """
+        files = self.files.getlist("sweep_files")
+        archive = self.cleaned_data.get("sweep_archive")
+        if archive:
+            archive.seek(0)
+            zf = zipfile.ZipFile(archive)
+            files += [zf.open(info) for info in _archive_members(zf)]
+        return files
+
+
+def _archive_members(zf):
+    """Return the members of a zip archive that are regular files, skipping
+    directories, hidden files and the "__MACOSX" resource forks added by macOS.
+
+    args:
+      zf (ZipFile): the archive
+
+    returns:
+      (list): ZipInfo of the files
+    """
+    return [
+        info
+        for info in zf.infolist()
+        if not info.is_dir()
+        and not any(
+            part.startswith(".") or part == "__MACOSX"
+            for part in info.filename.split("/")
+        )
+    ]
 
 
 class JobTypeForm(forms.Form):
@@ -93,3 +255,21 @@ class ProfileForm(forms.ModelForm):
     class Meta:
         model = Profile
         fields = "__all__"
+
+
+class StagedUploadForm(forms.ModelForm):
+    """Used to start a resumable upload of an input file."""
+
+    class Meta:
+        model = StagedUpload
+        fields = ["filename", "size"]
+
+    def clean_filename(self):
+        # only the base name is used when the file is saved to a job directory.
+        # Names containing null characters are rejected by the form field.
+        filename = os.path.basename(self.cleaned_data["filename"])
+        try:
+            validate_file_name(filename)
+        except SuspiciousFileOperation:
+            raise ValidationError("A valid file name is required.")
+        return filename
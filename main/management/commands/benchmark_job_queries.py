@@ -0,0 +1,87 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...models import Job, Project
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the database queries made by the job list with a large number of "
+        "jobs. Jobs are created within a transaction that is rolled back, leaving "
+        "the database unchanged."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--jobs", type=int, default=100000)
+        parser.add_argument("--repeats", type=int, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.create_jobs(options["jobs"])
+                self.run_queries(options["repeats"])
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def create_jobs(self, count):
+        rng = random.Random(0)
+        projects = Project.objects.bulk_create(
+            Project(name=f"project {i}") for i in range(20)
+        )
+        statuses = [Job.COMPLETED] * 995 + [Job.RUNNING] * 3 + [Job.QUEUEING] * 2
+        Job.objects.bulk_create(
+            (
+                Job(
+                    status=rng.choice(statuses),
+                    project=rng.choice(projects),
+                    software=f"software {rng.randrange(10)}",
+                    resources=f"resources {rng.randrange(5)}",
+                )
+                for _ in range(count)
+            ),
+            batch_size=5000,
+        )
+        self.stdout.write(f"Created {count} jobs")
+
+    def run_queries(self, repeats):
+        project = Project.objects.first()
+        jobs = Job.objects.order_by("-pk")
+        last_page = jobs.count() - 15
+        last_pk = jobs[last_page].pk
+        queries = {
+            "first page": lambda: list(jobs[:15]),
+            "last page": lambda: list(jobs[last_page:][:15]),
+            "last page (keyset)": lambda: list(jobs.filter(pk__lt=last_pk)[:16]),
+            "count": lambda: jobs.count(),
+            "running jobs": lambda: list(jobs.filter(status=Job.RUNNING)[:15]),
+            "running count": lambda: jobs.filter(status=Job.RUNNING).count(),
+            "project jobs": lambda: list(jobs.filter(project=project)[:15]),
+            "project count": lambda: jobs.filter(project=project).count(),
+            "software jobs": lambda: list(jobs.filter(software="software 1")[:15]),
+            "software count": lambda: jobs.filter(software="software 1").count(),
+            "incomplete jobs": lambda: list(Job.objects.exclude(status=Job.COMPLETED)),
+            "distinct software": lambda: list(
+                Job.objects.order_by("software")
+                .values_list("software", flat=True)
+                .distinct()
+            ),
+            "distinct resources": lambda: list(
+                Job.objects.order_by("resources")
+                .values_list("resources", flat=True)
+                .distinct()
+            ),
+        }
+        for name, query in queries.items():
+            start = time.perf_counter()
+            for _ in range(repeats):
+                query()
+            elapsed = (time.perf_counter() - start) / repeats
+            self.stdout.write(f"{name:20} {elapsed * 1000:8.2f} ms")
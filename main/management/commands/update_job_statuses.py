@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import Job
+from ...portal_config import get_portal_settings
+from ...scheduler import SchedulerError
+from ...submission import fail_stale
+
+
+class Command(BaseCommand):
+    help = (
+        "Update the status of all incomplete jobs from the scheduler and fail stale "
+        "job submissions."
+    )
+
+    def handle(self, *args, **options):
+        portal_settings = get_portal_settings()
+        failed = fail_stale(portal_settings.SUBMISSION["stale_after"])
+        try:
+            changed = Job.objects.update_statuses(
+                timeout=portal_settings.TIMEOUTS["status"]
+            )
+        except SchedulerError as e:
+            raise CommandError(f"Unable to update job statuses: {e}")
+        self.stdout.write(f"Updated {changed} job(s)")
+        if failed:
+            self.stdout.write(f"Failed {failed} stale submission(s)")
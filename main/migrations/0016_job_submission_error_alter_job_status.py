@@ -0,0 +1,32 @@
+# Generated by Django 4.1.2 on 2026-10-18 18:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0015_alter_token_refresh_token_alter_token_value"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="job",
+            name="submission_error",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name="job",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("C", "Completed"),
+                    ("Q", "Queueing"),
+                    ("R", "Running"),
+                    ("P", "Submitting"),
+                    ("F", "Failed"),
+                ],
+                max_length=1,
+            ),
+        ),
+    ]
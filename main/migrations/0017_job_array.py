@@ -0,0 +1,45 @@
+# Generated by Django 4.1.2 on 2026-10-18 18:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0016_job_submission_error_alter_job_status"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="JobArray",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("job_id", models.CharField(blank=True, max_length=20)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="array_index",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="array",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="jobs",
+                to="main.jobarray",
+            ),
+        ),
+    ]
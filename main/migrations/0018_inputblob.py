@@ -0,0 +1,30 @@
+# Generated by Django 4.1.2 on 2026-10-18 18:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0017_job_array"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InputBlob",
+            fields=[
+                (
+                    "digest",
+                    models.CharField(max_length=64, primary_key=True, serialize=False),
+                ),
+                ("size", models.PositiveBigIntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="input_blobs",
+            field=models.ManyToManyField(
+                blank=True, related_name="jobs", to="main.inputblob"
+            ),
+        ),
+    ]
@@ -1,14 +1,23 @@
+import fcntl
+import hashlib
+import os
 import shutil
+import stat
+import threading
 import time
+import uuid
+from collections import Counter
 from datetime import timedelta
 from itertools import chain
 from pathlib import Path
 
 from django.conf import settings
-from django.db import models
+from django.core.files import File
+from django.db import connections, models, transaction
 from django.urls import reverse
 
-from .. import scheduler
+from .. import scheduler, submission
+from ..archive_cache import get_archive_cache
 from ..portal_config import get_portal_settings
 from ..resources import get_resource
 from ..software import get_software
@@ -16,11 +25,57 @@ from ..validators import validate_orcid_id
 from .custom import CustomConfig, CustomResource  # noqa: F401
 
 ROUNDING_INTERVAL = timedelta(seconds=15)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+STAGED_UPLOAD_EXPIRY = timedelta(days=1)
+
+# Inserted as the commands of a job array submission script. Each array task
+# changes to the working directory of its job (as listed in ARRAY_DIRS), records
+# its walltime there and runs the job's commands. The array index is taken from
+# whichever environment variable is set by the scheduler.
+ARRAY_DISPATCH_COMMANDS = """\
+ARRAY_INDEX=${SLURM_ARRAY_TASK_ID:-${PBS_ARRAY_INDEX:-${PBS_ARRAYID:-${SGE_TASK_ID:-$LSB_JOBINDEX}}}}
+cd "$(sed -n "${ARRAY_INDEX}p" "ARRAY_DIRS_PATH")" || exit 1
+(while true; do echo $SECONDS > WALLTIME; sleep 5s; done) &
+. ./sub.sh
+"""  # noqa: E501
 
 
 class JobManager(models.Manager):
     """A custom model Manager for the Job class"""
 
+    # distinct values of job fields for this process, see `distinct_values`
+    _distinct_values = {}
+    _distinct_values_lock = threading.Lock()
+
+    def distinct_values(self, field):
+        """Return the distinct values of a field across all jobs. Values are read
+        from the database once per process and then updated as jobs are created, so
+        values from jobs created by other processes may be missing. The cached
+        values are cleared when a job is deleted.
+
+        Args:
+          field (str): the name of the field, e.g. "software"
+        Returns:
+          set: the distinct values
+        """
+        with self._distinct_values_lock:
+            if field not in self._distinct_values:
+                self._distinct_values[field] = set(
+                    self.order_by().values_list(field, flat=True).distinct()
+                )
+            return set(self._distinct_values[field])
+
+    def clear_distinct_values(self):
+        """Discard the values cached by `distinct_values`"""
+        with self._distinct_values_lock:
+            self._distinct_values.clear()
+
+    def _record_values(self, **values):
+        with self._distinct_values_lock:
+            for field, value in values.items():
+                if field in self._distinct_values:
+                    self._distinct_values[field].add(value)
+
     def create_job(
         self,
         description,
@@ -29,9 +84,12 @@ class JobManager(models.Manager):
         resource_index,
         software_index,
         custom_config=None,
+        asynchronous=None,
     ):
         """Create a new Job object, create the working directory, save the provided
-        input files, produce the submission script and submit it.
+        input files, produce the submission script and submit it. When submitting
+        asynchronously the job is returned with status SUBMITTING and submission is
+        carried out by `submission.enqueue`.
 
         Args:
           description (str): Saved as the description field of the new job object
@@ -42,59 +100,451 @@ class JobManager(models.Manager):
           software_index (int): index of the software configuration for this job
           custom_config (CustomConfig): custom scheduler directives to be added to the
             job template
+          asynchronous (bool): whether to submit the job in the background. Defaults
+            to the `asynchronous` value of the portal config `submission` section.
         Returns:
           Job: The newly created Job object
 
         """
+        portal_settings = get_portal_settings()
+        if asynchronous is None:
+            asynchronous = portal_settings.SUBMISSION["asynchronous"]
         resources = get_resource(resource_index)
         software = get_software()[software_index]
+        self._record_values(
+            resources=resources["description"], software=software["name"]
+        )
         job = self.create(
-            status=Job.QUEUEING,
+            status=Job.SUBMITTING if asynchronous else Job.QUEUEING,
             description=description,
             project=project,
             resources=resources["description"],
             software=software["name"],
         )
 
-        job.work_dir.mkdir(parents=True)
-        for inp in input_files.values():
-            with (job.work_dir / Path(inp.name).name).open("wb") as f:
-                f.write(inp.read())
+        blobs = {}
+        try:
+            script_path = self._write_job_files(
+                job, input_files, resources, software, custom_config, blobs
+            )
+        except Exception:
+            shutil.rmtree(job.work_dir, ignore_errors=True)
+            self.filter(pk=job.pk).delete()
+            InputBlob.objects.prune(blob.digest for blob in blobs.values())
+            raise
+
+        if asynchronous:
+            transaction.on_commit(
+                lambda: submission.enqueue(job.pk, script_path, job.work_dir)
+            )
+            return job
+
+        timeout = portal_settings.TIMEOUTS["submit"]
+        try:
+            job_id = scheduler.submit(script_path, job.work_dir, timeout=timeout)
+            job.job_id = job_id
+            job.save()
+            return job
+        except scheduler.SchedulerError:
+            job.delete()
+            raise
+
+    def create_jobs(
+        self,
+        description,
+        inputs,
+        project,
+        resource_index,
+        software_index,
+        custom_config=None,
+        asynchronous=None,
+    ):
+        """Create and submit a batch of jobs that share a configuration, e.g. for a
+        parameter sweep. All Job objects are created with a single query and the
+        jobs are submitted as a single batch by `submission.submit_jobs`, in the
+        background if asynchronous. Jobs whose submission fails are kept with status
+        FAILED.
+
+        Args:
+          description (str): Saved as the description field of each new job object
+          inputs (list[dict[str, BinaryIO]]): For each job to create, a mapping
+            between job template insertion points (keys) and input files (values).
+            Files may be shared between jobs.
+          project (Project): Saved as the project field of each new job object
+          resource_index (int): index of the resource configuration for the jobs
+          software_index (int): index of the software configuration for the jobs
+          custom_config (CustomConfig): custom scheduler directives to be added to the
+            job template
+          asynchronous (bool): whether to return before submission is complete.
+            Defaults to the `asynchronous` value of the portal config `submission`
+            section.
+        Returns:
+          list[Job]: The newly created Job objects
+        """
+        if asynchronous is None:
+            asynchronous = get_portal_settings().SUBMISSION["asynchronous"]
+        resources = get_resource(resource_index)
+        software = get_software()[software_index]
+        self._record_values(
+            resources=resources["description"], software=software["name"]
+        )
+        jobs = [
+            Job(
+                status=Job.SUBMITTING,
+                description=description,
+                project=project,
+                resources=resources["description"],
+                software=software["name"],
+            )
+            for _ in inputs
+        ]
+        # files are written once the jobs are committed so that the database is not
+        # locked whilst inputs are copied
+        with transaction.atomic():
+            if connections[self.db].features.can_return_rows_from_bulk_insert:
+                jobs = self.bulk_create(jobs)
+            else:
+                for job in jobs:
+                    job.save()
+        blobs = {}
+        shared = self._shared_inputs(inputs)
+        try:
+            script_paths = [
+                self._write_job_files(
+                    job,
+                    input_files,
+                    resources,
+                    software,
+                    custom_config,
+                    blobs,
+                    shared,
+                )
+                for job, input_files in zip(jobs, inputs)
+            ]
+        except Exception:
+            for job in jobs:
+                shutil.rmtree(job.work_dir, ignore_errors=True)
+            self.filter(pk__in=[job.pk for job in jobs]).delete()
+            InputBlob.objects.prune(blob.digest for blob in blobs.values())
+            raise
+
+        submissions = [
+            (job.pk, script_path, job.work_dir)
+            for job, script_path in zip(jobs, script_paths)
+        ]
+        if asynchronous:
+            transaction.on_commit(lambda: submission.enqueue_many(submissions))
+            return jobs
+        # submitted from this thread, rather than by the worker pool once committed,
+        # so that jobs created within an enclosing transaction are visible
+        submission.submit_jobs(submissions)
+        return list(self.filter(pk__in=[job.pk for job in jobs]).order_by("pk"))
 
+    def create_job_array(
+        self,
+        description,
+        inputs,
+        project,
+        resource_index,
+        software_index,
+        custom_config=None,
+    ):
+        """Create a batch of jobs that share a configuration, e.g. for a parameter
+        sweep, and submit them as a single scheduler job array. Each job keeps its own
+        working directory. The array submission script is rendered from the portal
+        config `script_template` and dispatches each array task to the working
+        directory of the corresponding job.
+
+        Args:
+          description (str): Saved as the description field of each new job object
+          inputs (list[dict[str, BinaryIO]]): For each job to create, a mapping
+            between job template insertion points (keys) and input files (values).
+            Files may be shared between jobs.
+          project (Project): Saved as the project field of each new job object
+          resource_index (int): index of the resource configuration for the jobs
+          software_index (int): index of the software configuration for the jobs
+          custom_config (CustomConfig): custom scheduler directives to be added to the
+            job template
+        Returns:
+          list[Job]: The newly created Job objects
+        """
+        resources = get_resource(resource_index)
+        software = get_software()[software_index]
+        self._record_values(
+            resources=resources["description"], software=software["name"]
+        )
+        array = JobArray.objects.create()
+        jobs = [
+            Job(
+                status=Job.QUEUEING,
+                description=description,
+                project=project,
+                resources=resources["description"],
+                software=software["name"],
+                array=array,
+                array_index=index,
+            )
+            for index, _ in enumerate(inputs, 1)
+        ]
+        if connections[self.db].features.can_return_rows_from_bulk_insert:
+            jobs = self.bulk_create(jobs)
+        else:
+            for job in jobs:
+                job.save()
+
+        blobs = {}
+        shared = self._shared_inputs(inputs)
+        timeout = get_portal_settings().TIMEOUTS["submit"]
+        try:
+            for job, input_files in zip(jobs, inputs):
+                job.work_dir.mkdir(parents=True)
+                self._write_inputs(job, input_files, software, blobs, shared)
+                with (job.work_dir / "sub.sh").open("w") as f:
+                    f.write(
+                        "#!/bin/bash\n" + self._render_commands(input_files, software)
+                    )
+
+            array.work_dir.mkdir(parents=True)
+            with (array.work_dir / "ARRAY_DIRS").open("w") as f:
+                f.writelines(f"{job.work_dir}\n" for job in jobs)
+            script_path = array.work_dir / "sub.sh"
+            with script_path.open("w") as f:
+                f.write(
+                    self._render_script(
+                        ARRAY_DISPATCH_COMMANDS.replace(
+                            "ARRAY_DIRS_PATH", str(array.work_dir / "ARRAY_DIRS")
+                        ),
+                        resources,
+                        custom_config,
+                        f"portal_array_{array.pk:08d}",
+                    )
+                )
+
+            array.job_id = scheduler.submit(
+                script_path,
+                array.work_dir,
+                timeout=timeout,
+                array_request=f"1-{len(jobs)}",
+            )
+        except Exception:
+            for job in jobs:
+                shutil.rmtree(job.work_dir, ignore_errors=True)
+            self.filter(array=array).delete()
+            array.delete()
+            InputBlob.objects.prune(blob.digest for blob in blobs.values())
+            raise
+        array.save()
+        return jobs
+
+    def _write_job_files(
+        self,
+        job,
+        input_files,
+        resources,
+        software,
+        custom_config,
+        blobs=None,
+        shared=(),
+    ):
+        """Create the working directory for `job` containing the input files and
+        submission script.
+
+        Args:
+          job (Job): the job for which to write files
+          input_files (dict[str, BinaryIO]): A mapping between job template insertion
+            points (keys) and input files (values)
+          resources (dict): the resource configuration for the job
+          software (dict): the software configuration for the job
+          custom_config (CustomConfig): custom scheduler directives to be added to the
+            job template
+          blobs (dict): InputBlobs of files already stored, see `_write_inputs`
+          shared (set): ids of files used by other jobs, see `_write_inputs`
+        Returns:
+          Path: The location of the submission script
+        """
+        job.work_dir.mkdir(parents=True)
+        self._write_inputs(job, input_files, software, blobs, shared)
         script_path = job.work_dir / "sub.sh"
+        with script_path.open("w") as f:
+            f.write(
+                self._render_script(
+                    self._render_commands(input_files, software),
+                    resources,
+                    custom_config,
+                    f"portal_job_{job.job_number}",
+                )
+            )
+        return script_path
+
+    def _write_inputs(self, job, input_files, software, blobs=None, shared=()):
+        """Save input files to the working directory of `job`. Each job is given its
+        own copy of a file so that jobs may modify their input files. Uploads that
+        have been written to a temporary file and are not used by other jobs are
+        hard linked into place instead, as the temporary file is removed once the
+        job is created. Files for inputs marked `deduplicate` in the software
+        configuration are instead added to the InputBlob store and hard linked into
+        the working directory so that identical files used by several jobs are only
+        stored once. Linked files are read-only. Files that cannot be linked are
+        copied instead.
 
+        Args:
+          job (Job): the job for which to save files
+          input_files (dict[str, BinaryIO]): A mapping between job template insertion
+            points (keys) and input files (values). Files may be shared between jobs.
+          software (dict): the software configuration for the job
+          blobs (dict): used to avoid hashing files shared between jobs more than
+            once. Maps the id of each file already stored to its InputBlob.
+          shared (set): ids of files that are also used by other jobs
+        """
+        files_spec = software["input_files"]
+        deduplicate = {
+            spec["key"]
+            for spec in chain(files_spec["required"], files_spec["optional"])
+            if spec.get("deduplicate")
+        }
+        blobs = {} if blobs is None else blobs
+        used = []
+        for key, inp in input_files.items():
+            dest = job.work_dir / Path(inp.name).name
+            if key not in deduplicate:
+                self._save_input(inp, dest, link=id(inp) not in shared)
+                continue
+            linked = False
+            while not linked:
+                # files are hashed and stored without holding the lock
+                if id(inp) not in blobs:
+                    blobs[id(inp)] = InputBlob.objects.store(inp)
+                blob = blobs[id(inp)]
+                with InputBlob.objects.lock:
+                    if not blob.path.exists():
+                        # pruned by another process since it was stored
+                        del blobs[id(inp)]
+                        continue
+                    dest.unlink(missing_ok=True)
+                    try:
+                        os.link(blob.path, dest)
+                    except OSError:
+                        break
+                    linked = True
+                used.append(blob)
+            if not linked:
+                self._save_input(inp, dest)
+        job.input_blobs.add(*used)
+
+    def _shared_inputs(self, inputs):
+        # the ids of the input files used by more than one job
+        counts = Counter(
+            id(inp) for input_files in inputs for inp in input_files.values()
+        )
+        return {key for key, count in counts.items() if count > 1}
+
+    def _save_input(self, input_file, dest, link=False):
+        """Save an input file to `dest`. The file is copied in chunks of at most
+        UPLOAD_CHUNK_SIZE bytes unless it can be hard linked.
+
+        Args:
+          input_file (BinaryIO): the file to save. Read from the start.
+          dest (Path): the location to save to
+          link (bool): whether a file written to a temporary location, e.g. a
+            TemporaryUploadedFile or StagedFile, may be hard linked to `dest`
+        """
+        if hasattr(input_file, "temporary_file_path"):
+            if link:
+                try:
+                    os.link(input_file.temporary_file_path(), dest)
+                    return
+                except OSError:
+                    pass
+            shutil.copyfile(input_file.temporary_file_path(), dest)
+            return
+        with dest.open("wb") as f:
+            if hasattr(input_file, "chunks"):
+                for chunk in input_file.chunks(UPLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+            else:
+                # files may be shared between jobs so always read from the start
+                input_file.seek(0)
+                shutil.copyfileobj(input_file, f, UPLOAD_CHUNK_SIZE)
+
+    def _render_commands(self, input_files, software):
         files_spec = software["input_files"]
         formatting_kwargs = {
             spec["key"]: (
-                input_files[spec["key"]].name if spec["key"] in input_files else ""
+                Path(input_files[spec["key"]].name).name
+                if spec["key"] in input_files
+                else ""
             )
             for spec in chain(files_spec["required"], files_spec["optional"])
         }
-        commands = software["commands"].format(**formatting_kwargs)
+        return software["commands"].format(**formatting_kwargs)
 
+    def _render_script(self, commands, resources, custom_config, job_name):
         config_lines = (
             custom_config.script_lines.strip() + "\n" if custom_config else ""
         )
-        portal_settings = get_portal_settings()
-        with script_path.open("w") as f:
-            f.write(
-                portal_settings.SCRIPT_TEMPLATE.format(
-                    commands=commands,
-                    resources=resources["script_lines"],
-                    custom_config=config_lines,
-                    job_name=f"portal_job_{job.job_number}",
+        return get_portal_settings().SCRIPT_TEMPLATE.format(
+            commands=commands,
+            resources=resources["script_lines"],
+            custom_config=config_lines,
+            job_name=job_name,
+        )
+
+    def update_statuses(self, timeout=2):
+        """Refresh the status of all jobs that have not yet completed using a single
+        query to the scheduler. The walltime of newly completed jobs is recorded.
+        Changed records are written back to the database in bulk.
+
+        Jobs that are part of a job array are updated using a single query per
+        array. Tasks missing from the listing of an array are taken to have
+        completed unless no tasks are listed at all. Archives of newly completed
+        jobs are built if configured.
+
+        Args:
+          timeout (int): Number of seconds to wait for the scheduler
+        Returns:
+          int: The number of jobs updated
+        """
+        incomplete = self.exclude(status=Job.COMPLETED)
+        jobs = list(incomplete.filter(array=None).exclude(job_id=""))
+        statuses = scheduler.status_many((job.job_id for job in jobs), timeout=timeout)
+        array_jobs = list(
+            incomplete.exclude(array=None)
+            .exclude(array__job_id="")
+            .select_related("array")
+        )
+        array_statuses = scheduler.array_status(
+            {job.array.job_id for job in array_jobs}, timeout=timeout
+        )
+
+        changed = []
+        for job in jobs:
+            if job.job_id in statuses and job.set_status(statuses[job.job_id]):
+                changed.append(job)
+        for job in array_jobs:
+            if job.array.job_id not in array_statuses:
+                continue
+            array_status = array_statuses[job.array.job_id]
+            tasks = array_status["tasks"]
+            if not tasks:
+                # fall back to the status of the array if no tasks are listed
+                task = dict(id=job.job_id, status=array_status["status"])
+            else:
+                # finished tasks are no longer listed by the scheduler
+                task = tasks.get(
+                    str(job.array_index), dict(id=job.job_id, status="completed")
                 )
-            )
+            new_id = task["id"] != job.job_id
+            job.job_id = task["id"]
+            if job.set_status(task["status"]) or new_id:
+                changed.append(job)
+        self.bulk_update(changed, ["status", "_walltime", "job_id"])
 
-        timeout = portal_settings.TIMEOUTS["submit"]
-        try:
-            job_id = scheduler.submit(script_path, job.work_dir, timeout=timeout)
-            job.job_id = job_id
-            job.save()
-            return job
-        except scheduler.SchedulerError:
-            job.delete()
-            raise
+        archive_cache = get_archive_cache()
+        if archive_cache and get_portal_settings().ARCHIVE_CACHE["build_on_complete"]:
+            for job in changed:
+                if job.status == Job.COMPLETED:
+                    archive_cache.enqueue(job)
+        return len(changed)
 
 
 class Job(models.Model):
@@ -103,10 +553,14 @@ class Job(models.Model):
     COMPLETED = "C"
     QUEUEING = "Q"
     RUNNING = "R"
+    SUBMITTING = "P"
+    FAILED = "F"
     STATUS_CHOICES = [
         (COMPLETED, "Completed"),
         (QUEUEING, "Queueing"),
         (RUNNING, "Running"),
+        (SUBMITTING, "Submitting"),
+        (FAILED, "Failed"),
     ]
 
     status = models.CharField(max_length=1, choices=STATUS_CHOICES)
@@ -119,8 +573,29 @@ class Job(models.Model):
     resources = models.CharField(max_length=100)
     software = models.CharField(max_length=50)
     _walltime = models.DurationField(blank=True, null=True)
+    submission_error = models.TextField(blank=True)
+    array = models.ForeignKey(
+        "JobArray",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="jobs",
+    )
+    array_index = models.PositiveIntegerField(null=True, blank=True)
+    input_blobs = models.ManyToManyField("InputBlob", blank=True, related_name="jobs")
     objects = JobManager()
 
+    class Meta:
+        # support the filters and newest first ordering of the job list, the
+        # distinct values of its drop down menus and status updates
+        indexes = [
+            models.Index(fields=["status", "-id"], name="job_status_idx"),
+            models.Index(fields=["project", "-id"], name="job_project_idx"),
+            models.Index(fields=["software", "-id"], name="job_software_idx"),
+            models.Index(fields=["resources", "-id"], name="job_resources_idx"),
+            models.Index(fields=["submission_time"], name="job_submission_time_idx"),
+        ]
+
     @property
     def work_dir(self):
         """The working directory for the job"""
@@ -128,17 +603,58 @@ class Job(models.Model):
 
     def delete(self):
         """Delete job instance, if not yet completed delete from scheduler and remove
-        working directory from disk.
+        working directory from disk. The last job of a job array to be deleted also
+        deletes the array. Stored input files no longer used by any job and any
+        cached archive of the job are removed.
         """
         portal_settings = get_portal_settings()
 
-        if self.status != self.COMPLETED and self.job_id:
-            scheduler.delete(self.job_id, timeout=portal_settings.TIMEOUTS["delete"])
+        job_id = self.job_id
+        array = self.array
+        last_in_array = (
+            array is not None and not array.jobs.exclude(pk=self.pk).exists()
+        )
+        if not job_id and last_in_array:
+            # the id of the individual array task is not yet known
+            job_id = array.job_id
+        if self.status != self.COMPLETED and job_id:
+            scheduler.delete(job_id, timeout=portal_settings.TIMEOUTS["delete"])
             # small wait to let the scheduler delete the job to try and
             # minimise issues with deleting the working directory
             time.sleep(2)
+        digests = list(self.input_blobs.values_list("digest", flat=True))
         shutil.rmtree(self.work_dir)
+        archive_cache = get_archive_cache()
+        if archive_cache:
+            archive_cache.remove(self)
         super().delete()
+        if last_in_array:
+            array.delete()
+        InputBlob.objects.prune(digests)
+        Job.objects.clear_distinct_values()
+
+    def set_status(self, status):
+        """Set the status of the job from a status string as returned by the
+        scheduler. The walltime of newly completed jobs is read from the WALLTIME
+        file in the working directory.
+
+        Args:
+          status (str): the job status e.g. "queued", "running" or "completed"
+
+        Returns:
+          bool: whether the status changed
+        """
+        status = status.capitalize()[0]
+        if status == self.status:
+            return False
+        self.status = status
+        if self.status == self.COMPLETED:
+            try:
+                with (self.work_dir / "WALLTIME").open() as f:
+                    self.walltime = timedelta(seconds=int(f.read()))
+            except (IOError, ValueError):
+                pass
+        return True
 
     def get_absolute_url(self):
         """Return the absolute url for a Job instance"""
@@ -152,7 +668,7 @@ class Job(models.Model):
         """
         if self.status == self.COMPLETED:
             return "Unknown" if self._walltime is None else self._walltime
-        elif self.status == self.QUEUEING:
+        elif self.status in (self.QUEUEING, self.SUBMITTING, self.FAILED):
             return "N/A"
         else:
             # if job is not complete get the most up-to-date walltime from disk
@@ -164,8 +680,11 @@ class Job(models.Model):
 
     @property
     def published(self):
-        """Whether this job has associated Publication records"""
-        return bool(Publication.objects.filter(job=self).count())
+        """Whether this job has associated Publication records. Publications loaded
+        with `prefetch_related("publication_set")` are used if available."""
+        if "publication_set" in getattr(self, "_prefetched_objects_cache", {}):
+            return bool(self.publication_set.all())
+        return self.publication_set.exists()
 
     @walltime.setter
     def walltime(self, value):
@@ -188,6 +707,260 @@ class Job(models.Model):
         return f"{self.pk:08d}"
 
 
+class JobArray(models.Model):
+    """A scheduler job array used to run a batch of jobs with a single submission.
+    The working directory holds the array submission script and scheduler output.
+    """
+
+    job_id = models.CharField(max_length=20, blank=True)
+
+    @property
+    def work_dir(self):
+        """The working directory for the job array"""
+        return settings.JOBS_DIR / "arrays" / f"{self.pk:08d}"
+
+    def delete(self):
+        """Delete job array instance and remove working directory from disk."""
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        super().delete()
+
+
+class BlobStoreLock:
+    """A lock on the InputBlob store that excludes other threads and, using an
+    exclusive `flock` of a lock file in the store, other processes. The lock may be
+    acquired again by the thread that holds it.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                store_dir = settings.JOBS_DIR / "blobs"
+                store_dir.mkdir(parents=True, exist_ok=True)
+                self._file = open(store_dir / ".lock", "a")
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            except BaseException:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0:
+            # closing the file releases the flock
+            self._file.close()
+            self._file = None
+        self._lock.release()
+
+
+class InputBlobManager(models.Manager):
+    """A custom model Manager for the InputBlob class"""
+
+    # held while adding or linking blobs and while pruning them so that a blob is
+    # not removed between being found and linked into a working directory, by this
+    # or any other portal process. Files are not read or copied while it is held.
+    lock = BlobStoreLock()
+
+    def store(self, input_file):
+        """Add a file to the store if an identical file is not already present.
+        Files are read in chunks of at most UPLOAD_CHUNK_SIZE bytes. Uploads that
+        Django has already written to a temporary file are hard linked into the
+        store if on the same filesystem rather than copied. The file is hashed and
+        staged in the store before taking the lock, which is only held to add the
+        staged file.
+
+        Args:
+          input_file (BinaryIO): the file to store. Read from the start.
+        Returns:
+          InputBlob: The stored file
+        """
+        store_dir = settings.JOBS_DIR / "blobs"
+        store_dir.mkdir(parents=True, exist_ok=True)
+        staged_path = store_dir / f".{uuid.uuid4().hex}.tmp"
+        sha256 = hashlib.sha256()
+        linked = False
+        try:
+            if hasattr(input_file, "temporary_file_path"):
+                try:
+                    os.link(input_file.temporary_file_path(), staged_path)
+                    linked = True
+                except OSError:
+                    pass
+            if linked:
+                with staged_path.open("rb") as f:
+                    for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+                        sha256.update(chunk)
+            else:
+                with staged_path.open("xb") as f:
+                    for chunk in self._chunks(input_file):
+                        sha256.update(chunk)
+                        f.write(chunk)
+
+            with self.lock:
+                blob, _ = self.get_or_create(
+                    digest=sha256.hexdigest(),
+                    defaults=dict(size=os.stat(staged_path).st_size),
+                )
+                if blob.path.exists():
+                    return blob
+                blob.path.parent.mkdir(exist_ok=True)
+                os.replace(staged_path, blob.path)
+                # stored files are shared by all jobs using them so must not be
+                # modified in place, other permissions are left unchanged
+                mode = stat.S_IMODE(os.stat(blob.path).st_mode)
+                blob.path.chmod(mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+                return blob
+        finally:
+            staged_path.unlink(missing_ok=True)
+
+    @staticmethod
+    def _chunks(input_file):
+        # the contents of a file in chunks of at most UPLOAD_CHUNK_SIZE bytes
+        if hasattr(input_file, "temporary_file_path"):
+            with open(input_file.temporary_file_path(), "rb") as f:
+                yield from iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b"")
+        elif hasattr(input_file, "chunks"):
+            yield from input_file.chunks(UPLOAD_CHUNK_SIZE)
+        else:
+            # files may be shared between jobs so always read from the start
+            input_file.seek(0)
+            yield from iter(lambda: input_file.read(UPLOAD_CHUNK_SIZE), b"")
+
+    def prune(self, digests):
+        """Remove stored files that are no longer used by any job. A file is in use
+        while hard linked into a working directory.
+
+        Args:
+          digests (iterable of str): the SHA-256 digests of the files to check
+        """
+        digests = list(digests)
+        if not digests:
+            return
+        with self.lock:
+            for blob in self.filter(digest__in=digests):
+                try:
+                    if os.stat(blob.path).st_nlink > 1:
+                        continue
+                    os.unlink(blob.path)
+                    blob.path.parent.rmdir()
+                except OSError:
+                    # the directory may still hold other files
+                    pass
+                blob.delete()
+
+
+class InputBlob(models.Model):
+    """An input file held in the content addressed store under JOBS_DIR. Jobs using
+    the file hold hard links to it in their working directories.
+    """
+
+    digest = models.CharField(max_length=64, primary_key=True)
+    size = models.PositiveBigIntegerField()
+    objects = InputBlobManager()
+
+    @property
+    def path(self):
+        """The location of the stored file"""
+        return settings.JOBS_DIR / "blobs" / self.digest[:2] / self.digest
+
+
+class StagedUpload(models.Model):
+    """An input file uploaded in chunks ahead of job submission. Chunks are written
+    directly to a file in the staging area under JOBS_DIR so that an interrupted
+    upload can be resumed from `offset`.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def path(self):
+        """The location of the partially or fully uploaded file"""
+        return settings.JOBS_DIR / "staging" / str(self.id)
+
+    @property
+    def complete(self):
+        """Whether all of the file has been received"""
+        return self.offset == self.size
+
+    def write(self, offset, stream, length):
+        """Write a chunk of the file received at `offset`. Chunks are written in
+        place so resending a chunk has no effect beyond updating `offset`.
+
+        Args:
+          offset (int): the position in the file at which the chunk starts. Must
+            match the current `offset`.
+          stream (BinaryIO): the chunk content
+          length (int): the number of bytes to read from `stream`
+
+        Returns:
+          bool: whether the chunk was accepted. Chunks are rejected if `offset` does
+            not match or they extend past the end of the file.
+        """
+        if offset != self.offset or offset + length > self.size:
+            return False
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with os.fdopen(os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o600), "wb") as f:
+            f.seek(offset)
+            remaining = length
+            while remaining:
+                chunk = stream.read(min(remaining, UPLOAD_CHUNK_SIZE))
+                if not chunk:
+                    break
+                f.write(chunk)
+                remaining -= len(chunk)
+        # only advance from the offset this chunk was written at in case another
+        # request has done so in the meantime
+        updated = StagedUpload.objects.filter(pk=self.pk, offset=offset).update(
+            offset=offset + length - remaining
+        )
+        self.refresh_from_db()
+        return bool(updated) and not remaining
+
+    def as_file(self):
+        """Return the uploaded file for use as a job input file.
+
+        Returns:
+          StagedFile: the uploaded file
+        """
+        return StagedFile(self)
+
+    def delete(self):
+        """Delete upload instance and remove the file from the staging area."""
+        self.path.unlink(missing_ok=True)
+        super().delete()
+
+
+class StagedFile(File):
+    """A completed StagedUpload. Like Django's TemporaryUploadedFile this provides
+    `temporary_file_path` so that it is read directly from the staging area.
+    """
+
+    def __init__(self, upload):
+        """
+        Args:
+          upload (StagedUpload): the completed upload
+        """
+        super().__init__(None, upload.filename)
+        self.upload = upload
+
+    def temporary_file_path(self):
+        """The location of the file in the staging area"""
+        return str(self.upload.path)
+
+
 class Publication(models.Model):
     """A representation of depositions in data repository service"""
 
@@ -215,18 +988,47 @@ class Profile(models.Model):
     affiliation = models.CharField(max_length=50)
 
 
+class ProjectManager(models.Manager):
+    """A custom model Manager for the Project class"""
+
+    def with_job_stats(self):
+        """Return all projects annotated with statistics about their jobs, calculated
+        with a single grouped query. Annotations are `job_count`, the number of jobs
+        with each status e.g. `completed_jobs` or `running_jobs`, and
+        `total_walltime`.
+
+        Returns:
+          QuerySet: the annotated projects
+        """
+        status_counts = {
+            f"{label.lower()}_jobs": models.Count(
+                "job", filter=models.Q(job__status=status)
+            )
+            for status, label in Job.STATUS_CHOICES
+        }
+        return self.annotate(
+            job_count=models.Count("job"),
+            total_walltime=models.Sum("job___walltime"),
+            **status_counts,
+        )
+
+
 class Project(models.Model):
     """A project grouping together multiple jobs."""
 
     name = models.CharField(max_length=50)
+    objects = ProjectManager()
 
     def __str__(self):
         return f"{self.name}"
 
     @property
     def number_of_jobs(self):
-        """The number of jobs that are in this project"""
-        return len(Job.objects.filter(project=self))
+        """The number of jobs that are in this project. Uses the `job_count`
+        annotation of `ProjectManager.with_job_stats` if available."""
+        if hasattr(self, "job_count"):
+            return self.job_count
+        return self.job_set.count()
 
 
 class Token(models.Model):
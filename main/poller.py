@@ -0,0 +1,71 @@
+"""Background refreshing of job status information. A single daemon thread per
+portal process periodically queries the scheduler for all jobs that have not yet
+completed and records any changes in the database. Views then only need to read
+job status from the database and are not held up by the scheduler.
+"""
+
+import logging
+import threading
+
+from django.db import close_old_connections
+
+from .portal_config import get_portal_settings
+from .submission import fail_stale
+
+logger = logging.getLogger(__name__)
+
+
+def poll():
+    """Update the status of all incomplete jobs and fail stale job submissions.
+    Errors are logged rather than raised so that a transient problem, or an
+    unexpected one, does not stop future polling.
+    """
+    from .models import Job
+
+    try:
+        portal_settings = get_portal_settings()
+        fail_stale(portal_settings.SUBMISSION["stale_after"])
+        Job.objects.update_statuses(timeout=portal_settings.TIMEOUTS["status"])
+    except Exception:
+        logger.exception("Exception during job status update")
+    finally:
+        close_old_connections()
+
+
+class StatusPoller(threading.Thread):
+    """A daemon thread that calls `poll` every `interval` seconds until stopped."""
+
+    def __init__(self, interval):
+        """
+        args:
+          interval (int): number of seconds between status updates
+        """
+        super().__init__(name="status-poller", daemon=True)
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            poll()
+
+    def stop(self):
+        """Stop polling. The thread exits once any in progress update completes."""
+        self._stopped.set()
+
+
+_poller = None
+
+
+def start_poller():
+    """Start the StatusPoller for this process unless it is already running or
+    polling has been disabled by setting an interval of 0 in the portal config.
+
+    returns:
+      (StatusPoller or None): the running poller
+    """
+    global _poller
+    interval = get_portal_settings().POLLING["interval"]
+    if interval > 0 and (_poller is None or not _poller.is_alive()):
+        _poller = StatusPoller(interval)
+        _poller.start()
+    return _poller
@@ -11,7 +11,49 @@ class SettingsGetter:
     """"""
 
     _settings = None
-    defaults = dict(timeouts=dict(submit=10, status=2, delete=2))
+    defaults = dict(
+        timeouts=dict(submit=10, status=2, delete=2),
+        polling=dict(interval=30),
+        caching=dict(status_ttl=10, status_max_entries=10000, file_index_max_entries=0),
+        submission=dict(
+            asynchronous=False, workers=2, retries=3, retry_delay=5, stale_after=900
+        ),
+        job_list=dict(keyset_threshold=10000),
+        compression=dict(
+            method="stored",
+            level=None,
+            extensions={
+                ext: "stored"
+                for ext in (
+                    ".gz",
+                    ".tgz",
+                    ".xz",
+                    ".bz2",
+                    ".zst",
+                    ".zip",
+                    ".h5",
+                    ".hdf5",
+                    ".png",
+                    ".jpg",
+                    ".jpeg",
+                    ".gif",
+                )
+            },
+            max_size=None,
+            probe=True,
+            probe_ratio=0.95,
+            workers=1,
+        ),
+        tar=dict(zstd_level=3, gzip_level=6, threads=-1),
+        archive_cache=dict(
+            enabled=False,
+            directory=None,
+            max_size=10 * 1024**3,
+            build_on_complete=True,
+            workers=1,
+        ),
+        sendfile=dict(header=None, location="/internal"),
+    )
 
     def __init__(self, filepath):
         self.filepath = filepath
@@ -22,9 +64,10 @@ class SettingsGetter:
                 portal_config = yaml.safe_load(f)
             ConfigSchema().load(portal_config)
 
-            timeouts = {
-                **self.defaults["timeouts"],
-                **(portal_config.get("timeouts") or {}),
+            # optional sections are merged over their default values
+            sections = {
+                key: {**defaults, **(portal_config.get(key) or {})}
+                for key, defaults in self.defaults.items()
             }
             attrs = dict(
                 CONFIG_LINE_REGEX=re.compile(portal_config["custom_config_line_regex"]),
@@ -35,7 +78,15 @@ class SettingsGetter:
                 RESOURCES=portal_config.get("resources"),
                 SCRIPT_TEMPLATE=portal_config.get("script_template"),
                 EXTERNAL_LINKS=portal_config.get("external_links") or [],
-                TIMEOUTS=timeouts,
+                TIMEOUTS=sections["timeouts"],
+                POLLING=sections["polling"],
+                CACHING=sections["caching"],
+                SUBMISSION=sections["submission"],
+                JOB_LIST=sections["job_list"],
+                COMPRESSION=sections["compression"],
+                TAR=sections["tar"],
+                ARCHIVE_CACHE=sections["archive_cache"],
+                SENDFILE=sections["sendfile"],
             )
             self._settings = SimpleNamespace(**attrs)
         return self._settings
@@ -0,0 +1,81 @@
+require('etc')
+require('json')
+require('ood_core')
+
+# Long-lived worker used by main/scheduler.py. The cluster configuration is
+# loaded once at startup after which batches of commands are read from stdin
+# as a JSON array per line. A JSON array of results is written to stdout for
+# each batch, in the same order as the commands.
+
+clusters = OodCore::Clusters.load_file("/etc/ood/config/clusters.d/")
+
+cluster = clusters[ARGV[0]]
+adapter = cluster.job_adapter
+
+# Submit a job, or a job array if array_request (e.g. "1-10") is given. Array
+# tasks use the default output locations of the scheduler so that each task
+# has its own output files.
+def submit(adapter, script_path, array_request = nil)
+  script = OodCore::Job::Script.new(
+    content: Pathname.new(script_path).read,
+    accounting_id: nil,
+    output_path: array_request ? nil : "job_output",
+    error_path: array_request ? nil : "job_errors",
+    job_array_request: array_request
+  )
+  adapter.submit(script)
+end
+
+# Look up the status of each task of several job arrays, with a single query to
+# the scheduler per array. Tasks are listed with the ids given by the scheduler,
+# which may cover a range of array indices for pending tasks.
+def array_status(adapter, array_ids)
+  array_ids.map do |array_id|
+    info = adapter.info(array_id)
+    tasks = info.tasks.map do |task|
+      {"id" => task[:id].to_s, "status" => task[:status].to_s}
+    end
+    [array_id, {"status" => info.status.to_s, "tasks" => tasks}]
+  end.to_h
+end
+
+# Look up the status of many jobs with a single query to the scheduler. Jobs no
+# longer known to the scheduler are reported as completed, as for `status`.
+def status_many(adapter, job_ids)
+  owner = Etc.getpwuid(Process.uid).name
+  statuses = adapter.info_where_owner(owner, attrs: [:status]).map do |info|
+    [info.id, info.status.to_s]
+  end.to_h
+  job_ids.map { |job_id| [job_id, statuses.fetch(job_id, "completed")] }.to_h
+end
+
+def run_command(adapter, command)
+  Dir.chdir(command["run_dir"]) do
+    case command["name"]
+    when "submit"
+      submit(adapter, *command["args"]).to_s.strip
+    when "status"
+      adapter.status(command["args"][0]).to_s
+    when "status_many"
+      status_many(adapter, command["args"])
+    when "array_status"
+      array_status(adapter, command["args"])
+    when "delete"
+      adapter.delete(command["args"][0]).to_s.strip
+    else
+      raise ArgumentError, "Unknown command: #{command["name"]}"
+    end
+  end
+end
+
+STDOUT.sync = true
+STDIN.each_line do |line|
+  results = JSON.parse(line).map do |command|
+    begin
+      {"ok" => true, "output" => run_command(adapter, command)}
+    rescue StandardError => error
+      {"ok" => false, "error" => error.message.strip}
+    end
+  end
+  STDOUT.puts(JSON.generate(results))
+end
@@ -1,6 +1,12 @@
+import atexit
+import json
 import os
+import re
+import select
 import subprocess
-import sys
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
 
 from .portal_config import get_portal_settings
@@ -12,19 +18,51 @@ class SchedulerError(Exception):
     pass
 
 
-def submit(script_path, submission_dir, timeout=10):
+class SchedulerTimeout(SchedulerError):
+    """Raised when the scheduler does not respond in time. The outcome of the
+    command is unknown, e.g. a job may or may not have been submitted."""
+
+    pass
+
+
+def submit(script_path, submission_dir, timeout=10, array_request=None):
     """Submit a job to the scheduler.
 
     args:
       script_path (str or Path): path to the submission script
       submission_dir (Path): location to submit script from
       timeout (int): Number of seconds to wait before giving up
+      array_request (str): if given, submit a job array with these indices e.g.
+        "1-10"
 
     returns:
       (str): The returned job id
     """
-    return run_ruby_script(
-        "submit.rb", [script_path], timeout=timeout, run_dir=submission_dir
+    args = [script_path] if array_request is None else [script_path, array_request]
+    return run_command("submit", args, timeout=timeout, run_dir=submission_dir)
+
+
+def submit_many(submissions, timeout=10):
+    """Submit several jobs to the scheduler with a single batch of commands to the
+    scheduler bridge.
+
+    args:
+      submissions (list): pairs of the path to the submission script (str or Path)
+        and the location to submit it from (Path) for each job
+      timeout (int): Number of seconds to wait for each submission before giving up
+
+    returns:
+      (list): for each job the returned job id or a SchedulerError if submission
+        failed
+    """
+    if not submissions:
+        return []
+    return get_bridge().run(
+        [
+            ("submit", [script_path], submission_dir)
+            for script_path, submission_dir in submissions
+        ],
+        timeout * len(submissions),
     )
 
 
@@ -38,7 +76,105 @@ def status(job_id, timeout=2):
     returns:
       (str): The job status. One of "Queueing", "Running" or "Completed".
     """
-    return run_ruby_script("status.rb", [job_id], timeout=timeout)
+    return get_status_cache().get_many(
+        [job_id],
+        lambda job_ids: {job_ids[0]: run_command("status", job_ids, timeout=timeout)},
+        timeout,
+    )[job_id]
+
+
+def status_many(job_ids, timeout=2):
+    """Return the status of several jobs using a single query to the scheduler.
+
+    args:
+      job_ids (iterable of str): ids of the jobs to query
+      timeout (int): Number of seconds to wait before giving up
+
+    returns:
+      (dict): Mapping of job id to job status as given by `status`
+    """
+    return get_status_cache().get_many(
+        list(job_ids),
+        lambda job_ids: run_command("status_many", job_ids, timeout=timeout),
+        timeout,
+    )
+
+
+def array_status(array_ids, timeout=2):
+    """Return the status of the tasks of several job arrays. Each array is looked up
+    with a single query to the scheduler.
+
+    args:
+      array_ids (iterable of str): ids of the job arrays to query
+      timeout (int): Number of seconds to wait before giving up
+
+    returns:
+      (dict): Mapping of array id to a dict with keys "status", the overall status
+        of the array, and "tasks", a mapping of array index (str) to a dict with the
+        "id" and "status" of the task. Tasks that have finished are usually no
+        longer reported by the scheduler so are missing.
+    """
+    array_ids = list(array_ids)
+    if not array_ids:
+        return {}
+    arrays = run_command("array_status", array_ids, timeout=timeout)
+    return {
+        array_id: dict(
+            status=array["status"],
+            tasks={
+                str(index): dict(id=_task_id(task["id"], index), status=task["status"])
+                for task in array["tasks"]
+                for index in _task_indices(task["id"])
+            },
+        )
+        for array_id, array in arrays.items()
+    }
+
+
+def _task_indices(task_id):
+    """Return the array indices of the tasks covered by an id as listed by the
+    scheduler. Pending tasks may be listed together as a range, optionally with a
+    step and a limit on the number of tasks run at once e.g. "123_[1,3,5-9:2%2]".
+
+    args:
+      task_id (str): e.g. "123_4" or "123_[3-10]" for Slurm, "123[4].server" for PBS
+
+    returns:
+      (list): the array indices (int), empty if the id cannot be parsed
+    """
+    match = re.search(r"\[([^\]]+)\]", task_id) or re.search(
+        r"_(\d+)[^_\[\]]*\Z", task_id
+    )
+    if match is None:
+        return []
+    indices = []
+    try:
+        for part in match.group(1).partition("%")[0].split(","):
+            bounds, _, step = part.partition(":")
+            first, _, last = bounds.partition("-")
+            indices.extend(range(int(first), int(last or first) + 1, int(step or 1)))
+    except ValueError:
+        return []
+    return indices
+
+
+def _task_id(task_id, index):
+    """Return the id of a single task from an id that may cover a range of tasks,
+    as listed by the scheduler.
+
+    args:
+      task_id (str): the listed id e.g. "123_[3-10]" or "123[3-10].server"
+      index (int): the array index of the task
+
+    returns:
+      (str): the id of the task e.g. "123_4" or "123[4].server"
+    """
+    return re.sub(
+        r"(_?)\[[^\]]+\]",
+        lambda match: f"_{index}" if match.group(1) else f"[{index}]",
+        task_id,
+        count=1,
+    )
 
 
 def delete(job_id, timeout=10):
@@ -51,42 +187,301 @@ def delete(job_id, timeout=10):
     returns:
       (str): Standard output from the deletion
     """
-    return run_ruby_script("delete.rb", [job_id], timeout=timeout)
+    try:
+        return run_command("delete", [job_id], timeout=timeout)
+    finally:
+        get_status_cache().invalidate(job_id)
 
 
-def run_ruby_script(script_name, cmdline_args, timeout, run_dir=None):
-    """Run a ruby script as a subprocess. If the process fails or does not complete
-    within `timeout` seconds a SchedulerError is raised.
+def run_command(name, cmdline_args, timeout, run_dir=None):
+    """Run a single command via the scheduler bridge. If the command fails or does
+    not complete within `timeout` seconds a SchedulerError is raised.
 
     args:
-      script_name (str): file name of the ruby script to run
-      cmdline_args (list): the command line arguments to pass to the script
+      name (str): the command to run, one of "submit", "status", "status_many",
+        "array_status" or "delete"
+      cmdline_args (list): the arguments to pass to the command
       timeout (int): number of seconds to wait for command to run
-      run_dir (Path): the working directory for the subprocess
+      run_dir (Path): the working directory for the command
 
     returns:
-      (str): stdout from the executed script
+      (str or dict): output from the executed command
     """
+    (result,) = get_bridge().run([(name, cmdline_args, run_dir)], timeout)
+    if isinstance(result, SchedulerError):
+        raise result
+    return result
 
-    run_dir = run_dir if run_dir else os.getenv("HOME", "/tmp")
 
-    command = (
-        ["ruby", str(SCRIPT_DIR / script_name)]
-        + cmdline_args
-        + [get_portal_settings().CLUSTER]
-    )
-    try:
-        cp = subprocess.run(  # blocking call
-            command,
-            check=True,
+class SchedulerBridge:
+    """A long-lived ruby worker (see ruby_scripts/bridge.rb) that carries out
+    scheduler commands. The worker loads ood_core and the cluster configuration once
+    rather than on every command. Communication is via the worker's stdin and stdout
+    with each batch of commands sent as a single line of JSON.
+
+    The worker is started on first use and restarted as needed if it exits or has to
+    be killed following a timeout.
+    """
+
+    def __init__(self, command):
+        """
+        args:
+          command (list): the command line used to start the worker process
+        """
+        self.command = command
+        self._process = None
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+
+    def run(self, commands, timeout):
+        """Send a batch of commands to the worker and wait for the results. The
+        worker is used by one thread at a time. If another thread holds the worker
+        for the whole of `timeout` a SchedulerTimeout is raised without sending the
+        batch. If the worker does not respond before `timeout` seconds have passed,
+        including any time spent waiting for other threads, it is killed and a
+        SchedulerTimeout raised.
+
+        args:
+          commands (list): 3-ples of command name, argument list and working
+            directory (Path or None) for each command
+          timeout (int): number of seconds to wait for the batch to complete,
+            including waiting for the worker to be free
+
+        returns:
+          (list): for each command the output (usually a str) or a SchedulerError
+            if the command failed
+        """
+        default_dir = os.getenv("HOME", "/tmp")
+        payload = json.dumps(
+            [
+                dict(
+                    name=name,
+                    args=[str(arg) for arg in args],
+                    run_dir=str(run_dir if run_dir else default_dir),
+                )
+                for name, args, run_dir in commands
+            ]
+        )
+        # a single deadline covers waiting for other threads using the worker as
+        # well as waiting for the worker to respond
+        deadline = time.monotonic() + timeout
+        if not self._lock.acquire(timeout=max(timeout, 0)):
+            raise SchedulerTimeout("Timed out waiting for the scheduler worker")
+        try:
+            self._send(payload.encode() + b"\n")
+            try:
+                response = json.loads(self._read_line(deadline))
+            except ValueError:
+                self.stop()
+                raise SchedulerError("Invalid response from scheduler worker")
+        finally:
+            self._lock.release()
+
+        return [
+            result["output"] if result["ok"] else SchedulerError(result["error"])
+            for result in response
+        ]
+
+    def stop(self):
+        """Terminate the worker process if it is running."""
+        if self._process is not None:
+            self._process.kill()
+            self._process.wait()
+            self._process.stdin.close()
+            self._process.stdout.close()
+        self._process = None
+        self._buffer.clear()
+
+    def _start(self):
+        self._process = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            cwd=run_dir,
-            timeout=timeout,
+            cwd=os.getenv("HOME", "/tmp"),
+            bufsize=0,
         )
-    except subprocess.CalledProcessError as e:
-        raise SchedulerError(e.stderr.decode(sys.getfilesystemencoding()).strip())
-    except subprocess.TimeoutExpired:
-        raise SchedulerError("Scheduler command timed out")
 
-    return cp.stdout.decode(sys.getfilesystemencoding()).strip()
+    def _send(self, data):
+        # a worker that has exited since the last batch can safely be restarted
+        # and the batch resent as it cannot have been seen by the old worker
+        if self._process is None or self._process.poll() is not None:
+            self.stop()
+            self._start()
+        try:
+            self._process.stdin.write(data)
+        except OSError:
+            self.stop()
+            raise SchedulerError("Unable to communicate with scheduler worker")
+
+    def _read_line(self, deadline):
+        fd = self._process.stdout.fileno()
+        while b"\n" not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                self.stop()
+                raise SchedulerTimeout("Scheduler command timed out")
+            chunk = os.read(fd, 64 * 1024)
+            if not chunk:
+                self.stop()
+                raise SchedulerError("Scheduler worker exited unexpectedly")
+            self._buffer += chunk
+        line, _, rest = self._buffer.partition(b"\n")
+        self._buffer = bytearray(rest)
+        return line
+
+
+class _PendingLookup:
+    """A scheduler query for job statuses that is in progress."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.statuses = {}
+        self.error = None
+
+
+class StatusCache:
+    """A cache of job statuses keyed by job id. Entries expire after `ttl` seconds
+    except for completed jobs whose status cannot change. The least recently used
+    entries are discarded to keep at most `max_entries`.
+
+    Concurrent lookups of the same job id share a single scheduler query rather
+    than each querying the scheduler.
+    """
+
+    def __init__(self, ttl, max_entries):
+        """
+        args:
+          ttl (int): number of seconds for which a job status is cached
+          max_entries (int): maximum number of job statuses to cache
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, job_ids, fetch, timeout):
+        """Return the status of each job in `job_ids`. Statuses not already cached
+        or being looked up by another thread are retrieved with a single call to
+        `fetch`.
+
+        args:
+          job_ids (list of str): ids of the jobs to look up
+          fetch (callable): takes a list of job ids and returns a dict mapping job
+            id to status. May raise SchedulerError.
+          timeout (int): number of seconds to wait on lookups made by other threads
+
+        returns:
+          (dict): mapping of job id to status
+        """
+        statuses = {}
+        waiting = {}
+        to_fetch = []
+        lookup = _PendingLookup()
+        now = time.monotonic()
+        with self._lock:
+            for job_id in job_ids:
+                entry = self._entries.get(job_id)
+                if entry is not None and (entry[1] is None or entry[1] > now):
+                    self._entries.move_to_end(job_id)
+                    statuses[job_id] = entry[0]
+                elif job_id in self._pending:
+                    waiting[job_id] = self._pending[job_id]
+                else:
+                    self._pending[job_id] = lookup
+                    to_fetch.append(job_id)
+
+        if to_fetch:
+            try:
+                lookup.statuses = fetch(to_fetch)
+            except SchedulerError as e:
+                lookup.error = e
+            finally:
+                self._store(to_fetch, lookup)
+            if lookup.error is not None:
+                raise lookup.error
+            statuses.update(lookup.statuses)
+
+        deadline = time.monotonic() + timeout
+        for job_id, other in waiting.items():
+            if not other.done.wait(max(deadline - time.monotonic(), 0)):
+                raise SchedulerTimeout("Scheduler command timed out")
+            if other.error is not None:
+                raise other.error
+            if job_id in other.statuses:
+                statuses[job_id] = other.statuses[job_id]
+        return statuses
+
+    def invalidate(self, job_id):
+        """Discard any cached status for `job_id`.
+
+        args:
+          job_id (str): id of the job to discard
+        """
+        with self._lock:
+            self._entries.pop(job_id, None)
+
+    def _store(self, job_ids, lookup):
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for job_id in job_ids:
+                del self._pending[job_id]
+                if job_id not in lookup.statuses:
+                    continue
+                status = lookup.statuses[job_id]
+                self._entries[job_id] = (
+                    status,
+                    None if status == "completed" else expires,
+                )
+                self._entries.move_to_end(job_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        lookup.done.set()
+
+
+_status_cache = None
+_status_cache_lock = threading.Lock()
+
+
+def get_status_cache():
+    """Return the StatusCache for the current process, creating it if required.
+
+    returns:
+      (StatusCache): the cache configured by the portal config
+    """
+    global _status_cache
+    with _status_cache_lock:
+        if _status_cache is None:
+            caching = get_portal_settings().CACHING
+            _status_cache = StatusCache(
+                caching["status_ttl"], caching["status_max_entries"]
+            )
+        return _status_cache
+
+
+_bridge = None
+_bridge_pid = None
+_bridge_lock = threading.Lock()
+
+
+def get_bridge():
+    """Return the SchedulerBridge for the current process, creating it if
+    required. Forked processes do not share the bridge of their parent.
+
+    returns:
+      (SchedulerBridge): the bridge for the configured cluster
+    """
+    global _bridge, _bridge_pid
+    with _bridge_lock:
+        if _bridge is None or _bridge_pid != os.getpid():
+            _bridge = SchedulerBridge(
+                ["ruby", str(SCRIPT_DIR / "bridge.rb"), get_portal_settings().CLUSTER]
+            )
+            _bridge_pid = os.getpid()
+        return _bridge
+
+
+@atexit.register
+def _stop_bridge():
+    if _bridge is not None and _bridge_pid == os.getpid():
+        _bridge.stop()
@@ -0,0 +1,184 @@
+"""Asynchronous submission of jobs to the scheduler. Jobs are created with status
+SUBMITTING and their submission scripts handed to a pool of worker threads so
+that the request creating the job can return straight away. Batches of jobs are
+submitted together by a single worker with one round trip to the scheduler
+bridge. Failed submissions are retried with exponential backoff before the job
+is marked as FAILED along with the reason.
+
+Queued submissions only exist in the memory of the process that created the
+jobs. Jobs left as SUBMITTING when that process exits, e.g. when it is recycled
+by the application server, are marked as FAILED by `fail_stale`.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import scheduler
+from .portal_config import get_portal_settings
+
+logger = logging.getLogger(__name__)
+
+STALE_ERROR = "Submission did not complete, possibly due to a restart of the portal"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the pool of submission worker threads for this process, creating it
+    if required.
+
+    returns:
+      (ThreadPoolExecutor): the worker pool
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_portal_settings().SUBMISSION["workers"],
+                thread_name_prefix="submission",
+            )
+        return _executor
+
+
+def enqueue(job_pk, script_path, work_dir):
+    """Queue a job for submission by the worker pool.
+
+    args:
+      job_pk (int): pk of the Job to submit
+      script_path (Path): path to the submission script
+      work_dir (Path): location to submit script from
+
+    returns:
+      (Future): completes once submission has succeeded or failed
+    """
+    return enqueue_many([(job_pk, script_path, work_dir)])
+
+
+def enqueue_many(submissions):
+    """Queue several jobs for submission by the worker pool as a single batch, see
+    `submit_jobs`.
+
+    args:
+      submissions (list): 3-ples of the pk of the Job to submit, the path to its
+        submission script (Path) and the location to submit it from (Path)
+
+    returns:
+      (Future): completes once all submissions have succeeded or failed
+    """
+    return get_executor().submit(_worker, submissions)
+
+
+def _worker(submissions):
+    try:
+        submit_jobs(submissions)
+    except Exception:
+        job_pks = [job_pk for job_pk, _, _ in submissions]
+        logger.exception(f"Exception during job submission: Job pks {job_pks}")
+    finally:
+        close_old_connections()
+
+
+def submit_job(job_pk, script_path, work_dir):
+    """Submit a job to the scheduler, retrying on failure, and record the outcome.
+    A timed out submission is not retried as the job may have been submitted.
+
+    args:
+      job_pk (int): pk of the Job to submit
+      script_path (Path): path to the submission script
+      work_dir (Path): location to submit script from
+
+    returns:
+      (str or None): the scheduler job id or None if submission failed
+    """
+    return submit_jobs([(job_pk, script_path, work_dir)])[0]
+
+
+def submit_jobs(submissions):
+    """Submit jobs to the scheduler, retrying on failure, and record the outcomes.
+    Each attempt sends all outstanding submissions to the scheduler bridge as a
+    single batch. Timed out submissions are not retried as the jobs may have been
+    submitted.
+
+    args:
+      submissions (list): 3-ples of the pk of the Job to submit, the path to its
+        submission script (Path) and the location to submit it from (Path)
+
+    returns:
+      (list): for each job the scheduler job id or None if submission failed
+    """
+    from .models import Job
+
+    portal_settings = get_portal_settings()
+    retries = portal_settings.SUBMISSION["retries"]
+    delay = portal_settings.SUBMISSION["retry_delay"]
+    job_ids = {}
+    pending = {
+        job_pk: (script_path, work_dir) for job_pk, script_path, work_dir in submissions
+    }
+    for attempt in range(retries + 1):
+        # jobs deleted before they could be submitted are skipped
+        submitting = set(
+            Job.objects.filter(pk__in=pending, status=Job.SUBMITTING).values_list(
+                "pk", flat=True
+            )
+        )
+        pending = {pk: args for pk, args in pending.items() if pk in submitting}
+        if not pending:
+            break
+        try:
+            results = scheduler.submit_many(
+                list(pending.values()), timeout=portal_settings.TIMEOUTS["submit"]
+            )
+        except scheduler.SchedulerError as e:
+            results = [e] * len(pending)
+
+        failed = {}
+        for (job_pk, args), result in zip(pending.items(), results):
+            jobs = Job.objects.filter(pk=job_pk, status=Job.SUBMITTING)
+            if isinstance(result, scheduler.SchedulerError):
+                logger.warning(f"Job submission failed: Job pk {job_pk}: {result}")
+                if attempt == retries or isinstance(result, scheduler.SchedulerTimeout):
+                    jobs.update(status=Job.FAILED, submission_error=str(result))
+                else:
+                    failed[job_pk] = args
+            elif jobs.update(status=Job.QUEUEING, job_id=result):
+                job_ids[job_pk] = result
+            else:
+                # deleted, or marked as failed by fail_stale, whilst being submitted
+                scheduler.delete(result, timeout=portal_settings.TIMEOUTS["delete"])
+        pending = failed
+        if pending:
+            time.sleep(delay * 2**attempt)
+    return [job_ids.get(job_pk) for job_pk, _, _ in submissions]
+
+
+def fail_stale(max_age):
+    """Mark jobs that have been waiting to be submitted for longer than `max_age`
+    seconds as FAILED. Such jobs are assumed to have been lost from the queue of a
+    process that has since exited. Should the job be submitted after all it is
+    deleted from the scheduler by `submit_job`.
+
+    args:
+      max_age (int): number of seconds after creation at which a job still being
+        submitted is failed. No jobs are failed if 0.
+
+    returns:
+      (int): the number of jobs marked as failed
+    """
+    from .models import Job
+
+    if max_age <= 0:
+        return 0
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    failed = Job.objects.filter(status=Job.SUBMITTING, submission_time__lt=cutoff)
+    count = failed.update(status=Job.FAILED, submission_error=STALE_ERROR)
+    if count:
+        logger.warning(f"Marked {count} stale job submission(s) as failed")
+    return count
@@ -1,4 +1,7 @@
+from datetime import datetime
+
 import django_tables2 as tables
+import humanize
 from django.urls import reverse
 from django.utils.html import format_html
 
@@ -45,7 +48,8 @@ class JobTable(tables.Table):
     def render_publish(self, record):
         if record.status != Job.COMPLETED:
             return ""
-        publications = Publication.objects.filter(job=record)
+        # uses publications prefetched by the view if available
+        publications = record.publication_set.all()
         if publications:
             return format_html(
                 "<br>".join(
@@ -57,6 +61,33 @@ class JobTable(tables.Table):
             return format_html(f'<a href="{url}">Publish</a>')
 
 
+class BulkSubmissionTable(tables.Table):
+    """Table showing the outcome of submission for each job created by the
+    `bulk_create_job` view."""
+
+    class Meta:
+        template_name = "django_tables2/semantic.html"
+        orderable = False
+
+    job = tables.Column(
+        accessor="job__job_number",
+        linkify=lambda record: record["job"].get_absolute_url(),
+        verbose_name="Job Number",
+    )
+    input_file = tables.Column(verbose_name="Input File")
+    status = tables.Column(accessor="job__get_status_display", verbose_name="Status")
+    job_id = tables.Column(empty_values=(), verbose_name="Scheduler Id")
+    submission_error = tables.Column(
+        accessor="job__submission_error", verbose_name="Error"
+    )
+
+    def render_job_id(self, record):
+        job = record["job"]
+        if job.job_id or job.array is None:
+            return job.job_id
+        return f"{job.array.job_id} (task {job.array_index})"
+
+
 class CustomConfigTable(tables.Table):
     """Table of all CustomConfig objects."""
 
@@ -106,19 +137,42 @@ class PublicationTable(tables.Table):
 
 
 class DirectoryTable(tables.Table):
-    """Table displaying the files in a directory."""
+    """Table displaying the files in a directory, as listed by
+    `utils.scan_directory`. Rows are sorted on the raw modification time and size
+    and only the current page is formatted for display."""
 
     class Meta:
         template_name = "django_tables2/semantic.html"
-
+        order_by = "name"
+        per_page = 100
+
+    include = tables.CheckBoxColumn(
+        attrs={
+            "td__input": {"form": "download-form"},
+            "th__input": {
+                "onclick": "document.querySelectorAll('input[name=include]')"
+                ".forEach(input => input.checked = this.checked)"
+            },
+        },
+        orderable=False,
+    )
     name = tables.Column(verbose_name="File Name")
     mtime = tables.Column(verbose_name="Last Modified")
     file_size = tables.Column(verbose_name="Size")
     view = tables.TemplateColumn(
         '<a href="{{ directory_url }}/{{ record.name }}" target="_blank" class="external-link">View</a>',  # noqa: E501
         verbose_name="",
+        orderable=False,
     )
     download = tables.TemplateColumn(
-        '<a href="{{ directory_url }}/{{ record.name }}?download=1">Download</a>',
+        "{% if record.is_file %}<a href=\"{% url 'main:download_file' job.pk record.name %}\">"  # noqa: E501
+        "Download</a>{% endif %}",
         verbose_name="",
+        orderable=False,
     )
+
+    def render_mtime(self, value):
+        return humanize.naturaltime(datetime.fromtimestamp(value))
+
+    def render_file_size(self, value):
+        return humanize.naturalsize(value)
@@ -0,0 +1,101 @@
+"""Implementation of a generator that creates a compressed tar archive on the
+fly, in the same way as `zip_stream.zipfile_generator`. The whole archive is
+compressed as a single stream, with zstd (if the zstandard package is installed)
+or gzip, which gives a better ratio than compressing each file separately and,
+for zstd, is much faster than deflate.
+
+Tar headers and file data are written to the compressor as files are read, so
+memory use is bounded however large the files in the archive are.
+"""
+
+import gzip
+import stat
+import tarfile
+from pathlib import Path
+
+from .zip_stream import CHUNK_SIZE_BYTES, Stream
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FORMATS = ("tar.zst", "tar.gz")
+ZSTD_AVAILABLE = zstandard is not None
+
+
+def tarfile_generator(dir_name, paths, compression, level=None, threads=-1, root=None):
+    """Generator yielding bytestrings for a compressed tar archive constructed on
+    the fly. The archive will contain the files specified by `paths` in a parent
+    directory `dir_name`.
+
+    Chunks of at least CHUNK_SIZE_BYTES are yielded where the compressor has
+    produced enough output.
+
+    args:
+      dir_name (str): name of parent directory that will contain files in the archive
+      paths (iterable of Path): the files to add to the archive
+      compression (str): "zst" or "gz"
+      level (int): the compression level, the default of the compressor if None
+      threads (int): the number of threads used by zstd, all cpus if -1
+      root (Path): if given, files keep their path relative to `root` within
+        `dir_name`, e.g. for files in sub-directories
+
+    yields:
+      (bytes): next chunk of the archive
+    """
+    stream = Stream()
+    written = 0
+    with _compressor(stream, compression, level, threads) as out:
+        for path in paths:
+            tar_info = _tar_info(dir_name, path, root)
+            header = tar_info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+            out.write(header)
+            with open(path, "rb") as f:
+                remaining = tar_info.size
+                while remaining:
+                    chunk = f.read(min(remaining, CHUNK_SIZE_BYTES))
+                    if not chunk:
+                        raise OSError(f"{path} changed whilst being archived")
+                    out.write(chunk)
+                    remaining -= len(chunk)
+                    if stream.size >= CHUNK_SIZE_BYTES:
+                        yield stream.get()
+            padding = -tar_info.size % tarfile.BLOCKSIZE
+            out.write(tarfile.NUL * padding)
+            written += len(header) + tar_info.size + padding
+        # end of archive marker, padded to a whole record as written by tarfile
+        end = 2 * tarfile.BLOCKSIZE
+        end += -(written + end) % tarfile.RECORDSIZE
+        out.write(tarfile.NUL * end)
+    yield stream.get()
+
+
+def _compressor(stream, compression, level, threads):
+    if compression == "zst":
+        if zstandard is None:
+            raise ValueError("zstandard is not installed")
+        compressor = zstandard.ZstdCompressor(
+            level=3 if level is None else level, threads=threads
+        )
+        return compressor.stream_writer(stream, closefd=False)
+    if compression == "gz":
+        return gzip.GzipFile(
+            fileobj=stream,
+            mode="wb",
+            compresslevel=6 if level is None else level,
+            mtime=0,
+        )
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+def _tar_info(dir_name, path, root):
+    arcname = Path(dir_name, path.name if root is None else path.relative_to(root))
+    stats = path.stat()
+    tar_info = tarfile.TarInfo(arcname.as_posix())
+    tar_info.size = stats.st_size
+    tar_info.mtime = int(stats.st_mtime)
+    tar_info.mode = stat.S_IMODE(stats.st_mode)
+    tar_info.uid = stats.st_uid
+    tar_info.gid = stats.st_gid
+    return tar_info
@@ -4,6 +4,7 @@ from unittest.mock import patch
 
 from django.test import TestCase
 
+from .. import scheduler
 from ..scheduler import SchedulerError
 
 SCHEDULER_ERROR_MESSAGE = "error_message"
@@ -17,14 +18,25 @@ class Scheduler:
         self.queued_jobs = set()
         self.running_jobs = set()
         self.completed_jobs = set()
+        self.array_tasks = {}
         self.current_id = 1
 
-    def submit(self, script_path, submission_dir, timeout=0):
-        job_id = f"{self.current_id:08d}.pbs"
+    def submit(self, script_path, submission_dir, timeout=0, array_request=None):
+        job_id = f"{self.current_id:08d}{'[]' if array_request else ''}.pbs"
         self.current_id += 1
         self.queued_jobs.add(job_id)
         return job_id
 
+    def submit_many(self, submissions, timeout=0):
+        # submits via `scheduler.submit` so that tests may patch it
+        results = []
+        for script_path, submission_dir in submissions:
+            try:
+                results.append(scheduler.submit(script_path, submission_dir, timeout))
+            except SchedulerError as e:
+                results.append(e)
+        return results
+
     def status(self, job_id, timeout=0):
         if job_id in self.queued_jobs:
             return "queueing"
@@ -33,6 +45,17 @@ class Scheduler:
         else:
             return "completed"
 
+    def status_many(self, job_ids, timeout=0):
+        return {job_id: self.status(job_id) for job_id in job_ids}
+
+    def array_status(self, array_ids, timeout=0):
+        return {
+            array_id: dict(
+                status=self.status(array_id), tasks=self.array_tasks.get(array_id, {})
+            )
+            for array_id in array_ids
+        }
+
     def delete(self, job_id, timeout=0):
         if not job_id:
             raise SchedulerError("illegal job identifier")
@@ -59,8 +82,20 @@ class SchedulerTestCase(TestCase):
         self.scheduler = Scheduler()
         self.submit_patcher = patch("main.scheduler.submit", self.scheduler.submit)
         self.submit_patcher.start()
+        self.submit_many_patcher = patch(
+            "main.scheduler.submit_many", self.scheduler.submit_many
+        )
+        self.submit_many_patcher.start()
         self.status_patcher = patch("main.scheduler.status", self.scheduler.status)
         self.status_patcher.start()
+        self.status_many_patcher = patch(
+            "main.scheduler.status_many", self.scheduler.status_many
+        )
+        self.status_many_patcher.start()
+        self.array_status_patcher = patch(
+            "main.scheduler.array_status", self.scheduler.array_status
+        )
+        self.array_status_patcher.start()
         self.delete_patcher = patch("main.scheduler.delete", self.scheduler.delete)
         self.delete_patcher.start()
 
@@ -73,14 +108,17 @@ class SchedulerTestCase(TestCase):
     def tearDown(self):
         super().tearDown()
         self.submit_patcher.stop()
+        self.submit_many_patcher.stop()
         self.status_patcher.stop()
+        self.status_many_patcher.stop()
+        self.array_status_patcher.stop()
         self.delete_patcher.stop()
 
         self.tmp_dir.cleanup()
         self.work_dir_patcher.stop()
 
 
-def raise_scheduler_error(job_id, work_dir, timeout=0):
+def raise_scheduler_error(job_id, work_dir, timeout=0, array_request=None):
     """Raises a scheduler.SchedulerError to simulate failure of job
     submision.
     """
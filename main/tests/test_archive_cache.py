@@ -0,0 +1,143 @@
+import os
+import zipfile
+from unittest.mock import patch
+
+from django.conf import settings
+from django.http import FileResponse
+
+from ..archive_cache import ArchiveCache
+from ..models import Job
+from . import create_dummy_job
+from .scheduler_mock import SchedulerTestCase
+
+
+class ArchiveCacheTestCase(SchedulerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = self.make_cache()
+        self.job = create_dummy_job()
+        self.job.status = Job.COMPLETED
+        self.job.save()
+        (self.job.work_dir / "output.log").write_text("output")
+
+    def make_cache(self, max_size=10**9):
+        return ArchiveCache(
+            settings.JOBS_DIR / "archives", max_size, dict(method="deflated")
+        )
+
+
+class TestArchiveCache(ArchiveCacheTestCase):
+    def test_build(self):
+        self.assertIsNone(self.cache.get(self.job))
+        path = self.cache.build(self.job)
+        self.assertEqual(self.cache.get(self.job)[0], path)
+        with zipfile.ZipFile(path) as zf:
+            name = f"{self.job.job_number}/output.log"
+            self.assertIn(name, zf.namelist())
+            self.assertEqual(zf.getinfo(name).compress_type, zipfile.ZIP_DEFLATED)
+
+    def test_invalidated(self):
+        """Archives are replaced if the working directory changes"""
+        old_path = self.cache.build(self.job)
+        self.assertIsNotNone(self.cache.get(self.job))
+        (self.job.work_dir / "error.log").write_text("error")
+        self.assertIsNone(self.cache.get(self.job))
+        new_path = self.cache.build(self.job)
+        self.assertNotEqual(new_path, old_path)
+        self.assertFalse(old_path.exists())
+
+    def test_fingerprint_remembered(self):
+        """The working directory is not walked again for an unchanged job"""
+        self.cache.build(self.job)
+        self.assertIsNotNone(self.cache.get(self.job))
+        with patch("main.archive_cache.walk_files") as walk_files:
+            self.assertIsNotNone(self.cache.get(self.job))
+        walk_files.assert_not_called()
+
+    def test_status_changed(self):
+        """The working directory is walked again if the job status changes"""
+        self.cache.build(self.job)
+        self.assertIsNotNone(self.cache.get(self.job))
+        (self.job.work_dir / "output.log").write_text("changed")
+        self.assertIsNotNone(self.cache.get(self.job))
+        self.job.status = Job.FAILED
+        self.assertIsNone(self.cache.get(self.job))
+
+    def test_files_modified(self):
+        """Changes to existing files and sub-directories are found after
+        FINGERPRINT_TTL seconds"""
+        (self.job.work_dir / "output").mkdir()
+        (self.job.work_dir / "output" / "result.log").write_text("result")
+        self.cache.build(self.job)
+        for start, path in ((0, "output.log"), (100, "output/result.log")):
+            with patch("main.archive_cache.time.monotonic", return_value=start):
+                self.assertIsNotNone(self.cache.get(self.job))
+            mtime = os.stat(self.job.work_dir).st_mtime_ns
+            (self.job.work_dir / path).write_text("changed")
+            self.assertEqual(os.stat(self.job.work_dir).st_mtime_ns, mtime)
+            with patch("main.archive_cache.time.monotonic", return_value=start + 5):
+                self.assertIsNone(self.cache.get(self.job), path)
+            self.cache.build(self.job)
+
+    def test_evict(self):
+        """The least recently used archives are removed to keep within max_size"""
+        other = create_dummy_job()
+        old_path = self.cache.build(self.job)
+        os.utime(old_path, (0, 0))
+        self.cache.max_size = old_path.stat().st_size + 1
+        new_path = self.cache.build(other)
+        self.assertFalse(old_path.exists())
+        self.assertTrue(new_path.exists())
+
+    def test_enqueue(self):
+        future = self.cache.enqueue(self.job)
+        future.result(5)
+        self.assertIsNotNone(self.cache.get(self.job))
+
+    def test_job_deleted(self):
+        path = self.cache.build(self.job)
+        with patch("main.models.get_archive_cache", lambda: self.cache):
+            self.job.delete()
+        self.assertFalse(path.exists())
+
+
+class TestCachedDownload(ArchiveCacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.patcher = patch("main.views.get_archive_cache", lambda: self.cache)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        super().tearDown()
+
+    def test_first_download(self):
+        """The archive is built in the background and streamed in the meantime"""
+        with patch.object(self.cache, "enqueue") as enqueue:
+            response = self.client.get(f"/download/{self.job.pk}/")
+        enqueue.assert_called_once_with(self.job)
+        self.assertNotIsInstance(response, FileResponse)
+        b"".join(response.streaming_content)
+
+    def test_cached(self):
+        path = self.cache.build(self.job)
+        response = self.client.get(f"/download/{self.job.pk}/")
+        self.assertIsInstance(response, FileResponse)
+        self.assertEqual(
+            response["Content-Disposition"],
+            f'attachment; filename="{self.job.job_number}.zip"',
+        )
+        self.assertEqual(b"".join(response.streaming_content), path.read_bytes())
+
+        response = self.client.get(f"/download/{self.job.pk}/", HTTP_RANGE="bytes=5-9")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), path.read_bytes()[5:10])
+
+    def test_filtered_not_cached(self):
+        """Downloads of selected files are not cached"""
+        self.cache.build(self.job)
+        response = self.client.get(
+            f"/download/{self.job.pk}/", {"include": "output.log"}
+        )
+        self.assertNotIsInstance(response, FileResponse)
+        b"".join(response.streaming_content)
@@ -5,12 +5,19 @@ import yaml
 from marshmallow import ValidationError
 
 from config_validation import (
+    ArchiveCacheSchema,
+    CachingSchema,
+    CompressionSchema,
     ConfigSchema,
     ExternalLinkSchema,
     FileSchema,
     FilesSchema,
+    JobListSchema,
+    PollingSchema,
     ResourceSchema,
+    SendfileSchema,
     SoftwareSchema,
+    TarSchema,
     TimeoutsSchema,
 )
 from main.software import clean_software_config
@@ -140,6 +147,77 @@ class TestTimeoutsSchema(SchemaTestCase):
         self.schema.load(self.valid_data)
 
 
+class TestPollingSchema(SchemaTestCase):
+    valid_data = {"interval": 1}
+    schema = PollingSchema()
+
+    def test_fields_type(self):
+        """Non-integer values for fields do not pass validation"""
+        self.field_types({"interval": ""})
+
+    def test_valid(self):
+        """Valid data should not trigger a validation error"""
+        self.schema.load(self.valid_data)
+
+
+class TestCachingSchema(SchemaTestCase):
+    valid_data = {"status_ttl": 1, "status_max_entries": 1, "file_index_max_entries": 0}
+    schema = CachingSchema()
+
+    def test_fields_type(self):
+        """Non-integer values for fields do not pass validation"""
+        self.field_types(
+            {"status_ttl": "", "status_max_entries": "", "file_index_max_entries": -1}
+        )
+
+    def test_valid(self):
+        """Valid data should not trigger a validation error"""
+        self.schema.load(self.valid_data)
+
+
+class TestCompressionSchema(SchemaTestCase):
+    valid_data = {
+        "method": "deflated",
+        "level": 6,
+        "extensions": {".gz": "stored"},
+        "max_size": 1000,
+        "probe": True,
+        "probe_ratio": 0.9,
+        "workers": 4,
+    }
+    schema = CompressionSchema()
+
+    def test_fields_type(self):
+        self.field_types(
+            {
+                "method": "zip",
+                "level": 10,
+                "extensions": {".gz": "zip"},
+                "max_size": "",
+                "probe": "",
+                "probe_ratio": "",
+                "workers": 0,
+            }
+        )
+
+    def test_valid(self):
+        """Valid data should not trigger a validation error"""
+        self.schema.load(self.valid_data)
+        self.schema.load({**self.valid_data, "level": None, "max_size": None})
+        self.schema.load({**self.valid_data, "method": "lzma", "level": 0})
+
+    def test_level_per_method(self):
+        """Levels are checked against the range of each method used"""
+        for data in (
+            {"method": "bzip2", "level": 0},
+            {"method": "stored", "level": 0, "extensions": {".txt": "bzip2"}},
+        ):
+            with self.assertRaises(ValidationError) as cm:
+                self.schema.load(data)
+            self.assertIn("level", cm.exception.messages)
+        self.schema.load({"method": "bzip2", "level": 1})
+
+
 class TestConfigSchema(SchemaTestCase):
     software = dict(
         name="", input_files=TestFilesSchema.valid_data, commands="", help_text=""
@@ -155,6 +233,9 @@ class TestConfigSchema(SchemaTestCase):
         external_links=[TestExternalLinkSchema.valid_data],
         cluster="",
         timeouts=TestTimeoutsSchema.valid_data,
+        polling=TestPollingSchema.valid_data,
+        caching=TestCachingSchema.valid_data,
+        compression=TestCompressionSchema.valid_data,
     )
 
     def test_fields_required(self):
@@ -184,6 +265,9 @@ class TestConfigSchema(SchemaTestCase):
                 enabled_repositories=0,
                 cluster=0,
                 timeouts=0,
+                polling=0,
+                caching=0,
+                compression=0,
             )
         )
 
@@ -208,3 +292,68 @@ class TestCleanSoftwareConfig(TestCase):
         config = clean_software_config(config)
         self.assertEqual(config["input_files"]["required"], [])
         self.assertEqual(config["input_files"]["optional"], [])
+
+
+class TestArchiveCacheSchema(SchemaTestCase):
+    valid_data = {
+        "enabled": True,
+        "directory": "/srv/archives",
+        "max_size": 1000,
+        "build_on_complete": False,
+        "workers": 2,
+    }
+    schema = ArchiveCacheSchema()
+
+    def test_fields_type(self):
+        self.field_types(
+            {
+                "enabled": "",
+                "directory": 1,
+                "max_size": -1,
+                "build_on_complete": "",
+                "workers": 0,
+            }
+        )
+
+    def test_valid(self):
+        """Valid data should not trigger a validation error"""
+        self.schema.load(self.valid_data)
+        self.schema.load({**self.valid_data, "directory": None})
+
+
+class TestSendfileSchema(SchemaTestCase):
+    valid_data = {"header": "X-Accel-Redirect", "location": "/internal"}
+    schema = SendfileSchema()
+
+    def test_fields_type(self):
+        self.field_types({"header": "X-Other", "location": 1})
+
+    def test_valid(self):
+        """Valid data should not trigger a validation error"""
+        self.schema.load(self.valid_data)
+        self.schema.load({"header": None})
+
+
+class TestTarSchema(SchemaTestCase):
+    valid_data = {"zstd_level": 19, "gzip_level": 9, "threads": 4}
+    schema = TarSchema()
+
+    def test_fields_type(self):
+        self.field_types({"zstd_level": 0, "gzip_level": 10, "threads": -2})
+
+    def test_valid(self):
+        """Valid data should not trigger a validation error"""
+        self.schema.load(self.valid_data)
+        self.schema.load({"threads": -1})
+
+
+class TestJobListSchema(SchemaTestCase):
+    valid_data = {"keyset_threshold": 0}
+    schema = JobListSchema()
+
+    def test_fields_type(self):
+        self.field_types({"keyset_threshold": -1})
+
+    def test_valid(self):
+        """Valid data should not trigger a validation error"""
+        self.schema.load(self.valid_data)
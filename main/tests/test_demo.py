@@ -38,6 +38,12 @@ class DemoTest(TestCase):
         status = scheduler.status(job.job_id)
         self.assertIn(status, ("queued", "running"))
 
+    def test_status_many(self):
+        job = Job.objects.create_job("", {}, self.project, 0, 0)
+
+        statuses = scheduler.status_many([job.job_id])
+        self.assertIn(statuses[job.job_id], ("queued", "running"))
+
     def test_delete(self):
         job = Job.objects.create_job("", {}, self.project, 0, 0)
 
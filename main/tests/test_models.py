@@ -1,10 +1,24 @@
+import fcntl
+import os
+import stat
 from datetime import timedelta
+from io import BytesIO
 from pathlib import Path
 from unittest.mock import patch
 
 from django.core.exceptions import ValidationError
-
-from ..models import ROUNDING_INTERVAL, CustomConfig, Job, Profile, Project
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.db import connection
+
+from ..models import (
+    ROUNDING_INTERVAL,
+    CustomConfig,
+    InputBlob,
+    Job,
+    JobArray,
+    Profile,
+    Project,
+)
 from ..portal_config import SettingsGetter
 from ..scheduler import SchedulerError
 from . import create_dummy_job
@@ -43,6 +57,312 @@ class Test(SchedulerTestCase):
         # work directory should be tidied up
         self.assertEqual(len(list(Path(self.tmp_dir.name).glob("*"))), 0)
 
+    def test_failed_file_writing(self):
+        """No job or working directory is left if input files cannot be written"""
+        with patch(
+            "main.models.JobManager._save_input", side_effect=IsADirectoryError
+        ), self.assertRaises(IsADirectoryError):
+            Job.objects.create_job(
+                "",
+                {
+                    "file1": SimpleUploadedFile("a.com", b"a"),
+                    "file2": SimpleUploadedFile("b.fchk", b"b"),
+                },
+                self.project,
+                0,
+                0,
+            )
+        self.assertFalse(Job.objects.exists())
+        self.assertFalse(InputBlob.objects.exists())
+        self.assertEqual(
+            [path.name for path in Path(self.tmp_dir.name).glob("*")], ["blobs"]
+        )
+
+    def test_create_jobs_files_written_outside_transaction(self):
+        """Jobs are committed before their files are written"""
+        depths = []
+        write_job_files = Job.objects._write_job_files
+
+        def record_depth(*args):
+            depths.append(len(connection.atomic_blocks))
+            return write_job_files(*args)
+
+        depth = len(connection.atomic_blocks)
+        with patch.object(Job.objects, "_write_job_files", record_depth):
+            Job.objects.create_jobs(
+                "",
+                [{"file2": SimpleUploadedFile(name, b"b")} for name in "ab"],
+                self.project,
+                0,
+                0,
+                asynchronous=False,
+            )
+        self.assertEqual(depths, [depth, depth])
+
+    def test_failed_sweep_file_writing(self):
+        """No jobs or working directories are left if a job's files cannot be
+        written"""
+        with patch(
+            "main.models.JobManager._save_input",
+            side_effect=[None, IsADirectoryError],
+        ), self.assertRaises(IsADirectoryError):
+            Job.objects.create_jobs(
+                "",
+                [{"file2": SimpleUploadedFile(name, b"b")} for name in "ab"],
+                self.project,
+                0,
+                0,
+                asynchronous=False,
+            )
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(list(Path(self.tmp_dir.name).glob("*")), [])
+
+    def test_update_statuses(self):
+        """Status of all incomplete jobs is updated with one scheduler query"""
+        seconds = 900
+        jobs = [create_dummy_job(project=self.project) for _ in range(3)]
+        self.scheduler.job_starts(jobs[1].job_id)
+        self.scheduler.job_starts(jobs[2].job_id)
+        self.scheduler.job_finishes(jobs[2].job_id)
+        with open(jobs[2].work_dir / "WALLTIME", "w") as f:
+            f.write(f"{seconds}")
+
+        with patch(
+            "main.scheduler.status_many", wraps=self.scheduler.status_many
+        ) as status_many:
+            self.assertEqual(Job.objects.update_statuses(), 2)
+        status_many.assert_called_once()
+
+        for job in jobs:
+            job.refresh_from_db()
+        self.assertEqual(
+            [job.status for job in jobs], [Job.QUEUEING, Job.RUNNING, Job.COMPLETED]
+        )
+        self.assertEqual(jobs[2].walltime, timedelta(seconds=seconds))
+
+        # completed jobs are not queried again
+        with patch("main.scheduler.status_many", return_value={}) as status_many:
+            Job.objects.update_statuses()
+        self.assertNotIn(jobs[2].job_id, list(status_many.call_args[0][0]))
+
+    def test_temporary_upload_linked(self):
+        """Uploads saved to disk by Django are hard linked rather than copied"""
+        upload = TemporaryUploadedFile("input.com", "text/plain", 5, None)
+        upload.write(b"input")
+        upload.flush()
+        # file2 is not deduplicated
+        job = Job.objects.create_job("", {"file2": upload}, self.project, 0, 0)
+        path = job.work_dir / "input.com"
+        self.assertTrue(path.samefile(upload.temporary_file_path()))
+        self.assertFalse(InputBlob.objects.exists())
+        # the upload is still available after the temporary file is removed
+        upload.close()
+        with path.open("rb") as f:
+            self.assertEqual(f.read(), b"input")
+
+    def test_upload_copied_in_chunks(self):
+        """In memory uploads are written in chunks"""
+        content = b"x" * 100
+        upload = SimpleUploadedFile("input.com", content)
+        with patch("main.models.UPLOAD_CHUNK_SIZE", 10), patch.object(
+            upload, "chunks", wraps=upload.chunks
+        ) as chunks:
+            job = Job.objects.create_job("", {"file1": upload}, self.project, 0, 0)
+        chunks.assert_called_once_with(10)
+        with (job.work_dir / "input.com").open("rb") as f:
+            self.assertEqual(f.read(), content)
+
+    def test_inputs_deduplicated(self):
+        """Identical input files are stored once and removed with the last job"""
+        jobs = [
+            Job.objects.create_job(
+                "", {"file1": SimpleUploadedFile(name, b"input")}, self.project, 0, 0
+            )
+            for name in ("a.com", "b.com")
+        ]
+        (blob,) = InputBlob.objects.all()
+        self.assertEqual(blob.size, 5)
+        for job, name in zip(jobs, ("a.com", "b.com")):
+            self.assertTrue((job.work_dir / name).samefile(blob.path))
+
+        jobs[0].delete()
+        self.assertTrue(blob.path.exists())
+        jobs[1].delete()
+        self.assertFalse(blob.path.exists())
+        self.assertFalse(InputBlob.objects.exists())
+
+    def test_stored_permissions(self):
+        """Only write permission is removed from stored files"""
+        upload = TemporaryUploadedFile("input.com", "text/plain", 5, None)
+        upload.write(b"input")
+        upload.flush()
+        os.chmod(upload.temporary_file_path(), 0o640)
+        Job.objects.create_job("", {"file1": upload}, self.project, 0, 0)
+        (blob,) = InputBlob.objects.all()
+        self.assertEqual(stat.S_IMODE(blob.path.stat().st_mode), 0o440)
+        upload.close()
+
+    def test_inputs_copied(self):
+        """Inputs not marked deduplicate are copied for each job and writable"""
+        upload = TemporaryUploadedFile("input.fchk", "text/plain", 5, None)
+        upload.write(b"input")
+        upload.flush()
+        jobs = Job.objects.create_jobs(
+            "",
+            [
+                {"file1": SimpleUploadedFile(name, b"a"), "file2": upload}
+                for name in "ab"
+            ],
+            self.project,
+            0,
+            0,
+            asynchronous=False,
+        )
+        paths = [job.work_dir / "input.fchk" for job in jobs]
+        self.assertFalse(paths[0].samefile(paths[1]))
+        self.assertFalse(paths[0].samefile(upload.temporary_file_path()))
+        with paths[0].open("ab") as f:
+            f.write(b" modified")
+        self.assertEqual(paths[1].read_bytes(), b"input")
+        # only the deduplicated input is stored
+        self.assertEqual(InputBlob.objects.count(), 1)
+        upload.close()
+
+    def test_store_lock(self):
+        """The store lock excludes other processes with flock and is reentrant"""
+        lock_path = Path(self.tmp_dir.name) / "blobs" / ".lock"
+        with InputBlob.objects.lock, InputBlob.objects.lock:
+            with open(lock_path) as f, self.assertRaises(BlockingIOError):
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        with open(lock_path) as f:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def test_stored_outside_lock(self):
+        """Files are read without holding the store lock"""
+        held = []
+
+        class LockCheckingFile(BytesIO):
+            def read(self, *args):
+                held.append(InputBlob.objects.lock._depth > 0)
+                return super().read(*args)
+
+        inp = LockCheckingFile(b"input")
+        inp.name = "input.com"
+        Job.objects.create_job("", {"file1": inp}, self.project, 0, 0)
+        self.assertTrue(held)
+        self.assertFalse(any(held))
+        (blob,) = InputBlob.objects.all()
+        self.assertEqual(blob.path.read_bytes(), b"input")
+        # only the lock file and stored file remain in the store
+        self.assertEqual(
+            sorted(path.name for path in blob.path.parent.parent.rglob("*")),
+            sorted([".lock", blob.digest[:2], blob.digest]),
+        )
+
+    def test_pruned_after_storing(self):
+        """A file is stored again if it is pruned by another process before it is
+        linked"""
+        store = InputBlob.objects.store
+        stored = []
+
+        def store_and_prune(input_file):
+            blob = store(input_file)
+            if not stored:
+                blob.path.unlink()
+            stored.append(blob)
+            return blob
+
+        with patch.object(InputBlob.objects, "store", store_and_prune):
+            job = Job.objects.create_job(
+                "", {"file1": SimpleUploadedFile("a.com", b"a")}, self.project, 0, 0
+            )
+        self.assertEqual(len(stored), 2)
+        self.assertTrue((job.work_dir / "a.com").samefile(stored[-1].path))
+
+    def create_job_array(self, n=3):
+        inputs = []
+        for i in range(n):
+            inp = BytesIO(b"input")
+            inp.name = f"input{i}.com"
+            inputs.append({"file1": inp})
+        return Job.objects.create_job_array("", inputs, self.project, 0, 0)
+
+    def test_create_job_array(self):
+        """Jobs have their own directories and are submitted as one array"""
+        jobs = self.create_job_array()
+        array = JobArray.objects.get()
+        self.assertIn(array.job_id, self.scheduler.queued_jobs)
+        self.assertEqual(len(self.scheduler.queued_jobs), 1)
+        self.assertEqual([job.array_index for job in jobs], [1, 2, 3])
+
+        with (array.work_dir / "ARRAY_DIRS").open() as f:
+            self.assertEqual(f.read().split(), [str(job.work_dir) for job in jobs])
+        with (array.work_dir / "sub.sh").open() as f:
+            self.assertIn(str(array.work_dir / "ARRAY_DIRS"), f.read())
+        for i, job in enumerate(jobs):
+            with (job.work_dir / "sub.sh").open() as f:
+                self.assertIn(f"input{i}.com", f.read())
+
+    @patch("main.scheduler.submit", raise_scheduler_error)
+    def test_failed_job_array_creation(self):
+        """No mess is left if job array submission fails"""
+        with self.assertRaises(SchedulerError):
+            self.create_job_array()
+        self.assertEqual(Job.objects.count(), 0)
+        self.assertEqual(JobArray.objects.count(), 0)
+        self.assertEqual(
+            [
+                path
+                for path in Path(self.tmp_dir.name).glob("*/*")
+                if path.name != ".lock"
+            ],
+            [],
+        )
+
+    def test_job_array_statuses(self):
+        """Job array tasks are updated from the status of the array"""
+        jobs = self.create_job_array()
+        array = JobArray.objects.get()
+        self.scheduler.job_starts(array.job_id)
+        self.scheduler.array_tasks[array.job_id] = {
+            "1": dict(id="task1", status="running"),
+            "2": dict(id="task2", status="completed"),
+        }
+        with patch(
+            "main.scheduler.array_status", wraps=self.scheduler.array_status
+        ) as array_status:
+            Job.objects.update_statuses()
+        array_status.assert_called_once()
+
+        for job in jobs:
+            job.refresh_from_db()
+        # the third task is no longer listed so has finished
+        self.assertEqual(
+            [job.status for job in jobs], [Job.RUNNING, Job.COMPLETED, Job.COMPLETED]
+        )
+        self.assertEqual(jobs[1].job_id, "task2")
+
+    def test_job_array_no_tasks(self):
+        """Tasks take the status of the array if no tasks are listed"""
+        jobs = self.create_job_array(n=2)
+        self.scheduler.job_starts(JobArray.objects.get().job_id)
+        Job.objects.update_statuses()
+        for job in jobs:
+            job.refresh_from_db()
+            self.assertEqual(job.status, Job.RUNNING)
+
+    def test_job_array_deletion(self):
+        """The array is deleted along with its last job"""
+        jobs = self.create_job_array(n=2)
+        array = JobArray.objects.get()
+        jobs[0].delete()
+        self.assertTrue(array.work_dir.exists())
+        self.assertIn(array.job_id, self.scheduler.queued_jobs)
+        jobs[1].delete()
+        self.assertFalse(array.work_dir.exists())
+        self.assertEqual(JobArray.objects.count(), 0)
+        self.assertIn(array.job_id, self.scheduler.completed_jobs)
+
     def test_custom_config_validation(self):
         with self.assertRaises(ValidationError):
             CustomConfig(label="test", script_lines="").full_clean()
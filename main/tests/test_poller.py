@@ -0,0 +1,37 @@
+import threading
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+
+from .. import poller
+
+
+class TestStatusPoller(TestCase):
+    def test_polls_until_stopped(self):
+        """poll is called repeatedly until the poller is stopped"""
+        called = threading.Event()
+        with patch("main.poller.poll", called.set):
+            status_poller = poller.StatusPoller(0.01)
+            status_poller.start()
+            self.assertTrue(called.wait(5))
+            status_poller.stop()
+            status_poller.join(5)
+        self.assertFalse(status_poller.is_alive())
+
+    def test_unexpected_error(self):
+        """Unexpected exceptions are logged and do not stop polling"""
+        from ..models import Job
+
+        with patch("main.poller.fail_stale"), patch.object(
+            Job.objects, "update_statuses", side_effect=IndexError
+        ) as update_statuses, patch("main.poller.logger") as logger:
+            poller.poll()
+            poller.poll()
+        self.assertEqual(update_statuses.call_count, 2)
+        self.assertEqual(logger.exception.call_count, 2)
+
+    def test_disabled(self):
+        """An interval of 0 disables polling"""
+        settings = SimpleNamespace(POLLING=dict(interval=0))
+        with patch("main.poller.get_portal_settings", lambda: settings):
+            self.assertIsNone(poller.start_poller())
@@ -0,0 +1,239 @@
+import sys
+import threading
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from .. import scheduler
+from ..scheduler import (
+    SchedulerBridge,
+    SchedulerError,
+    SchedulerTimeout,
+    StatusCache,
+    _PendingLookup,
+    _task_id,
+    _task_indices,
+)
+
+# A stand in for ruby_scripts/bridge.rb that follows the same protocol. Commands
+# echo their first argument, except "fail" which errors, "sleep" which never
+# responds and "exit" which kills the worker.
+WORKER = """
+import json, os, sys, time
+for line in sys.stdin:
+    results = []
+    for command in json.loads(line):
+        if command["name"] == "fail":
+            results.append(dict(ok=False, error="failed"))
+        elif command["name"] == "sleep":
+            time.sleep(60)
+        elif command["name"] == "exit":
+            sys.exit(1)
+        else:
+            results.append(dict(ok=True, output=f"{command['args'][0]}:{os.getpid()}"))
+    print(json.dumps(results), flush=True)
+"""
+
+
+class TestSchedulerBridge(TestCase):
+    def setUp(self):
+        self.bridge = SchedulerBridge([sys.executable, "-c", WORKER])
+
+    def tearDown(self):
+        self.bridge.stop()
+
+    def run_one(self, name, arg="", timeout=5):
+        return self.bridge.run([(name, [arg], None)], timeout)[0]
+
+    def test_batch(self):
+        """Results are returned in order with failures as SchedulerError"""
+        results = self.bridge.run(
+            [("status", ["1"], None), ("fail", [], None), ("status", ["2"], None)], 5
+        )
+        self.assertTrue(results[0].startswith("1:"))
+        self.assertIsInstance(results[1], SchedulerError)
+        self.assertEqual(results[1].args[0], "failed")
+        self.assertTrue(results[2].startswith("2:"))
+
+    def test_persistent(self):
+        """The same worker process is used for successive commands"""
+        pid1 = self.run_one("status").split(":")[1]
+        pid2 = self.run_one("status").split(":")[1]
+        self.assertEqual(pid1, pid2)
+
+    def test_restart_after_crash(self):
+        """A worker that exits mid-command raises an error and is restarted"""
+        pid1 = self.run_one("status").split(":")[1]
+        with self.assertRaises(SchedulerError):
+            self.run_one("exit")
+        pid2 = self.run_one("status").split(":")[1]
+        self.assertNotEqual(pid1, pid2)
+
+    def test_timeout(self):
+        """A worker that does not respond is killed and restarted"""
+        with self.assertRaisesRegex(SchedulerError, "timed out"):
+            self.run_one("sleep", timeout=0.2)
+        self.assertTrue(self.run_one("status", "1").startswith("1:"))
+
+    def test_timeout_waiting(self):
+        """The timeout includes time spent waiting for a stalled worker in use by
+        another thread"""
+        stalled = threading.Thread(
+            target=lambda: self.assertRaises(
+                SchedulerError, self.run_one, "sleep", timeout=2
+            )
+        )
+        stalled.start()
+        time.sleep(0.2)
+        start = time.monotonic()
+        with self.assertRaises(SchedulerTimeout):
+            self.run_one("status", "1", timeout=0.3)
+        self.assertLess(time.monotonic() - start, 1)
+        stalled.join(5)
+        self.assertTrue(self.run_one("status", "1").startswith("1:"))
+
+    def test_submit_many(self):
+        """Several submissions are sent to the worker as one batch"""
+        with patch("main.scheduler.get_bridge", lambda: self.bridge), patch.object(
+            self.bridge, "run", wraps=self.bridge.run
+        ) as run:
+            job_ids = scheduler.submit_many([("a.sh", None), ("b.sh", None)])
+        run.assert_called_once()
+        self.assertEqual([job_id.split(":")[0] for job_id in job_ids], ["a.sh", "b.sh"])
+
+
+class TestArrayStatus(TestCase):
+    def test_task_indices(self):
+        self.assertEqual(_task_indices("123_4"), [4])
+        self.assertEqual(_task_indices("123[4].server"), [4])
+        self.assertEqual(_task_indices("123_[3-6]"), [3, 4, 5, 6])
+        self.assertEqual(_task_indices("123_[3-6%2]"), [3, 4, 5, 6])
+        self.assertEqual(_task_indices("123_[1,3,5-9:2%2]"), [1, 3, 5, 7, 9])
+        self.assertEqual(_task_indices("123[].server"), [])
+        self.assertEqual(_task_indices("123"), [])
+
+    def test_task_id(self):
+        self.assertEqual(_task_id("123_4", 4), "123_4")
+        self.assertEqual(_task_id("123_[3-6%2]", 5), "123_5")
+        self.assertEqual(_task_id("123[3-6].server", 5), "123[5].server")
+
+    def test_array_status(self):
+        """Pending tasks listed as a range are expanded"""
+        listing = {
+            "123": dict(
+                status="running",
+                tasks=[
+                    dict(id="123_1", status="running"),
+                    dict(id="123_[3-4%1]", status="queued"),
+                ],
+            )
+        }
+        with patch("main.scheduler.run_command", return_value=listing):
+            statuses = scheduler.array_status(["123"])
+        self.assertEqual(
+            statuses["123"]["tasks"],
+            {
+                "1": dict(id="123_1", status="running"),
+                "3": dict(id="123_3", status="queued"),
+                "4": dict(id="123_4", status="queued"),
+            },
+        )
+
+
+class TestStatusCache(TestCase):
+    def setUp(self):
+        self.fetched = []
+
+    def fetch(self, job_ids, status="running"):
+        self.fetched.append(job_ids)
+        return {job_id: status for job_id in job_ids}
+
+    def test_cached(self):
+        """Only job ids not already cached are fetched"""
+        cache = StatusCache(ttl=60, max_entries=10)
+        self.assertEqual(cache.get_many(["1"], self.fetch, 1), {"1": "running"})
+        self.assertEqual(
+            cache.get_many(["1", "2"], self.fetch, 1), {"1": "running", "2": "running"}
+        )
+        self.assertEqual(self.fetched, [["1"], ["2"]])
+
+    def test_expiry(self):
+        """Expired entries are fetched again, except for completed jobs"""
+        cache = StatusCache(ttl=0, max_entries=10)
+        cache.get_many(["1"], self.fetch, 1)
+        cache.get_many(["1"], self.fetch, 1)
+        self.assertEqual(self.fetched, [["1"], ["1"]])
+
+        cache.get_many(["2"], lambda ids: self.fetch(ids, "completed"), 1)
+        self.assertEqual(cache.get_many(["2"], self.fetch, 1), {"2": "completed"})
+        self.assertEqual(self.fetched, [["1"], ["1"], ["2"]])
+
+    def test_max_entries(self):
+        """Least recently used entries are discarded"""
+        cache = StatusCache(ttl=60, max_entries=2)
+        cache.get_many(["1", "2"], self.fetch, 1)
+        cache.get_many(["1"], self.fetch, 1)
+        cache.get_many(["3"], self.fetch, 1)
+        cache.get_many(["1", "2"], self.fetch, 1)
+        self.assertEqual(self.fetched, [["1", "2"], ["3"], ["2"]])
+
+    def test_invalidate(self):
+        cache = StatusCache(ttl=60, max_entries=10)
+        cache.get_many(["1"], self.fetch, 1)
+        cache.invalidate("1")
+        cache.get_many(["1"], self.fetch, 1)
+        self.assertEqual(self.fetched, [["1"], ["1"]])
+
+    def test_error(self):
+        """Errors are raised and nothing is cached"""
+
+        def fail(job_ids):
+            raise SchedulerError("failed")
+
+        cache = StatusCache(ttl=60, max_entries=10)
+        with self.assertRaises(SchedulerError):
+            cache.get_many(["1"], fail, 1)
+        cache.get_many(["1"], self.fetch, 1)
+        self.assertEqual(self.fetched, [["1"]])
+
+    def test_coalescing(self):
+        """Concurrent lookups of the same job share a single fetch"""
+        cache = StatusCache(ttl=60, max_entries=10)
+        started = threading.Event()
+        release = threading.Event()
+        waiting = threading.Event()
+
+        class Done(threading.Event):
+            def wait(self, timeout=None):
+                waiting.set()
+                return super().wait(timeout)
+
+        class Lookup(_PendingLookup):
+            def __init__(self):
+                super().__init__()
+                self.done = Done()
+
+        def slow_fetch(job_ids):
+            started.set()
+            release.wait(5)
+            return self.fetch(job_ids)
+
+        results = []
+        with patch("main.scheduler._PendingLookup", Lookup):
+            thread = threading.Thread(
+                target=lambda: results.append(cache.get_many(["1"], slow_fetch, 5))
+            )
+            thread.start()
+            self.assertTrue(started.wait(5))
+            waiter = threading.Thread(
+                target=lambda: results.append(cache.get_many(["1"], self.fetch, 5))
+            )
+            waiter.start()
+            # both lookups are in flight with the second waiting on the first
+            self.assertTrue(waiting.wait(5))
+            self.assertEqual(self.fetched, [])
+            release.set()
+            thread.join(5)
+            waiter.join(5)
+        self.assertEqual(results, [{"1": "running"}, {"1": "running"}])
+        self.assertEqual(self.fetched, [["1"]])
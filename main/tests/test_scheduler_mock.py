@@ -27,6 +27,18 @@ class TestJobSubmission(SchedulerTestCase):
         self.scheduler.job_finishes(job_id)
         self.assertEqual(status(job_id), "completed")
 
+    def test_status_many(self):
+        from main.scheduler import status_many, submit
+
+        job_id1 = submit("", "")
+        job_id2 = submit("", "")
+        self.scheduler.job_starts(job_id2)
+        self.assertEqual(
+            status_many([job_id1, job_id2]),
+            {job_id1: "queueing", job_id2: "running"},
+        )
+        self.assertEqual(status_many([]), {})
+
     def test_delete(self):
         from main.scheduler import delete, status, submit
 
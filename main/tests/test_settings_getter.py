@@ -21,3 +21,40 @@ class TestSettingsGetter(TestCase):
         self.assertEqual(timeouts["submit"], defaults["submit"])
         self.assertEqual(timeouts["status"], raw_settings["timeouts"]["status"])
         self.assertEqual(timeouts["delete"], defaults["delete"])
+
+    def test_polling_defaults(self):
+        config_path = TEST_DATA_PATH / "timeouts_test_config.yaml"
+        settings = SettingsGetter(config_path)()
+        self.assertEqual(settings.POLLING, SettingsGetter.defaults["polling"])
+
+    def test_caching_defaults(self):
+        config_path = TEST_DATA_PATH / "timeouts_test_config.yaml"
+        settings = SettingsGetter(config_path)()
+        self.assertEqual(settings.CACHING, SettingsGetter.defaults["caching"])
+
+    def test_compression_defaults(self):
+        config_path = TEST_DATA_PATH / "timeouts_test_config.yaml"
+        settings = SettingsGetter(config_path)()
+        self.assertEqual(settings.COMPRESSION, SettingsGetter.defaults["compression"])
+
+    def test_archive_cache_defaults(self):
+        config_path = TEST_DATA_PATH / "timeouts_test_config.yaml"
+        settings = SettingsGetter(config_path)()
+        self.assertEqual(
+            settings.ARCHIVE_CACHE, SettingsGetter.defaults["archive_cache"]
+        )
+
+    def test_sendfile_defaults(self):
+        config_path = TEST_DATA_PATH / "timeouts_test_config.yaml"
+        settings = SettingsGetter(config_path)()
+        self.assertEqual(settings.SENDFILE, SettingsGetter.defaults["sendfile"])
+
+    def test_tar_defaults(self):
+        config_path = TEST_DATA_PATH / "timeouts_test_config.yaml"
+        settings = SettingsGetter(config_path)()
+        self.assertEqual(settings.TAR, SettingsGetter.defaults["tar"])
+
+    def test_job_list_defaults(self):
+        config_path = TEST_DATA_PATH / "timeouts_test_config.yaml"
+        settings = SettingsGetter(config_path)()
+        self.assertEqual(settings.JOB_LIST, SettingsGetter.defaults["job_list"])
@@ -0,0 +1,172 @@
+from datetime import timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import Job, Project
+from ..poller import poll
+from ..portal_config import SettingsGetter
+from ..scheduler import SchedulerError, SchedulerTimeout
+from ..submission import STALE_ERROR, fail_stale, submit_job, submit_jobs
+from .scheduler_mock import SchedulerTestCase
+
+TEST_DATA_PATH = Path(__file__).absolute().parent / "test_data"
+
+
+@patch(
+    "main.portal_config.get_portal_settings._settings",
+    SettingsGetter(TEST_DATA_PATH / "test_config.yaml")(),
+)
+@patch("main.submission.time.sleep", lambda seconds: None)
+class TestAsynchronousSubmission(SchedulerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.project = Project.objects.create(name="test")
+
+    def create_job(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            job = Job.objects.create_job("", {}, self.project, 0, 0, asynchronous=True)
+        self.assertEqual(len(callbacks), 1)
+        return job
+
+    def test_submission(self):
+        """Job is created as SUBMITTING and updated once submitted"""
+        job = self.create_job()
+        self.assertEqual(job.status, Job.SUBMITTING)
+        self.assertEqual(job.job_id, "")
+        self.assertEqual(job.walltime, "N/A")
+
+        job_id = submit_job(job.pk, job.work_dir / "sub.sh", job.work_dir)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUEING)
+        self.assertEqual(job.job_id, job_id)
+        self.assertIn(job_id, self.scheduler.queued_jobs)
+
+    def test_retry(self):
+        """Failed submissions are retried"""
+        job = self.create_job()
+        errors = [SchedulerError("failed")]
+
+        def flaky_submit(*args, **kwargs):
+            if errors:
+                raise errors.pop()
+            return self.scheduler.submit(*args, **kwargs)
+
+        with patch("main.scheduler.submit", flaky_submit):
+            job_id = submit_job(job.pk, job.work_dir / "sub.sh", job.work_dir)
+        job.refresh_from_db()
+        self.assertEqual(job.job_id, job_id)
+        self.assertEqual(job.status, Job.QUEUEING)
+
+    def test_failure(self):
+        """Job is kept and marked as FAILED when all retries fail"""
+        job = self.create_job()
+        with patch(
+            "main.scheduler.submit", side_effect=SchedulerError("failed")
+        ) as submit:
+            self.assertIsNone(submit_job(job.pk, job.work_dir / "sub.sh", job.work_dir))
+        self.assertEqual(submit.call_count, 4)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.submission_error, "failed")
+        self.assertTrue(job.work_dir.exists())
+
+    def test_timeout_not_retried(self):
+        """A timed out submission may have succeeded so is not retried"""
+        job = self.create_job()
+        with patch(
+            "main.scheduler.submit", side_effect=SchedulerTimeout("timed out")
+        ) as submit:
+            submit_job(job.pk, job.work_dir / "sub.sh", job.work_dir)
+        self.assertEqual(submit.call_count, 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+
+    def test_deleted(self):
+        """Jobs deleted before submission are not submitted"""
+        job = self.create_job()
+        job_pk = job.pk
+        job.delete()
+        self.assertIsNone(submit_job(job_pk, "", ""))
+        self.assertEqual(self.scheduler.queued_jobs, set())
+
+    def test_stale(self):
+        """Jobs left waiting for submission, e.g. by a restarted process, are failed
+        and not submitted later"""
+        stale = self.create_job()
+        recent = self.create_job()
+        Job.objects.filter(pk=stale.pk).update(
+            submission_time=timezone.now() - timedelta(seconds=901)
+        )
+        self.assertEqual(fail_stale(0), 0)
+        self.assertEqual(fail_stale(900), 1)
+        stale.refresh_from_db()
+        recent.refresh_from_db()
+        self.assertEqual(stale.status, Job.FAILED)
+        self.assertEqual(stale.submission_error, STALE_ERROR)
+        self.assertEqual(recent.status, Job.SUBMITTING)
+
+        self.assertIsNone(submit_job(stale.pk, stale.work_dir / "sub.sh", ""))
+        self.assertEqual(self.scheduler.queued_jobs, set())
+
+    def test_poll_fails_stale(self):
+        """Stale submissions are failed by the status poller"""
+        job = self.create_job()
+        Job.objects.filter(pk=job.pk).update(
+            submission_time=timezone.now() - timedelta(days=1)
+        )
+        poll()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+
+    def test_batch(self):
+        """Jobs are submitted as one batch with only failed submissions retried"""
+        jobs = [self.create_job() for _ in range(3)]
+        errors = [SchedulerError("failed")]
+
+        def flaky_submit(*args, **kwargs):
+            if errors and args[0] == jobs[1].work_dir / "sub.sh":
+                raise errors.pop()
+            return self.scheduler.submit(*args, **kwargs)
+
+        with patch("main.scheduler.submit", flaky_submit), patch(
+            "main.scheduler.submit_many", wraps=self.scheduler.submit_many
+        ) as submit_many:
+            job_ids = submit_jobs(
+                [(job.pk, job.work_dir / "sub.sh", job.work_dir) for job in jobs]
+            )
+        self.assertEqual(submit_many.call_count, 2)
+        self.assertEqual(len(submit_many.call_args_list[0].args[0]), 3)
+        self.assertEqual(len(submit_many.call_args_list[1].args[0]), 1)
+        for job, job_id in zip(jobs, job_ids):
+            job.refresh_from_db()
+            self.assertEqual(job.status, Job.QUEUEING)
+            self.assertEqual(job.job_id, job_id)
+
+    def test_batch_timeout(self):
+        """A timed out batch fails all of its jobs without retrying"""
+        jobs = [self.create_job() for _ in range(2)]
+        with patch(
+            "main.scheduler.submit_many", side_effect=SchedulerTimeout("timed out")
+        ) as submit_many:
+            job_ids = submit_jobs(
+                [(job.pk, job.work_dir / "sub.sh", job.work_dir) for job in jobs]
+            )
+        self.assertEqual(submit_many.call_count, 1)
+        self.assertEqual(job_ids, [None, None])
+        self.assertEqual(Job.objects.filter(status=Job.FAILED).count(), 2)
+
+    def test_create_jobs_in_transaction(self):
+        """Synchronous bulk submission completes within an enclosing transaction"""
+        with patch(
+            "main.scheduler.submit_many", wraps=self.scheduler.submit_many
+        ) as submit_many, transaction.atomic():
+            jobs = Job.objects.create_jobs(
+                "", [{}, {}], self.project, 0, 0, asynchronous=False
+            )
+            self.assertEqual(submit_many.call_count, 1)
+            for job in jobs:
+                self.assertEqual(job.status, Job.QUEUEING)
+                self.assertIn(job.job_id, self.scheduler.queued_jobs)
@@ -0,0 +1,63 @@
+import io
+import os
+import tarfile
+from pathlib import Path
+from unittest.mock import patch
+
+import zstandard
+
+from ..tar_stream import _tar_info, tarfile_generator
+from .test_zip_stream import ZipStreamTestCase
+
+
+class TestTarStream(ZipStreamTestCase):
+    def read(self, data):
+        with tarfile.open(fileobj=io.BytesIO(data)) as tf:
+            return {
+                member.name: tf.extractfile(member).read() for member in tf.getmembers()
+            }
+
+    def test_gzip(self):
+        data = b"".join(tarfile_generator("job", self.paths, "gz"))
+        self.assertEqual(data[:2], b"\x1f\x8b")
+        self.assertEqual(
+            self.read(data),
+            {f"job/file{i}.txt": bytes([i]) * 1000 for i in range(3)},
+        )
+
+    def test_root(self):
+        """Files keep their path relative to root, including long paths"""
+        sub_dir = Path(self.tmp_dir.name, "sub" * 50)
+        sub_dir.mkdir()
+        (sub_dir / "data.log").write_text("data")
+        data = b"".join(
+            tarfile_generator(
+                "job", [sub_dir / "data.log"], "gz", root=Path(self.tmp_dir.name)
+            )
+        )
+        self.assertEqual(self.read(data), {f"job/{'sub' * 50}/data.log": b"data"})
+
+    def test_chunk_size(self):
+        self.paths[0].write_bytes(os.urandom(200000))
+        with patch("main.tar_stream.CHUNK_SIZE_BYTES", 50000):
+            chunks = list(tarfile_generator("job", self.paths, "gz"))
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk) >= 50000 for chunk in chunks[:-1]))
+
+    def test_changed(self):
+        """Files that shrink whilst being read are an error"""
+
+        def tar_info(*args):
+            info = _tar_info(*args)
+            info.size += 1
+            return info
+
+        with patch("main.tar_stream._tar_info", tar_info):
+            with self.assertRaises(OSError):
+                list(tarfile_generator("job", self.paths, "gz"))
+
+    def test_zstd(self):
+        data = b"".join(tarfile_generator("job", self.paths, "zst", threads=2))
+        with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)) as reader:
+            data = reader.read()
+        self.assertEqual(len(self.read(data)), 3)
@@ -0,0 +1,75 @@
+import os
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from ..utils import FileIndexCache, parse_range, scan_directory
+
+
+class TestScanDirectory(TestCase):
+    def test_entries(self):
+        with TemporaryDirectory() as tmp_dir:
+            (Path(tmp_dir) / "file").write_text("abc")
+            (Path(tmp_dir) / "dir").mkdir()
+            entries = sorted(scan_directory(tmp_dir), key=lambda x: x["name"])
+        self.assertEqual([entry["name"] for entry in entries], ["dir", "file"])
+        self.assertEqual([entry["is_file"] for entry in entries], [False, True])
+        self.assertEqual(entries[1]["file_size"], 3)
+
+
+class TestFileIndexCache(TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_cached(self):
+        cache = FileIndexCache(10)
+        listing = cache.get(self.path)
+        self.assertIs(cache.get(self.path), listing)
+
+    def test_directory_changed(self):
+        """Listings are read again once the directory is modified"""
+        cache = FileIndexCache(10)
+        self.assertEqual(cache.get(self.path), [])
+        (self.path / "file").touch()
+        os.utime(self.path, ns=(0, 0))
+        self.assertEqual([entry["name"] for entry in cache.get(self.path)], ["file"])
+
+    def test_max_entries(self):
+        cache = FileIndexCache(1)
+        with TemporaryDirectory() as other:
+            cache.get(self.path)
+            cache.get(other)
+            with patch("main.utils.scan_directory", return_value=[]) as scan:
+                cache.get(self.path)
+        scan.assert_called_once_with(self.path)
+
+
+class TestParseRange(TestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_range("bytes=0-9", 100), (0, 10))
+        self.assertEqual(parse_range("bytes=90-200", 100), (90, 100))
+        self.assertEqual(parse_range("bytes=50-", 100), (50, 100))
+        self.assertEqual(parse_range("bytes=-10", 100), (90, 100))
+        self.assertEqual(parse_range("bytes=-200", 100), (0, 100))
+
+    def test_ignored(self):
+        """Ranges that are not understood result in the whole resource"""
+        for header in (
+            None,
+            "",
+            "items=0-1",
+            "bytes=0-1,5-6",
+            "bytes=a-b",
+            "bytes=5-1",
+        ):
+            self.assertIsNone(parse_range(header, 100), header)
+
+    def test_unsatisfiable(self):
+        for header in ("bytes=100-", "bytes=-0"):
+            with self.assertRaises(ValueError):
+                parse_range(header, 100)
@@ -1,12 +1,16 @@
 import shutil
+import tarfile
 import zipfile
 from datetime import timedelta
 from io import BytesIO
 from pathlib import Path
 from unittest.mock import patch
 
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
 from ..models import (
     ROUNDING_INTERVAL,
@@ -16,11 +20,13 @@ from ..models import (
     Profile,
     Project,
     Publication,
+    StagedUpload,
     Token,
 )
-from ..portal_config import SettingsGetter
+from ..portal_config import SettingsGetter, get_portal_settings
 from ..resources import get_resource
 from ..software import get_software
+from ..utils import FileIndexCache
 from . import create_dummy_job
 from .repository_mock import MockRepository
 from .scheduler_mock import (
@@ -139,6 +145,202 @@ class TestCreateJobViews(SchedulerTestCase):
         self.assertIn(self.custom_lines, contents)
 
 
+class TestUploadViews(SchedulerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.content = b"0123456789"
+
+    def start_upload(self, filename="test.com"):
+        response = self.client.post(
+            "/uploads/", {"filename": filename, "size": len(self.content)}
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def put(self, state, offset, chunk):
+        return self.client.put(
+            state["url"],
+            chunk,
+            content_type="application/octet-stream",
+            HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_chunked_upload(self):
+        state = self.start_upload()
+        self.assertEqual(state["offset"], 0)
+        response = self.put(state, 0, self.content[:4])
+        self.assertEqual(response.json()["offset"], 4)
+        response = self.put(state, 4, self.content[4:])
+        self.assertEqual(response.json()["offset"], len(self.content))
+
+        upload = StagedUpload.objects.get()
+        self.assertTrue(upload.complete)
+        with upload.path.open("rb") as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_resume(self):
+        """A chunk sent at the wrong offset is rejected with the offset to resume
+        from"""
+        state = self.start_upload()
+        self.put(state, 0, self.content[:4])
+        response = self.put(state, 2, self.content[2:])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["offset"], 4)
+        self.assertEqual(self.client.get(state["url"]).json()["offset"], 4)
+
+    def test_chunk_too_large(self):
+        state = self.start_upload()
+        response = self.put(state, 0, self.content + b"extra")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(StagedUpload.objects.get().offset, 0)
+
+    def test_invalid_filename(self):
+        """Names that cannot be used as a file in a job directory are rejected"""
+        for filename in ("", ".", "..", "dir/..", "a\x00b"):
+            response = self.client.post(
+                "/uploads/", {"filename": filename, "size": len(self.content)}
+            )
+            self.assertEqual(response.status_code, 400, filename)
+            self.assertIn("filename", response.json()["errors"])
+        self.assertFalse(StagedUpload.objects.exists())
+
+    def test_expired_uploads_removed(self):
+        state = self.start_upload()
+        StagedUpload.objects.update(created=timezone.now() - timedelta(days=2))
+        self.start_upload()
+        self.assertFalse(StagedUpload.objects.filter(pk=state["id"]).exists())
+
+    def test_create_job_with_staged_upload(self):
+        """Staged uploads are referred to by id and removed once used"""
+        state = self.start_upload()
+        self.put(state, 0, self.content)
+        project = Project.objects.create(name="test")
+        response = self.client.post(
+            f"/create_job/{project.pk}/0/0/", {"file1_upload": state["id"]}
+        )
+        job = Job.objects.get()
+        self.assertRedirects(response, f"/list_jobs/?success={job.pk}")
+        with (job.work_dir / "test.com").open("rb") as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertFalse(StagedUpload.objects.exists())
+
+    def test_create_job_with_incomplete_upload(self):
+        state = self.start_upload()
+        self.put(state, 0, self.content[:4])
+        project = Project.objects.create(name="test")
+        response = self.client.post(
+            f"/create_job/{project.pk}/0/0/", {"file1_upload": state["id"]}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("file1", response.context["form"].errors)
+        self.assertFalse(Job.objects.exists())
+
+
+class TestBulkCreateJobViews(SchedulerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.project = Project.objects.create(name="test")
+        self.url = f"/bulk_create_job/{self.project.pk}/0/0/"
+
+    def test_get(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("sweep_files", response.context["form"].fields)
+
+    def test_create_job_links_to_bulk(self):
+        response = self.client.get(f"/create_job/{self.project.pk}/0/0/")
+        self.assertEqual(response.context["bulk_url"], self.url)
+
+    def test_post_files(self):
+        """One job is created for each file given for the varied input"""
+        with (TEST_DATA_PATH / "test.com").open() as f, (
+            TEST_DATA_PATH / "test.fchk"
+        ).open() as f2:
+            response = self.client.post(
+                self.url, {"sweep_key": "file1", "sweep_files": [f, f2]}
+            )
+        self.assertEqual(response.status_code, 200)
+        rows = response.context["table"].data.data
+        self.assertEqual([row["input_file"] for row in rows], ["test.com", "test.fchk"])
+
+        jobs = Job.objects.order_by("pk")
+        self.assertEqual(len(jobs), 2)
+        for job, name in zip(jobs, ("test.com", "test.fchk")):
+            self.assertEqual(job.status, Job.QUEUEING)
+            self.assertIn(job.job_id, self.scheduler.queued_jobs)
+            with (job.work_dir / "sub.sh").open() as f:
+                self.assertIn(name, f.read())
+
+    def test_post_archive_with_shared_file(self):
+        """Archive members are used for the varied input and other files shared"""
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("inputs/", "")
+            zf.writestr("inputs/a.com", "a")
+            zf.writestr("inputs/b.com", "b")
+            # ignored metadata and hidden files
+            zf.writestr("__MACOSX/inputs/._a.com", "")
+            zf.writestr("inputs/.DS_Store", "")
+            zf.writestr(".hidden/c.com", "c")
+        archive.seek(0)
+        archive.name = "inputs.zip"
+        with (TEST_DATA_PATH / "test.fchk").open() as f:
+            response = self.client.post(
+                self.url, {"sweep_key": "file1", "sweep_archive": archive, "file2": f}
+            )
+        self.assertEqual(response.status_code, 200)
+        jobs = Job.objects.order_by("pk")
+        self.assertEqual(len(jobs), 2)
+        for job, name in zip(jobs, ("a.com", "b.com")):
+            self.assertEqual(job.status, Job.QUEUEING)
+            self.assertEqual(
+                sorted(path.name for path in job.work_dir.glob("*")),
+                sorted([name, "sub.sh", "test.fchk"]),
+            )
+            with (job.work_dir / "sub.sh").open() as f:
+                self.assertIn(name, f.read())
+
+    def test_post_array(self):
+        """Jobs can be submitted as a single job array"""
+        with (TEST_DATA_PATH / "test.com").open() as f, (
+            TEST_DATA_PATH / "test.fchk"
+        ).open() as f2:
+            response = self.client.post(
+                self.url,
+                {"sweep_key": "file1", "sweep_files": [f, f2], "use_array": True},
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Job.objects.exclude(array=None).count(), 2)
+        self.assertEqual(len(self.scheduler.queued_jobs), 1)
+
+    def test_post_missing_required(self):
+        """Required inputs that are not varied must be provided"""
+        with (TEST_DATA_PATH / "test.fchk").open() as f:
+            response = self.client.post(
+                self.url, {"sweep_key": "file2", "sweep_files": [f]}
+            )
+        self.assertIn("file1", response.context["form"].errors)
+        self.assertEqual(Job.objects.count(), 0)
+
+    def test_post_empty_archive(self):
+        """Archives containing only hidden files are rejected"""
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("__MACOSX/._a.com", "")
+        archive.seek(0)
+        archive.name = "inputs.zip"
+        response = self.client.post(
+            self.url, {"sweep_key": "file1", "sweep_archive": archive}
+        )
+        self.assertIn("sweep_archive", response.context["form"].errors)
+        self.assertEqual(Job.objects.count(), 0)
+
+    def test_post_no_files(self):
+        response = self.client.post(self.url, {"sweep_key": "file1"})
+        self.assertTrue(response.context["form"].non_field_errors())
+        self.assertEqual(Job.objects.count(), 0)
+
+
 class TestListViews(SchedulerTestCase):
     def test_list_jobs(self):
         seconds = 1000
@@ -154,6 +356,7 @@ class TestListViews(SchedulerTestCase):
         self.scheduler.job_starts(job.job_id)
         with open(job.work_dir / "WALLTIME", "w") as f:
             f.write(f"{seconds}")
+        Job.objects.update_statuses()
 
         response = self.client.get("/list_jobs/")
         jobs = response.context["table"].data.data
@@ -162,6 +365,7 @@ class TestListViews(SchedulerTestCase):
         self.assertEqual(jobs[0].walltime, timedelta(seconds=seconds))
 
         self.scheduler.job_finishes(job.job_id)
+        Job.objects.update_statuses()
 
         response = self.client.get("/list_jobs/")
         jobs = response.context["table"].data.data
@@ -172,6 +376,120 @@ class TestListViews(SchedulerTestCase):
             round(timedelta(seconds=seconds) / ROUNDING_INTERVAL) * ROUNDING_INTERVAL,
         )
 
+    def test_list_jobs_no_scheduler_query(self):
+        """Job status is read from the database without querying the scheduler"""
+        job = create_dummy_job()
+        self.scheduler.job_starts(job.job_id)
+        with patch("main.scheduler.status_many") as status_many, patch(
+            "main.scheduler.status"
+        ) as status:
+            response = self.client.get("/list_jobs/")
+        status_many.assert_not_called()
+        status.assert_not_called()
+        jobs = response.context["table"].data.data
+        self.assertEqual(jobs[0].status, Job.QUEUEING)
+
+    def test_list_jobs_queries(self):
+        """The number of queries does not depend on the number of jobs listed"""
+
+        def add_jobs(count):
+            project = Project.objects.create(name="project")
+            for _ in range(count):
+                job = create_dummy_job(project=project)
+                job.status = Job.COMPLETED
+                job.save()
+                Publication.objects.create(
+                    job=job, repo_label="label", repo_name="name", doi=f"doi{job.pk}"
+                )
+
+        add_jobs(1)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/list_jobs/")
+        add_jobs(14)
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get("/list_jobs/")
+        self.assertContains(response, "https://doi.org/doi15")
+
+    def test_filter_choices(self):
+        """Filter choices are the configured values plus those of past jobs,
+        without querying all jobs for every request"""
+        Job.objects.clear_distinct_values()
+        Job.objects.create(status=Job.COMPLETED, software="old", resources="old")
+        response = self.client.get("/list_jobs/")
+        choices = [
+            value
+            for value, _ in response.context["filter"].form["software"].field.choices
+        ]
+        self.assertIn("old", choices)
+        self.assertIn(get_software()[0]["name"], choices)
+
+        create_dummy_job()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/list_jobs/")
+        self.assertFalse(
+            any("DISTINCT" in query["sql"] for query in queries.captured_queries)
+        )
+
+    def test_published_prefetched(self):
+        job = create_dummy_job()
+        Publication.objects.create(
+            job=job, repo_label="label", repo_name="name", doi="doi"
+        )
+        job = Job.objects.prefetch_related("publication_set").get(pk=job.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(job.published)
+
+
+class TestKeysetListViews(TestCase):
+    def setUp(self):
+        patcher = patch.dict(get_portal_settings().JOB_LIST, keyset_threshold=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.jobs = [Job.objects.create(status=Job.COMPLETED) for _ in range(25)]
+        self.pks = [job.pk for job in reversed(self.jobs)]
+
+    def page(self, **params):
+        response = self.client.get("/list_jobs/", {"per_page": 10, **params})
+        pks = [job.pk for job in response.context["table"].data.data]
+        return pks, response.context["keyset"]
+
+    def test_pages(self):
+        pks, keyset = self.page()
+        self.assertEqual(pks, self.pks[:10])
+        self.assertEqual(keyset, {"older": self.pks[9], "newer": None})
+
+        pks, keyset = self.page(before=keyset["older"])
+        self.assertEqual(pks, self.pks[10:20])
+        self.assertEqual(keyset, {"older": self.pks[19], "newer": self.pks[10]})
+
+        pks, keyset = self.page(before=keyset["older"])
+        self.assertEqual(pks, self.pks[20:])
+        self.assertEqual(keyset["older"], None)
+
+        pks, keyset = self.page(after=keyset["newer"])
+        self.assertEqual(pks, self.pks[10:20])
+
+    def test_filtered(self):
+        """Filters are kept when moving between pages"""
+        for job in self.jobs[::2]:
+            job.status = Job.FAILED
+            job.save()
+        pks, keyset = self.page(status=Job.FAILED)
+        self.assertEqual(pks, self.pks[::2][:10])
+        response = self.client.get(
+            "/list_jobs/", {"per_page": 10, "status": Job.FAILED}
+        )
+        self.assertContains(response, f"status={Job.FAILED}")
+        self.assertContains(response, f"before={keyset['older']}")
+
+    def test_no_count(self):
+        """Pages are found without counting or offsetting"""
+        with CaptureQueriesContext(connection) as queries:
+            self.page(before=self.pks[10])
+        for query in queries.captured_queries:
+            self.assertNotIn("COUNT", query["sql"])
+            self.assertNotIn("OFFSET", query["sql"])
+
 
 class TestDeleteViews(SchedulerTestCase):
     def test_delete(self):
@@ -223,6 +541,23 @@ class TestProjectViews(TestCase):
         response = self.client.get("/projects/")
         self.assertEqual(response.status_code, 200)
 
+    def test_job_stats(self):
+        """Job counts and walltimes come from a single query for all projects"""
+        for name in ("first", "second"):
+            project = Project.objects.create(name=name)
+            for status in (Job.COMPLETED, Job.COMPLETED, Job.RUNNING):
+                Job.objects.create(
+                    status=status, project=project, _walltime=timedelta(hours=1)
+                )
+        with self.assertNumQueries(1):
+            response = self.client.get("/projects/")
+        project = response.context["projects"][1]
+        self.assertEqual(project.number_of_jobs, 3)
+        self.assertEqual(project.completed_jobs, 2)
+        self.assertEqual(project.running_jobs, 1)
+        self.assertEqual(project.failed_jobs, 0)
+        self.assertEqual(project.total_walltime, timedelta(hours=3))
+
     def test_post(self):
         response = self.client.post("/projects/", {"name": "test"})
         self.assertRedirects(response, "/")
@@ -398,6 +733,102 @@ class TestDownloadView(SchedulerTestCase):
             with (TEST_DATA_PATH / self.test_input).open("rb") as f2:
                 self.assertEqual(f.read(), f2.read())
 
+    def download(self, **params):
+        self.job.status = Job.COMPLETED
+        self.job.save()
+        (self.job.work_dir / "output").mkdir()
+        (self.job.work_dir / "output" / "result.log").write_text("result")
+        (self.job.work_dir / "output" / "scratch.chk").write_text("x" * 100)
+        response = self.client.get(f"/download/{self.job.pk}/", params)
+        zf = zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
+        return sorted(name.split("/", 1)[1] for name in zf.namelist())
+
+    def test_sub_directories(self):
+        self.assertEqual(
+            self.download(),
+            ["output/result.log", "output/scratch.chk", "sub.sh", "test.com"],
+        )
+
+    def test_include_exclude(self):
+        """Patterns apply to the contents of matching directories"""
+        self.assertEqual(
+            self.download(include=["output", "*.com"], exclude=["*.chk", ""]),
+            ["output/result.log", "test.com"],
+        )
+
+    def test_max_size(self):
+        self.assertNotIn("output/scratch.chk", self.download(max_size=50))
+
+    def test_invalid_max_size(self):
+        self.job.status = Job.COMPLETED
+        self.job.save()
+        response = self.client.get(f"/download/{self.job.pk}/", {"max_size": "big"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_range(self):
+        """Stored archives have a known length and may be downloaded in parts"""
+        self.job.status = Job.COMPLETED
+        self.job.save()
+        url = f"/download/{self.job.pk}/"
+        response = self.client.get(url)
+        archive = b"".join(response.streaming_content)
+        self.assertEqual(response["Content-Length"], str(len(archive)))
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+
+        response = self.client.get(url, HTTP_RANGE="bytes=100-")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(
+            response["Content-Range"], f"bytes 100-{len(archive) - 1}/{len(archive)}"
+        )
+        self.assertEqual(b"".join(response.streaming_content), archive[100:])
+
+        response = self.client.get(
+            url, HTTP_RANGE="bytes=-10", HTTP_IF_RANGE=response["ETag"]
+        )
+        self.assertEqual(b"".join(response.streaming_content), archive[-10:])
+
+        response = self.client.get(url, HTTP_RANGE="bytes=10-", HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), archive)
+
+        response = self.client.get(url, HTTP_RANGE=f"bytes={len(archive)}-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{len(archive)}")
+
+    def test_compressed_no_range(self):
+        """Compressed archives are always sent in full"""
+        self.job.status = Job.COMPLETED
+        self.job.save()
+        with patch.dict(get_portal_settings().COMPRESSION, method="deflated"):
+            response = self.client.get(
+                f"/download/{self.job.pk}/", HTTP_RANGE="bytes=100-"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Accept-Ranges", response)
+        zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
+
+    def test_tar(self):
+        self.job.status = Job.COMPLETED
+        self.job.save()
+        with patch("main.views.ZSTD_AVAILABLE", False):
+            response = self.client.get(
+                f"/download/{self.job.pk}/", {"format": "tar.zst"}
+            )
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertEqual(
+            response["Content-Disposition"],
+            f'attachment; filename="{self.job.work_dir.name}.tar.gz"',
+        )
+        data = BytesIO(b"".join(response.streaming_content))
+        with tarfile.open(fileobj=data) as tf:
+            self.assertIn(f"{self.job.work_dir.name}/test.com", tf.getnames())
+
+    def test_invalid_format(self):
+        self.job.status = Job.COMPLETED
+        self.job.save()
+        response = self.client.get(f"/download/{self.job.pk}/", {"format": "rar"})
+        self.assertEqual(response.status_code, 400)
+
     def test_not_complete(self):
         """Uncompleted jobs should not be downloadable"""
         response = self.client.get(f"/download/{self.job.pk}/")
@@ -409,6 +840,68 @@ class TestDownloadView(SchedulerTestCase):
         self.assertEqual(response.status_code, 404)
 
 
+class TestDownloadFileView(SchedulerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.job = create_dummy_job()
+        (self.job.work_dir / "output").mkdir()
+        (self.job.work_dir / "output" / "result.log").write_text("result")
+
+    def get(self, path, **headers):
+        return self.client.get(f"/download/{self.job.pk}/{path}", **headers)
+
+    def test_download(self):
+        response = self.get("output/result.log")
+        self.assertEqual(b"".join(response.streaming_content), b"result")
+        self.assertEqual(
+            response["Content-Disposition"], 'attachment; filename="result.log"'
+        )
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+
+    def test_range(self):
+        response = self.get("output/result.log", HTTP_RANGE="bytes=1-3")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), b"esu")
+
+    def test_range_not_satisfiable(self):
+        """The file is closed if the requested range cannot be sent"""
+        opened = []
+
+        def tracked_open(*args, **kwargs):
+            f = open(*args, **kwargs)
+            opened.append(f)
+            return f
+
+        with patch("main.views.open", tracked_open, create=True):
+            response = self.get("output/result.log", HTTP_RANGE="bytes=100-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */6")
+        self.assertEqual(len(opened), 1)
+        self.assertTrue(opened[0].closed)
+
+    def test_outside_work_dir(self):
+        """Files outside the working directory are not found"""
+        other = create_dummy_job()
+        (self.job.work_dir / "link").symlink_to(other.work_dir / "sub.sh")
+        for path in ("output", "missing", f"../{other.job_number}/sub.sh", "link"):
+            self.assertEqual(self.get(path).status_code, 404, path)
+
+    def test_sendfile(self):
+        path = self.job.work_dir.resolve() / "output" / "result.log"
+        sendfile = get_portal_settings().SENDFILE
+        with patch.dict(sendfile, header="X-Sendfile"):
+            response = self.get("output/result.log")
+        self.assertEqual(response["X-Sendfile"], str(path))
+        self.assertEqual(response.content, b"")
+
+        with patch.dict(sendfile, header="X-Accel-Redirect", location="/internal/"):
+            response = self.get("output/result.log")
+        self.assertEqual(response["X-Accel-Redirect"], f"/internal{path}")
+        self.assertEqual(
+            response["Content-Disposition"], 'attachment; filename="result.log"'
+        )
+
+
 class TestPublishView(SchedulerTestCase):
     def setUp(self):
         self.profile = Profile.objects.create(
@@ -505,6 +998,44 @@ class TestDirectoryView(SchedulerTestCase):
         self.assertEqual(files[0]["name"], "file1")
         self.assertEqual(files[1]["name"], "sub.sh")
 
+    def test_selection_patterns(self):
+        """Files are selected for download by name with glob characters escaped"""
+        job = create_dummy_job()
+        (job.work_dir / "file[1]").touch()
+        response = self.client.get(f"/directory/{job.pk}/")
+        files = response.context["table"].data.data
+        self.assertEqual(files[0]["include"], "file[[]1]")
+
+    def test_sort_and_paginate(self):
+        """Files are sorted on their size rather than its display and paginated"""
+        job = create_dummy_job()
+        for i in range(150):
+            (job.work_dir / f"file{i}").write_bytes(b"x" * i * 100)
+
+        response = self.client.get(f"/directory/{job.pk}/", {"sort": "-file_size"})
+        table = response.context["table"]
+        self.assertEqual(len(table.page.object_list), 100)
+        self.assertEqual(table.page.object_list.data[0]["name"], "file149")
+        self.assertContains(response, "14.9 kB")
+
+        response = self.client.get(
+            f"/directory/{job.pk}/", {"sort": "-file_size", "page": 2}
+        )
+        self.assertEqual(len(response.context["table"].page.object_list), 51)
+
+    def test_file_index_cache(self):
+        """Listings of completed jobs are cached until the directory changes"""
+        job = create_dummy_job()
+        job.status = Job.COMPLETED
+        job.save()
+        cache = FileIndexCache(10)
+        with patch("main.views.get_file_index_cache", lambda: cache), patch(
+            "main.views.scan_directory"
+        ) as scan_directory:
+            self.client.get(f"/directory/{job.pk}/")
+            self.assertIn(str(job.work_dir), cache._entries)
+            scan_directory.assert_not_called()
+
     def test_missing_directory(self):
         """Appropriate message is displayed if job directory cannot be found"""
         job = create_dummy_job()
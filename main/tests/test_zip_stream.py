@@ -0,0 +1,267 @@
+import os
+import random
+import threading
+import zipfile
+from io import BytesIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from ..zip_stream import (
+    CompressionPolicy,
+    StoredArchive,
+    Stream,
+    background_chunks,
+    background_zipfile_generator,
+    zipfile_generator,
+)
+
+
+class ZipStreamTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.paths = []
+        for i in range(3):
+            path = Path(self.tmp_dir.name) / f"file{i}.txt"
+            path.write_bytes(bytes([i]) * 1000)
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+class TestZipStream(ZipStreamTestCase):
+    def test_archive(self):
+        archive = BytesIO(b"".join(zipfile_generator("job", self.paths)))
+        with zipfile.ZipFile(archive) as zf:
+            self.assertEqual(
+                zf.namelist(), ["job/file0.txt", "job/file1.txt", "job/file2.txt"]
+            )
+            self.assertEqual(zf.read("job/file2.txt"), b"\x02" * 1000)
+
+    def test_chunk_size(self):
+        """All chunks but the last are at least CHUNK_SIZE_BYTES"""
+        with patch("main.zip_stream.CHUNK_SIZE_BYTES", 500):
+            chunks = list(zipfile_generator("job", self.paths))
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk) >= 500 for chunk in chunks[:-1]))
+
+    def test_stream(self):
+        stream = Stream()
+        buffer = bytearray(b"abc")
+        stream.write(buffer)
+        # the writer may reuse its buffer
+        buffer[:] = b"def"
+        stream.write(b"ghi")
+        self.assertEqual(stream.size, 6)
+        self.assertEqual(stream.get(), b"abcghi")
+        self.assertEqual(stream.size, 0)
+        self.assertEqual(stream.get(), b"")
+
+
+class TestCompressionPolicy(ZipStreamTestCase):
+    def test_default_stored(self):
+        self.assertEqual(
+            CompressionPolicy().choose(self.paths[0], 1000), (zipfile.ZIP_STORED, None)
+        )
+
+    def test_extensions(self):
+        policy = CompressionPolicy("deflated", 6, extensions={".TXT": "lzma"})
+        self.assertEqual(policy.choose(self.paths[0], 1000), (zipfile.ZIP_LZMA, 6))
+        path = self.paths[0].with_suffix(".gz")
+        self.assertEqual(policy.choose(path, 1000), (zipfile.ZIP_DEFLATED, 6))
+
+    def test_max_size(self):
+        policy = CompressionPolicy("deflated", max_size=100)
+        self.assertEqual(policy.choose(self.paths[0], 1000)[0], zipfile.ZIP_STORED)
+        self.assertEqual(policy.choose(self.paths[0], 100)[0], zipfile.ZIP_DEFLATED)
+
+    def test_probe(self):
+        """Files that do not compress well are stored"""
+        path = Path(self.tmp_dir.name) / "random.bin"
+        path.write_bytes(os.urandom(1000))
+        policy = CompressionPolicy("deflated", probe=True)
+        self.assertEqual(policy.choose(path, 1000)[0], zipfile.ZIP_STORED)
+        self.assertEqual(policy.choose(self.paths[0], 1000)[0], zipfile.ZIP_DEFLATED)
+
+    def test_archive(self):
+        policy = CompressionPolicy("deflated", 9, extensions={".txt": "bzip2"})
+        self.paths.append(Path(self.tmp_dir.name) / "data.bin")
+        self.paths[-1].write_bytes(b"\x00" * 1000)
+        archive = BytesIO(b"".join(zipfile_generator("job", self.paths, policy)))
+        with zipfile.ZipFile(archive) as zf:
+            infos = zf.infolist()
+            self.assertEqual(
+                [info.compress_type for info in infos],
+                [zipfile.ZIP_BZIP2] * 3 + [zipfile.ZIP_DEFLATED],
+            )
+            self.assertLess(infos[-1].compress_size, 1000)
+            self.assertEqual(zf.read("job/data.bin"), b"\x00" * 1000)
+
+    def test_levels(self):
+        """The compression level is applied to every member"""
+        rng = random.Random(0)
+        words = [f"word{i}".encode() for i in range(1000)]
+        path = Path(self.tmp_dir.name) / "words.log"
+        path.write_bytes(b" ".join(rng.choices(words, k=50000)))
+        for method in ("deflated", "bzip2"):
+            archives = []
+            for level in (1, 9):
+                policy = CompressionPolicy(method, level)
+                archive = b"".join(zipfile_generator("job", [path], policy))
+                with zipfile.ZipFile(BytesIO(archive)) as zf:
+                    self.assertIsNone(zf.testzip())
+                    self.assertEqual(zf.read("job/words.log"), path.read_bytes())
+                archives.append(archive)
+            self.assertNotEqual(archives[0], archives[1], method)
+
+    def test_lzma(self):
+        policy = CompressionPolicy("lzma")
+        archive = BytesIO(b"".join(zipfile_generator("job", self.paths, policy)))
+        with zipfile.ZipFile(archive) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(zf.infolist()[0].compress_type, zipfile.ZIP_LZMA)
+            self.assertEqual(zf.read("job/file1.txt"), b"\x01" * 1000)
+
+
+class TestParallelZipStream(ZipStreamTestCase):
+    def setUp(self):
+        super().setUp()
+        rng = random.Random(0)
+        words = [f"word{i}".encode() for i in range(100)]
+        self.paths.append(Path(self.tmp_dir.name) / "large.log")
+        self.paths[-1].write_bytes(b" ".join(rng.choices(words, k=5000)))
+        self.paths.append(Path(self.tmp_dir.name) / "empty.log")
+        self.paths[-1].write_bytes(b"")
+        self.paths.append(Path(self.tmp_dir.name) / "stored.gz")
+        self.paths[-1].write_bytes(os.urandom(1000))
+
+    def archive(self, workers):
+        policy = CompressionPolicy(
+            "deflated", extensions={".gz": "stored"}, workers=workers
+        )
+        with patch("main.zip_stream.BLOCK_SIZE_BYTES", 8192):
+            return b"".join(zipfile_generator("job", self.paths, policy))
+
+    def check_archive(self, archive):
+        with zipfile.ZipFile(BytesIO(archive)) as zf:
+            self.assertIsNone(zf.testzip())
+            for path in self.paths:
+                self.assertEqual(zf.read(f"job/{path.name}"), path.read_bytes())
+            return zf.infolist()
+
+    def test_archive(self):
+        """Files split into blocks are compressed as a single deflate stream"""
+        infos = self.check_archive(self.archive(workers=3))
+        self.assertEqual(
+            [info.compress_type for info in infos],
+            [zipfile.ZIP_DEFLATED] * 5 + [zipfile.ZIP_STORED],
+        )
+        serial = self.check_archive(self.archive(workers=1))
+        # compression is primed by the previous block so is not much worse
+        self.assertLess(infos[3].compress_size, serial[3].compress_size * 1.1)
+
+    def test_zip64(self):
+        """ZIP64 extensions are used for large members and central directories"""
+        with patch("zipfile.ZIP64_LIMIT", 2000), patch(
+            "main.zip_stream.ZIP64_LIMIT", 2000
+        ):
+            archive = self.archive(workers=2)
+            (info,) = [
+                info
+                for info in self.check_archive(archive)
+                if info.filename == "job/large.log"
+            ]
+        self.assertGreaterEqual(info.extract_version, zipfile.ZIP64_VERSION)
+
+    def test_unicode_name(self):
+        path = Path(self.tmp_dir.name) / "dätä.log"
+        path.write_bytes(b"data")
+        self.paths.append(path)
+        self.check_archive(self.archive(workers=2))
+
+    def test_other_methods(self):
+        """Archives using methods other than deflate are built in sequence"""
+        policy = CompressionPolicy(
+            "deflated", extensions={".gz": "bzip2"}, level=1, workers=2
+        )
+        with patch("main.zip_stream._parallel_zipfile_generator") as parallel:
+            infos = self.check_archive(
+                b"".join(zipfile_generator("job", self.paths, policy))
+            )
+        parallel.assert_not_called()
+        self.assertEqual(infos[-1].compress_type, zipfile.ZIP_BZIP2)
+
+
+class TestStoredArchive(ZipStreamTestCase):
+    def setUp(self):
+        super().setUp()
+        sub_dir = Path(self.tmp_dir.name) / "sub"
+        sub_dir.mkdir()
+        (sub_dir / "data.bin").write_bytes(os.urandom(5000))
+        self.paths.append(sub_dir / "data.bin")
+
+    def test_archive(self):
+        archive = StoredArchive("job", self.paths, root=Path(self.tmp_dir.name))
+        data = b"".join(archive.chunks())
+        self.assertEqual(len(data), archive.size)
+        with zipfile.ZipFile(BytesIO(data)) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(zf.namelist()[-1], "job/sub/data.bin")
+            self.assertEqual(zf.read("job/sub/data.bin"), self.paths[-1].read_bytes())
+
+    def test_ranges(self):
+        """Any range of the archive matches the same bytes of the whole archive"""
+        archive = StoredArchive("job", self.paths)
+        whole = b"".join(archive.chunks())
+        for start, end in [(0, 10), (30, 1100), (2000, 6000), (6000, archive.size)]:
+            # a new archive so that CRCs are read from the cache or files
+            ranged = StoredArchive("job", self.paths)
+            self.assertEqual(
+                b"".join(ranged.chunks(start, end)), whole[start:end], (start, end)
+            )
+
+    def test_etag(self):
+        etag = StoredArchive("job", self.paths).etag
+        self.assertEqual(StoredArchive("job", self.paths).etag, etag)
+        self.paths[0].write_bytes(b"changed")
+        self.assertNotEqual(StoredArchive("job", self.paths).etag, etag)
+
+    def test_zip64(self):
+        with patch("zipfile.ZIP64_LIMIT", 2000), patch(
+            "main.zip_stream.ZIP64_LIMIT", 2000
+        ):
+            archive = StoredArchive("job", self.paths)
+            data = b"".join(archive.chunks())
+        self.assertEqual(len(data), archive.size)
+        with zipfile.ZipFile(BytesIO(data)) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(zf.read("job/data.bin"), self.paths[-1].read_bytes())
+
+
+class TestBackgroundZipStream(ZipStreamTestCase):
+    def test_same_archive(self):
+        self.assertEqual(
+            b"".join(background_zipfile_generator("job", self.paths)),
+            b"".join(zipfile_generator("job", self.paths)),
+        )
+
+    def test_chunks(self):
+        self.assertEqual(list(background_chunks(iter([b"a", b"b"]))), [b"a", b"b"])
+
+    def test_error(self):
+        """Errors in the background thread are raised by the generator"""
+        with self.assertRaises(FileNotFoundError):
+            list(background_zipfile_generator("job", [Path(self.tmp_dir.name, "none")]))
+
+    def test_closed_early(self):
+        """The background thread stops if the download is abandoned"""
+        with patch("main.zip_stream.CHUNK_SIZE_BYTES", 10):
+            chunks = background_zipfile_generator("job", self.paths, max_chunks=1)
+            next(chunks)
+            chunks.close()
+        for thread in threading.enumerate():
+            if thread.name == "zip-stream":
+                thread.join(5)
+                self.assertFalse(thread.is_alive())
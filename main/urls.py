@@ -18,6 +18,18 @@ urlpatterns = [
         views.create_job,
         name="create_job",
     ),
+    path(
+        "bulk_create_job/<int:project_pk>/<int:resource_index>/<int:software_index>/",
+        views.bulk_create_job,
+        name="bulk_create_job",
+    ),
+    path(
+        "bulk_create_job/<int:project_pk>/<int:resource_index>/<int:software_index>/<int:config_pk>/",  # noqa: E501
+        views.bulk_create_job,
+        name="bulk_create_job",
+    ),
+    path("uploads/", views.create_upload, name="create_upload"),
+    path("uploads/<uuid:upload_pk>/", views.upload, name="upload"),
     path("list_jobs/", views.list_jobs, name="list_jobs"),
     path("delete/<int:job_pk>/", views.delete, name="delete"),
     path("job_type/", views.job_type, name="job_type"),
@@ -68,6 +80,9 @@ urlpatterns = [
         name="custom_resource_delete",
     ),
     path("download/<int:job_pk>/", views.download, name="download"),
+    path(
+        "download/<int:job_pk>/<path:path>", views.download_file, name="download_file"
+    ),
     path("authorize/<str:repo_label>/", views.authorize, name="authorize"),
     path("token/<str:repo_label>/", views.token, name="token"),
     path("publish/<int:job_pk>/", views.publish, name="publish"),
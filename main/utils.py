@@ -1,21 +1,179 @@
 import os
-from datetime import datetime
+import threading
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+from pathlib import Path
 
-import humanize
+from .portal_config import get_portal_settings
 
 
-def file_properties(path):
-    """Return the name, modification time and size of a file.
+def scan_directory(path):
+    """Return the name, modification time and size of each entry in a directory.
+    The directory is read with `os.scandir`, so each entry is stat'ed once and
+    whether it is a file is usually known without a further system call.
 
     args:
-      path (str or Path): path to file of interest
+      path (str or Path): the directory to read
 
     returns:
-      (dict): file properties with keys "name", "mtime" and "file_size"
+      (list of dict): entry properties with keys "name", "mtime" (a timestamp),
+        "file_size" (in bytes) and "is_file"
     """
-    stats = os.stat(path)
-    return dict(
-        name=path.name,
-        mtime=humanize.naturaltime(datetime.fromtimestamp(stats.st_mtime)),
-        file_size=humanize.naturalsize(stats.st_size),
-    )
+    entries = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                stats = entry.stat()
+            except FileNotFoundError:
+                # removed since the directory was read
+                continue
+            entries.append(
+                dict(
+                    name=entry.name,
+                    mtime=stats.st_mtime,
+                    file_size=stats.st_size,
+                    is_file=entry.is_file(),
+                )
+            )
+    return entries
+
+
+class FileIndexCache:
+    """A cache of directory listings as returned by `scan_directory`, keyed by
+    path. A listing is read again if the modification time of the directory has
+    changed, i.e. if entries have been added, removed or renamed. Changes to the
+    size or modification time of existing files are not detected. The least
+    recently used listings are discarded to keep at most `max_entries`.
+    """
+
+    def __init__(self, max_entries):
+        """
+        args:
+          max_entries (int): maximum number of directory listings to cache
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """Return the listing of a directory, reading it if not already cached.
+
+        args:
+          path (Path): the directory to list
+
+        returns:
+          (list of dict): as returned by `scan_directory`. This is shared with
+            other callers so must not be modified.
+        """
+        key = str(path)
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == mtime:
+                self._entries.move_to_end(key)
+                return entry[1]
+        listing = scan_directory(path)
+        with self._lock:
+            self._entries[key] = (mtime, listing)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return listing
+
+
+_file_index_cache = None
+_file_index_cache_lock = threading.Lock()
+
+
+def get_file_index_cache():
+    """Return the FileIndexCache for the current process, creating it if required.
+
+    returns:
+      (FileIndexCache or None): the cache configured by the portal config or None
+        if disabled
+    """
+    global _file_index_cache
+    max_entries = get_portal_settings().CACHING["file_index_max_entries"]
+    if not max_entries:
+        return None
+    with _file_index_cache_lock:
+        if _file_index_cache is None:
+            _file_index_cache = FileIndexCache(max_entries)
+        return _file_index_cache
+
+
+def walk_files(root, include=(), exclude=(), max_size=None):
+    """Yield the files below a directory, including those in sub-directories. The
+    directory tree is read one directory at a time with `os.scandir` so that files
+    are yielded as they are found. Symbolic links to directories are not followed.
+
+    Patterns are matched against paths relative to `root` using `fnmatch`, so "*"
+    also matches "/". A pattern matching a directory applies to everything within
+    it.
+
+    args:
+      root (Path): the directory to search
+      include (list of str): glob patterns of files to include. All files are
+        included if empty.
+      exclude (list of str): glob patterns of files to exclude
+      max_size (int): size in bytes above which files are excluded
+
+    yields:
+      (Path): the next file, in alphabetical order within each directory
+    """
+
+    def walk(path, rel_dir, included):
+        with os.scandir(path) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+        for entry in entries:
+            rel_path = rel_dir + entry.name
+            if any(fnmatchcase(rel_path, pattern) for pattern in exclude):
+                continue
+            entry_included = included or any(
+                fnmatchcase(rel_path, pattern) for pattern in include
+            )
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk(entry.path, rel_path + "/", entry_included)
+            elif entry.is_file() and entry_included:
+                if max_size is None or entry.stat().st_size <= max_size:
+                    yield Path(entry.path)
+
+    yield from walk(root, "", not include)
+
+
+def parse_range(header, size):
+    """Parse the value of an HTTP Range header for a resource of `size` bytes. Only
+    a single range of bytes is supported, other ranges are ignored as allowed by
+    RFC 9110.
+
+    args:
+      header (str): the value of the Range header, may be None
+      size (int): the size of the resource in bytes
+
+    returns:
+      (tuple): the start and end (exclusive) of the requested range or None if the
+        whole resource should be sent
+
+    raises:
+      ValueError: if the range cannot be satisfied
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep or not (first + last).isdigit():
+        return None
+    if not first:
+        # a suffix range giving the number of bytes at the end
+        if int(last) == 0:
+            raise ValueError("Range not satisfiable")
+        return max(size - int(last), 0), size
+    start = int(first)
+    end = min(int(last) + 1, size) if last else size
+    if start >= size:
+        raise ValueError("Range not satisfiable")
+    if end <= start:
+        return None
+    return start, end
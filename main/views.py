@@ -1,40 +1,69 @@
 import csv
+import glob
 import logging
+import mimetypes
 import os
-from datetime import timedelta
-from itertools import chain
+from urllib.parse import quote
 
 import django_tables2 as tables
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.http import Http404, StreamingHttpResponse
+from django.db.models import Max
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseNotAllowed,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
+from django.utils import timezone
 
 from . import scheduler
+from .archive_cache import get_archive_cache
 from .filters import JobFilter
-from .forms import JobForm, JobTypeForm, ProfileForm, ProjectForm, SubmissionForm
+from .forms import (
+    BulkSubmissionForm,
+    JobForm,
+    JobTypeForm,
+    ProfileForm,
+    ProjectForm,
+    StagedUploadForm,
+    SubmissionForm,
+)
 from .models import (
+    STAGED_UPLOAD_EXPIRY,
     CustomConfig,
     CustomResource,
     Job,
     Profile,
     Project,
     Publication,
+    StagedUpload,
     Token,
 )
 from .portal_config import get_portal_settings
 from .repositories import RepositoryError, get_repositories, get_repository
 from .software import get_software
 from .tables import (
+    BulkSubmissionTable,
     CustomConfigTable,
     CustomResourceTable,
     DirectoryTable,
     JobTable,
     PublicationTable,
 )
-from .utils import file_properties
-from .zip_stream import zipfile_generator
+from .tar_stream import FORMATS, ZSTD_AVAILABLE, tarfile_generator
+from .utils import get_file_index_cache, parse_range, scan_directory, walk_files
+from .zip_stream import (
+    CompressionPolicy,
+    StoredArchive,
+    background_chunks,
+    background_zipfile_generator,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -65,22 +94,18 @@ def create_job(request, project_pk, resource_index, software_index, config_pk=No
     )
     if request.method == "POST":
         form = SubmissionForm(software, request.POST, request.FILES)
-        files_spec = software["input_files"]
         if form.is_valid():
-            input_files = {
-                spec["key"]: request.FILES[spec["key"]]
-                for spec in chain(files_spec["required"], files_spec["optional"])
-                if spec["key"] in request.FILES
-            }
             try:
                 job = Job.objects.create_job(
                     form.cleaned_data["description"],
-                    input_files,
+                    form.input_files(),
                     project,
                     resource_index,
                     software_index,
                     custom_config,
                 )
+                for upload in form.staged_uploads.values():
+                    upload.delete()
                 url = reverse("main:list_jobs")
                 return redirect(url + f"?success={job.pk}")
             except scheduler.SchedulerError as e:
@@ -97,47 +122,201 @@ def create_job(request, project_pk, resource_index, software_index, config_pk=No
             "software_help_url": reverse(
                 "main:software_help", kwargs={"software_index": software_index}
             ),
+            "bulk_url": reverse(
+                "main:bulk_create_job",
+                args=[project_pk, resource_index, software_index]
+                + ([] if config_pk is None else [config_pk]),
+            ),
         },
     )
 
 
-def list_jobs(request):
-    """The list view used to display jobs that have submitted via the portal. An
-    important secondary function is to update job records when they complete.
+def bulk_create_job(
+    request, project_pk, resource_index, software_index, config_pk=None
+):
+    """This view handles a form that when submitted triggers creation of many jobs
+    that differ only in the file provided for one input e.g. for a parameter sweep.
+    The outcome of submission is reported for each job.
 
     args:
       request (HttpRequest): request that triggered this view
+      project_pk (int): pk of the project for the jobs
+      resource_index (int): index of the resource configuration for the jobs
+      software_index (int): index of the sofware configuration for the jobs
+      config_pk (int): pk of the CustomConfig record for the jobs
 
     returns:
       (HttpResponse): the page to display
     """
-    job_filter = JobFilter(request.GET, queryset=Job.objects.order_by("-pk"))
-    table = JobTable(job_filter.qs)
-    config = tables.RequestConfig(request, paginate={"per_page": 15})
-    config.configure(table)
-
-    portal_settings = get_portal_settings()
-    for job in table.page.object_list.data:
-        if job.status != Job.COMPLETED:
+    project = get_object_or_404(Project, pk=project_pk)
+    software = get_software()[software_index]
+    custom_config = (
+        None if config_pk is None else get_object_or_404(CustomConfig, pk=config_pk)
+    )
+    if request.method == "POST":
+        form = BulkSubmissionForm(software, request.POST, request.FILES)
+        if form.is_valid():
+            sweep_key = form.cleaned_data["sweep_key"]
+            shared_files = {
+                key: inp for key, inp in form.input_files().items() if key != sweep_key
+            }
+            sweep_files = form.sweep_inputs()
+            create = (
+                Job.objects.create_job_array
+                if form.cleaned_data["use_array"]
+                else Job.objects.create_jobs
+            )
             try:
-                job.status = scheduler.status(
-                    job.job_id, timeout=portal_settings.TIMEOUTS["status"]
-                ).capitalize()[0]
-            except scheduler.SchedulerError:
-                # if something goes wrong with getting status info for one
-                # job, assume a problem and don't try the rest
-                break
-            if job.status == Job.COMPLETED:
-                try:
-                    with (job.work_dir / "WALLTIME").open() as f:
-                        job.walltime = timedelta(seconds=int(f.read()))
-                except (IOError, ValueError):
-                    pass
-            job.save()
+                jobs = create(
+                    form.cleaned_data["description"],
+                    [{**shared_files, sweep_key: inp} for inp in sweep_files],
+                    project,
+                    resource_index,
+                    software_index,
+                    custom_config,
+                )
+            except scheduler.SchedulerError as e:
+                logger.exception("Exception during job array submission")
+                msg = f"Job submission failed\n\n{e.args[0]}"
+                return render(request, "main/failed.html", {"message": msg})
+            for upload in form.staged_uploads.values():
+                upload.delete()
+            table = BulkSubmissionTable(
+                [
+                    dict(job=job, input_file=os.path.basename(inp.name))
+                    for job, inp in zip(jobs, sweep_files)
+                ]
+            )
+            return render(request, "main/bulk_results.html", {"table": table})
+    else:
+        form = BulkSubmissionForm(software)
+    return render(
+        request,
+        "main/create_job.html",
+        {
+            "form": form,
+            "software_help_url": reverse(
+                "main:software_help", kwargs={"software_index": software_index}
+            ),
+        },
+    )
+
+
+def create_upload(request):
+    """Start a resumable upload of an input file. The file name and total size are
+    posted and the file content is then sent in chunks to the `upload` view. Uploads
+    not used within STAGED_UPLOAD_EXPIRY are discarded.
+
+    args:
+      request (HttpRequest): request that triggered this view
+
+    returns:
+      (JsonResponse): the id, offset and url of the new upload or any form errors
+    """
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    form = StagedUploadForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({"errors": form.errors}, status=400)
+    for expired in StagedUpload.objects.filter(
+        created__lt=timezone.now() - STAGED_UPLOAD_EXPIRY
+    ):
+        expired.delete()
+    upload = form.save()
+    upload.path.parent.mkdir(parents=True, exist_ok=True)
+    upload.path.touch()
+    return JsonResponse(_upload_state(upload), status=201)
+
+
+def upload(request, upload_pk):
+    """Receive a chunk of a resumable upload. Chunks are sent with a PUT request
+    whose body is the chunk and whose Upload-Offset header gives its position in the
+    file. A GET request returns the current offset from which an interrupted upload
+    should be resumed.
+
+    args:
+      request (HttpRequest): request that triggered this view
+      upload_pk (UUID): pk of the StagedUpload
+
+    returns:
+      (JsonResponse): the id, offset and url of the upload. The status is 409 if the
+        chunk was not written at the current offset.
+    """
+    upload = get_object_or_404(StagedUpload, pk=upload_pk)
+    if request.method == "GET":
+        return JsonResponse(_upload_state(upload))
+    if request.method != "PUT":
+        return HttpResponseNotAllowed(["GET", "PUT"])
+    try:
+        offset = int(request.headers["Upload-Offset"])
+        length = int(request.headers["Content-Length"])
+    except (KeyError, ValueError):
+        return JsonResponse(
+            {"errors": "Upload-Offset and Content-Length are required"}, status=400
+        )
+    if offset + length > upload.size:
+        return JsonResponse({"errors": "Chunk extends past end of file"}, status=400)
+    accepted = upload.write(offset, request, length)
+    return JsonResponse(_upload_state(upload), status=200 if accepted else 409)
+
+
+def _upload_state(upload):
+    return {
+        "id": str(upload.pk),
+        "offset": upload.offset,
+        "size": upload.size,
+        "url": reverse("main:upload", args=[upload.pk]),
+    }
+
+
+def list_jobs(request):
+    """The list view used to display jobs that have submitted via the portal. Job
+    status is read from the database as updated by `poller.StatusPoller`.
+
+    Once the number of jobs may exceed the `keyset_threshold` of the `job_list`
+    section of the portal config, pages are selected by the pk of the last job seen
+    ("before") or the first ("after") rather than by page number. Each page is
+    then found directly from the primary key index without counting jobs or
+    skipping over those on earlier pages.
+
+    args:
+      request (HttpRequest): request that triggered this view
+
+    returns:
+      (HttpResponse): the page to display
+    """
+    options = (10, 15, 25, 50)
+    try:
+        per_page = int(request.GET.get("per_page", 15))
+    except ValueError:
+        per_page = 15
+    per_page = per_page if per_page in options else 15
+
+    # related projects and publications are loaded up front rather than per row
+    jobs = (
+        Job.objects.select_related("project")
+        .prefetch_related("publication_set")
+        .order_by("-pk")
+    )
+    job_filter = JobFilter(request.GET, queryset=jobs)
+    # the largest pk is an upper bound on the number of jobs found using an index
+    max_pk = Job.objects.aggregate(max_pk=Max("pk"))["max_pk"] or 0
+    keyset = None
+    if max_pk > get_portal_settings().JOB_LIST["keyset_threshold"]:
+        page, keyset = _keyset_page(request, job_filter.qs, per_page)
+        table = JobTable(page, orderable=False)
+        tables.RequestConfig(request, paginate=False).configure(table)
+    else:
+        table = JobTable(job_filter.qs)
+        config = tables.RequestConfig(request, paginate={"per_page": per_page})
+        config.configure(table)
 
     try:
         job = Job.objects.get(pk=int(request.GET["success"]))
-        message = f"Successfully submitted job - {job.job_number} ({job.job_id})"
+        if job.job_id:
+            message = f"Successfully submitted job - {job.job_number} ({job.job_id})"
+        else:
+            message = f"Job {job.job_number} queued for submission"
     except (KeyError, Job.DoesNotExist, ValueError):
         message = None
     return render(
@@ -146,12 +325,43 @@ def list_jobs(request):
         {
             "table": table,
             "filter": job_filter,
-            "options": (10, 15, 25, 50),
+            "options": options,
+            "per_page": per_page,
+            "keyset": keyset,
             "message": message,
         },
     )
 
 
+def _keyset_page(request, jobs, per_page):
+    # Return a page of `jobs`, ordered by descending pk, before or after the pks
+    # given in the request along with the pks to use for the older and newer pages
+    try:
+        before = int(request.GET["before"]) if "before" in request.GET else None
+        after = int(request.GET["after"]) if "after" in request.GET else None
+    except ValueError:
+        before = after = None
+    if after is not None:
+        page = list(jobs.filter(pk__gt=after).order_by("pk")[: per_page + 1])
+        has_newer = len(page) > per_page
+        page = page[:per_page][::-1]
+        has_older = jobs.filter(pk__lte=after).exists()
+    else:
+        if before is not None:
+            jobs_before = jobs.filter(pk__lt=before)
+        else:
+            jobs_before = jobs
+        page = list(jobs_before[: per_page + 1])
+        has_older = len(page) > per_page
+        page = page[:per_page]
+        has_newer = before is not None and jobs.filter(pk__gte=before).exists()
+    keyset = {
+        "older": page[-1].pk if page and has_older else None,
+        "newer": page[0].pk if page and has_newer else None,
+    }
+    return page, keyset
+
+
 def delete(request, job_pk):
     """Delete a job from the database.
 
@@ -227,7 +437,7 @@ def projects(request):
             return redirect(request.META.get("HTTP_REFERER", "main:index"))
     else:
         form = ProjectForm()
-    projects = Project.objects.all()
+    projects = Project.objects.with_job_stats().order_by("pk")
     return render(request, "main/projects.html", {"projects": projects, "form": form})
 
 
@@ -263,7 +473,7 @@ def job(request, job_pk):
             form.save()
             return redirect(request.META.get("HTTP_REFERER", "main:index"))
     table = PublicationTable(Publication.objects.filter(job=job))
-    return render(request, "main/job.html", {"form": form, "table": table})
+    return render(request, "main/job.html", {"form": form, "table": table, "job": job})
 
 
 def software_help(request, software_index):
@@ -385,26 +595,231 @@ def custom_config_delete(request, pk, klass):
 
 
 def download(request, job_pk):
-    """Download a job working directory as a zip archive. The archive is
-    generated on the fly and streamed to the user. This has the advantage that
-    the download starts immediately but also means that this view blocks other
-    requests until the download is complete.
+    """Download a job working directory, including sub-directories, as a zip
+    archive. The archive is generated on the fly by a background thread and
+    streamed to the user so that the download starts immediately and memory use is
+    bounded. Files are compressed as set by the `compression` section of the portal
+    config.
+
+    If no files are compressed the layout of the archive is known in advance, so
+    the response has a Content-Length and a single byte range may be requested
+    (e.g. to resume an interrupted download).
+
+    If the archive cache is enabled, downloads of the whole working directory are
+    sent from a pre-built archive. The archive is built in the background on first
+    download if not already available.
+
+    The files included may be restricted with the query parameters "include" and
+    "exclude", glob patterns matched against paths relative to the working
+    directory that may each be given more than once, and "max_size", the size in
+    bytes above which files are left out.
+
+    The query parameter "format" may be "tar.zst" or "tar.gz" to download a
+    compressed tar archive instead, compressed as set by the `tar` section of the
+    portal config. "tar.gz" is used in place of "tar.zst" if zstandard is not
+    installed.
 
     args:
       request (HttpRequest): request that triggered this view
       job_pk (int): pk of the job to download
 
     returns:
-      (StreamingHttpResponse): the zip archive of the working directory
+      (StreamingHttpResponse): the archive of the working directory
     """
     job = get_object_or_404(Job, pk=job_pk)
     if job.status != Job.COMPLETED:
         raise Http404("Job not completed")
+    try:
+        max_size = request.GET.get("max_size")
+        max_size = int(max_size) if max_size else None
+    except ValueError:
+        return HttpResponseBadRequest("max_size must be an integer")
+    archive_format = request.GET.get("format") or "zip"
+    if archive_format not in ("zip",) + FORMATS:
+        return HttpResponseBadRequest("format must be zip, tar.zst or tar.gz")
+    if archive_format == "tar.zst" and not ZSTD_AVAILABLE:
+        archive_format = "tar.gz"
+    # empty patterns are sent by blank form fields
+    include = [pattern for pattern in request.GET.getlist("include") if pattern]
+    exclude = [pattern for pattern in request.GET.getlist("exclude") if pattern]
     dir_name = job.work_dir.name
+    if archive_format != "zip":
+        return _tar_response(job, archive_format, include, exclude, max_size)
+    headers = {"Content-Disposition": f'attachment; filename="{dir_name}.zip"'}
+
+    archive_cache = get_archive_cache()
+    if archive_cache and not (include or exclude or max_size):
+        cached = archive_cache.get(job)
+        if cached is not None:
+            path, fingerprint = cached
+            return _file_response(
+                request, path, f'"{fingerprint}"', f"{dir_name}.zip", "application/zip"
+            )
+        archive_cache.enqueue(job)
+
+    paths = walk_files(job.work_dir, include, exclude, max_size)
+    policy = CompressionPolicy(**get_portal_settings().COMPRESSION)
+    if policy.stores_all:
+        archive = StoredArchive(dir_name, paths, root=job.work_dir)
+        return _ranged_response(
+            request,
+            lambda start, end: background_chunks(archive.chunks(start, end)),
+            archive.size,
+            archive.etag,
+            "application/zip",
+            headers,
+        )
     return StreamingHttpResponse(
-        zipfile_generator(dir_name, job.work_dir.glob("*")),
+        background_zipfile_generator(dir_name, paths, policy, root=job.work_dir),
         content_type="application/zip",
-        headers={"Content-Disposition": f'attachment; filename="{dir_name}.zip"'},
+        headers=headers,
+    )
+
+
+def _tar_response(job, archive_format, include, exclude, max_size):
+    tar = get_portal_settings().TAR
+    compression = archive_format.split(".")[1]
+    dir_name = job.work_dir.name
+    return StreamingHttpResponse(
+        background_chunks(
+            tarfile_generator(
+                dir_name,
+                walk_files(job.work_dir, include, exclude, max_size),
+                compression,
+                tar["zstd_level"] if compression == "zst" else tar["gzip_level"],
+                tar["threads"],
+                root=job.work_dir,
+            )
+        ),
+        content_type="application/zstd" if compression == "zst" else "application/gzip",
+        headers={
+            "Content-Disposition": f'attachment; filename="{dir_name}.{archive_format}"'
+        },
+    )
+
+
+def download_file(request, job_pk, path):
+    """Download a single file from a job working directory. Paths that lead outside
+    the working directory, including by symbolic links, are not found.
+
+    If configured by the `sendfile` section of the portal config, the file is sent
+    by the front-end web server rather than by this process.
+
+    args:
+      request (HttpRequest): request that triggered this view
+      job_pk (int): pk of the job
+      path (str): the path of the file relative to the working directory
+
+    returns:
+      (HttpResponse): the file as an attachment
+    """
+    job = get_object_or_404(Job, pk=job_pk)
+    work_dir = job.work_dir.resolve()
+    file_path = (work_dir / path).resolve()
+    try:
+        file_path.relative_to(work_dir)
+    except ValueError:
+        raise Http404("File not found")
+    if not file_path.is_file():
+        raise Http404("File not found")
+    stat = file_path.stat()
+    content_type, _ = mimetypes.guess_type(file_path.name)
+    return _file_response(
+        request,
+        file_path,
+        f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"',
+        file_path.name,
+        content_type or "application/octet-stream",
+    )
+
+
+def _file_response(request, path, etag, filename, content_type):
+    # Respond with a file as an attachment, which the server may send without
+    # passing it through Python, or with part of it if a byte range is requested.
+    # The file is opened straight away in case it is later removed.
+    sendfile = get_portal_settings().SENDFILE
+    if sendfile["header"]:
+        # the front-end server handles any range request
+        response = HttpResponse(content_type=content_type)
+        response["Content-Disposition"] = _content_disposition(filename)
+        response["ETag"] = etag
+        if sendfile["header"] == "X-Accel-Redirect":
+            location = sendfile["location"].rstrip("/") + quote(str(path))
+            response["X-Accel-Redirect"] = location
+        else:
+            response["X-Sendfile"] = str(path)
+        return response
+    f = open(path, "rb")
+    if "Range" not in request.headers:
+        return FileResponse(
+            f,
+            as_attachment=True,
+            filename=filename,
+            content_type=content_type,
+            headers={"Accept-Ranges": "bytes", "ETag": etag},
+        )
+
+    def chunks(start, end):
+        with f:
+            f.seek(start)
+            remaining = end - start
+            while remaining:
+                chunk = f.read(min(remaining, FileResponse.block_size))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+
+    try:
+        response = _ranged_response(
+            request,
+            chunks,
+            os.fstat(f.fileno()).st_size,
+            etag,
+            content_type,
+            {"Content-Disposition": _content_disposition(filename)},
+        )
+    except BaseException:
+        f.close()
+        raise
+    if not response.streaming:
+        # the range could not be satisfied so the file is not sent
+        f.close()
+    return response
+
+
+def _content_disposition(filename):
+    # as set by FileResponse, with non-ASCII names encoded as per RFC 6266
+    try:
+        filename.encode("ascii")
+        escaped = filename.replace("\\", "\\\\").replace('"', r"\"")
+        return f'attachment; filename="{escaped}"'
+    except UnicodeEncodeError:
+        return f"attachment; filename*=utf-8''{quote(filename)}"
+
+
+def _ranged_response(request, chunks, size, etag, content_type, headers):
+    # Respond with the whole resource or the byte range given by the Range header.
+    # The range is ignored if an If-Range header does not match the current ETag.
+    headers = dict(headers, **{"Accept-Ranges": "bytes", "ETag": etag})
+    if request.headers.get("If-Range", etag) != etag:
+        byte_range = None
+    else:
+        try:
+            byte_range = parse_range(request.headers.get("Range"), size)
+        except ValueError:
+            return HttpResponse(
+                status=416,
+                headers=dict(headers, **{"Content-Range": f"bytes */{size}"}),
+            )
+    if byte_range is None:
+        start, end, status = 0, size, 200
+    else:
+        (start, end), status = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+    headers["Content-Length"] = str(end - start)
+    return StreamingHttpResponse(
+        chunks(start, end), status=status, content_type=content_type, headers=headers
     )
 
 
@@ -573,7 +988,9 @@ def delete_token(request, repo_label):
 
 
 def directory(request, job_pk):
-    """Displays a table showing the files in a job working directory.
+    """Displays a table showing the files in a job working directory. The table is
+    sorted and paginated on the server. Listings of completed jobs are cached if
+    configured by the `caching` section of the portal config.
 
     args:
       request (HttpRequest): request that triggered this view
@@ -591,8 +1008,14 @@ def directory(request, job_pk):
             {"message": "Job directory not found. It may have been deleted."},
         )
 
-    files = [file_properties(path) for path in job.work_dir.glob("*")]
-    files.sort(key=lambda x: x["name"])
+    # the files of a running job may change without the directory changing
+    file_index_cache = get_file_index_cache()
+    if file_index_cache and job.status == Job.COMPLETED:
+        listing = file_index_cache.get(job.work_dir)
+    else:
+        listing = scan_directory(job.work_dir)
+    # selected files are downloaded using their name as an "include" pattern
+    files = [dict(entry, include=glob.escape(entry["name"])) for entry in listing]
     table = DirectoryTable(files)
     config = tables.RequestConfig(request)
     config.configure(table)
@@ -1,31 +1,70 @@
 """Implementation of a generator that creates a zip archive on the fly
 from file input and yields bytestrings of the archive
 content. Designed to be used in conjunction with a
-StreamingHttpResponse for synchronous download of zip archives without
-the need to write a temporary file to disk.
+StreamingHttpResponse for download of zip archives without the need
+to write a temporary file to disk.
 
 Based on https://stackoverflow.com/a/55169752
 
-The major drawback of this approach is that the Django worker thread
-is tied up with writing the archive and the rest of the site is
-unresponsive. Due to the use of PUN servers by OOD this only affects a
-single user however so is mitigated through UI design.
+Reading files and building the archive is carried out by a background
+thread (see `background_zipfile_generator`) that runs ahead of the
+response by at most QUEUE_CHUNKS chunks. The thread serving the request
+only passes completed chunks on to the client, and memory use for each
+download is bounded regardless of the size of the archive.
 
 """
 
+import bz2
+import hashlib
+import lzma
+import os
+import queue
+import struct
+import threading
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from io import RawIOBase
 from pathlib import Path
-from zipfile import ZipFile, ZipInfo
+from zipfile import (
+    ZIP64_LIMIT,
+    ZIP_BZIP2,
+    ZIP_DEFLATED,
+    ZIP_LZMA,
+    ZIP_STORED,
+    ZipFile,
+    ZipInfo,
+)
 
-CHUNK_SIZE_BYTES = 16 * 1024
+CHUNK_SIZE_BYTES = 256 * 1024
+QUEUE_CHUNKS = 8
+PROBE_SIZE_BYTES = 64 * 1024
+BLOCK_SIZE_BYTES = 1024 * 1024
+# the size of the deflate window, used to prime the compression of each block
+DICTIONARY_SIZE_BYTES = 32 * 1024
+CRC_CACHE_ENTRIES = 10000
+# the versions of the APPNOTE that introduced compression methods other than deflate
+VERSIONS_NEEDED = {ZIP_BZIP2: 46, ZIP_LZMA: 63}
+# the LZMA1 encoder settings used for the "lzma" method, as by the zipfile module
+LZMA_FILTER = {"id": lzma.FILTER_LZMA1, "lc": 3, "lp": 0, "pb": 2, "dict_size": 1 << 23}
+
+COMPRESSION_METHODS = {
+    "stored": ZIP_STORED,
+    "deflated": ZIP_DEFLATED,
+    "bzip2": ZIP_BZIP2,
+    "lzma": ZIP_LZMA,
+}
 
 
 class Stream(RawIOBase):
     """A simple stream object used to store zip archive chunks in memory
-    before being included in a response."""
+    before being included in a response. Written data is held as a queue
+    of separate chunks so that each byte is copied only once, when joined
+    by `get`, however many writes are made in between."""
 
     def __init__(self):
-        self._buffer = b""
+        self._chunks = deque()
+        self.size = 0
 
     def writable(self):
         return True
@@ -33,34 +72,702 @@ class Stream(RawIOBase):
     def write(self, b):
         if self.closed:
             raise ValueError("Stream was closed!")
-        self._buffer += b
-        return len(b)
+        # bytes objects are used as is, anything else may be reused by the
+        # writer so must be copied
+        self._chunks.append(bytes(b))
+        self.size += len(self._chunks[-1])
+        return len(self._chunks[-1])
 
     def get(self):
-        chunk = self._buffer
-        self._buffer = b""
+        chunk = b"".join(self._chunks)
+        self._chunks.clear()
+        self.size = 0
         return chunk
 
 
-def zipfile_generator(dir_name, paths):
+class _OffsetStream(Stream):
+    """A Stream that reports its position as if it began at `start`."""
+
+    def __init__(self, start):
+        super().__init__()
+        self.start = start
+
+    def tell(self):
+        return self.start + self.size
+
+
+class CompressionPolicy:
+    """Chooses how each file added to an archive is compressed. A default method
+    may be overridden by file extension. Files larger than `max_size` are always
+    stored without compression. If `probe` is set, the first PROBE_SIZE_BYTES of
+    each file are test compressed and the file is stored if they do not shrink to
+    less than `probe_ratio` of their size, e.g. for already compressed data.
+    """
+
+    def __init__(
+        self,
+        method="stored",
+        level=None,
+        extensions=None,
+        max_size=None,
+        probe=False,
+        probe_ratio=0.95,
+        workers=1,
+    ):
+        """
+        args:
+          method (str): one of "stored", "deflated", "bzip2" or "lzma"
+          level (int): the compression level to use, or None for the default
+          extensions (dict): mapping of file extension (e.g. ".gz") to method
+          max_size (int): size in bytes above which files are stored
+          probe (bool): whether to check that the start of a file is compressible
+          probe_ratio (float): the compression ratio required by the probe
+          workers (int): the number of threads used to compress "deflated" files.
+            Only used if no other methods apart from "stored" are used.
+        """
+        self.method = method
+        self.level = level
+        self.extensions = {
+            ext.lower(): method for ext, method in (extensions or {}).items()
+        }
+        self.max_size = max_size
+        self.probe = probe
+        self.probe_ratio = probe_ratio
+        self.workers = workers
+
+    @property
+    def methods(self):
+        """The names of the compression methods that may be used"""
+        return {self.method, *self.extensions.values()}
+
+    @property
+    def stores_all(self):
+        """Whether every file is stored without compression"""
+        return self.methods == {"stored"}
+
+    def choose(self, path, size):
+        """Choose how to compress a file.
+
+        args:
+          path (Path): the file to add to the archive
+          size (int): the size of the file in bytes
+
+        returns:
+          (tuple): the zipfile compression constant and compression level
+        """
+        method = self.extensions.get(path.suffix.lower(), self.method)
+        if method != "stored" and (
+            (self.max_size is not None and size > self.max_size)
+            or (self.probe and not self._compressible(path))
+        ):
+            method = "stored"
+        return COMPRESSION_METHODS[method], self.level
+
+    def _compressible(self, path):
+        with open(path, "rb") as f:
+            sample = f.read(PROBE_SIZE_BYTES)
+        # a fast compression level is representative enough for the probe
+        return len(zlib.compress(sample, 1)) < self.probe_ratio * len(sample)
+
+
+def zipfile_generator(dir_name, paths, policy=None, root=None):
     """Generator yielding bytestrings for a zip archive constructed on the
     fly. The zip archive will contain the files specified by `paths`
     (iterable of pathlib.Path) in a parent directory `dir_name` (str).
 
+    Chunks of at least CHUNK_SIZE_BYTES are yielded, apart from the last, so
+    that memory use is bounded by roughly twice CHUNK_SIZE_BYTES.
+
     args:
       dir_name (str): name of parent directory that will contain files in the archive
       paths (iterable of Path): the files to add to the archive
+      policy (CompressionPolicy): how to compress each file. Files are stored
+        without compression if not given.
+      root (Path): if given, files keep their path relative to `root` within
+        `dir_name`, e.g. for files in sub-directories
 
     yields:
       (bytes): next chunk of the archive
     """
+    if (
+        policy is not None
+        and policy.workers > 1
+        and policy.methods <= {"stored", "deflated"}
+    ):
+        yield from _parallel_zipfile_generator(dir_name, paths, policy, root)
+        return
+
+    stream = Stream()
+    writer = _ArchiveWriter(stream)
+    level = None if policy is None else policy.level
+    for path in paths:
+        z_info = _zip_info(dir_name, path, policy, root)
+        compressor = _compressor(z_info.compress_type, level)
+        yield from _write_member(writer, stream, path, z_info, compressor)
+    writer.close()
+    yield stream.get()
+
+
+def _zip_info(dir_name, path, policy, root):
+    arcname = Path(dir_name, path.name if root is None else path.relative_to(root))
+    z_info = ZipInfo.from_file(path, arcname=arcname)
+    if policy is not None:
+        z_info.compress_type, _ = policy.choose(path, z_info.file_size)
+    return z_info
+
+
+def _write_member(writer, stream, path, z_info, compressor=None):
+    # write a file with `writer`, compressed by `compressor` or stored if None
+    writer.start_member(z_info)
+    crc, compress_size, file_size = 0, 0, 0
+    with open(path, "rb") as entry:
+        for chunk in iter(lambda: entry.read(CHUNK_SIZE_BYTES), b""):
+            crc = zlib.crc32(chunk, crc)
+            file_size += len(chunk)
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            writer.write(chunk)
+            compress_size += len(chunk)
+            if stream.size >= CHUNK_SIZE_BYTES:
+                yield stream.get()
+    if compressor is not None:
+        chunk = compressor.flush()
+        writer.write(chunk)
+        compress_size += len(chunk)
+    writer.end_member(crc, compress_size, file_size)
+    if stream.size >= CHUNK_SIZE_BYTES:
+        yield stream.get()
+
+
+def _compressor(compress_type, level):
+    """Return an object with `compress` and `flush` methods that compresses the
+    data of a member with the given zipfile compression constant and level, or None
+    if the member is stored. The level does not apply to "lzma".
+    """
+    if compress_type == ZIP_DEFLATED:
+        level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+        return zlib.compressobj(level, zlib.DEFLATED, -15)
+    if compress_type == ZIP_BZIP2:
+        return bz2.BZ2Compressor(9 if level is None else level)
+    if compress_type == ZIP_LZMA:
+        return _LZMACompressor()
+    return None
+
+
+class _LZMACompressor:
+    """Compresses the data of an "lzma" member, which is raw LZMA1 data preceded by
+    the version of the LZMA SDK and the encoder properties.
+    """
+
+    def __init__(self):
+        self._compressor = lzma.LZMACompressor(lzma.FORMAT_RAW, filters=[LZMA_FILTER])
+        lc, lp, pb = LZMA_FILTER["lc"], LZMA_FILTER["lp"], LZMA_FILTER["pb"]
+        properties = struct.pack(
+            "<BL", (pb * 5 + lp) * 9 + lc, LZMA_FILTER["dict_size"]
+        )
+        self._header = struct.pack("<BBH", 9, 4, len(properties)) + properties
+
+    def compress(self, data):
+        header, self._header = self._header, b""
+        return header + self._compressor.compress(data)
+
+    def flush(self):
+        header, self._header = self._header, b""
+        return header + self._compressor.flush()
+
+
+def _deflate_block(data, level, zdict, last):
+    """Compress a block of a file as raw deflate data. Blocks other than the last
+    end with a sync flush so that the compressed blocks of a file can be
+    concatenated into a single deflate stream (as done by pigz). The end of the
+    previous block is used as a dictionary to keep the compression ratio close to
+    that of compressing the whole file at once.
+    """
+    level = -1 if level is None else level
+    if zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(
+        zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH
+    )
+
+
+def _parallel_zipfile_generator(dir_name, paths, policy, root):
+    """As `zipfile_generator` but with blocks of BLOCK_SIZE_BYTES from "deflated"
+    files compressed by a pool of `policy.workers` threads. Blocks are compressed
+    ahead of being written into the archive, across file boundaries, but no more
+    than twice the number of workers are held in memory at once. Only the
+    "stored" and "deflated" methods are supported. The zip records are written by
+    `_ArchiveWriter` as the zipfile module cannot add data compressed elsewhere.
+    """
     stream = Stream()
-    with ZipFile(stream, mode="w") as zf:
+    writer = _ArchiveWriter(stream)
+    # blocks being compressed, as 4-ples of ZipInfo, uncompressed data, Future and
+    # whether the block is the last of the file
+    pending = deque()
+    # the member being written and its CRC and sizes so far
+    current, crc, compress_size, file_size = None, 0, 0, 0
+
+    def write_pending(limit):
+        nonlocal current, crc, compress_size, file_size
+        while len(pending) > limit:
+            z_info, data, future, last = pending.popleft()
+            if z_info is not current:
+                writer.start_member(z_info)
+                current, crc, compress_size, file_size = z_info, 0, 0, 0
+            compressed = future.result()
+            writer.write(compressed)
+            crc = zlib.crc32(data, crc)
+            compress_size += len(compressed)
+            file_size += len(data)
+            if last:
+                writer.end_member(crc, compress_size, file_size)
+                current = None
+            if stream.size >= CHUNK_SIZE_BYTES:
+                yield stream.get()
+
+    with ThreadPoolExecutor(policy.workers) as executor:
         for path in paths:
-            z_info = ZipInfo.from_file(path, arcname=Path(dir_name, path.name))
-            with open(path, "rb") as entry, zf.open(z_info, mode="w") as dest:
-                for chunk in iter(lambda: entry.read(CHUNK_SIZE_BYTES), b""):
-                    dest.write(chunk)
-                    yield stream.get()
-    # ZipFile was closed.
+            z_info = _zip_info(dir_name, path, policy, root)
+            if z_info.compress_type == ZIP_STORED:
+                # members are written in order so stored files must wait for the
+                # blocks of earlier members
+                yield from write_pending(0)
+                yield from _write_member(writer, stream, path, z_info)
+                continue
+            with open(path, "rb") as entry:
+                data = entry.read(BLOCK_SIZE_BYTES)
+                zdict = b""
+                while True:
+                    following = entry.read(BLOCK_SIZE_BYTES)
+                    last = not following
+                    future = executor.submit(
+                        _deflate_block, data, policy.level, zdict, last
+                    )
+                    pending.append((z_info, data, future, last))
+                    yield from write_pending(2 * policy.workers)
+                    if last:
+                        break
+                    zdict = data[-DICTIONARY_SIZE_BYTES:]
+                    data = following
+        yield from write_pending(0)
+    writer.close()
     yield stream.get()
+
+
+class _ArchiveWriter:
+    """Writes the records of a zip archive, as described by the PKWARE APPNOTE, to
+    a stream. The data of each member is written as given, e.g. after compression
+    by another thread, and followed by a data descriptor giving its CRC and sizes.
+    ZIP64 extensions are used where sizes or offsets require them.
+    """
+
+    def __init__(self, stream):
+        """
+        args:
+          stream (Stream): where to write the archive
+        """
+        self.stream = stream
+        self.offset = 0
+        # 5-ples of ZipInfo, encoded name, flags, header offset and whether the
+        # local header has ZIP64 extensions, for the central directory
+        self.members = []
+
+    def _write(self, data):
+        self.stream.write(data)
+        self.offset += len(data)
+
+    def start_member(self, z_info):
+        """Write the local file header of a member. `z_info.file_size` must be set
+        to the expected size of the uncompressed data.
+
+        args:
+          z_info (ZipInfo): the member to start
+        """
+        name, flags = self._encode_name(z_info.filename)
+        flags |= 0x08  # CRC and sizes follow the file data
+        if z_info.compress_type == ZIP_LZMA:
+            flags |= 0x02  # the data ends with an end of stream marker
+        # allow for compressed data being a little larger than the original
+        zip64 = z_info.file_size * 1.05 > ZIP64_LIMIT
+        extra = struct.pack("<HHQQ", 1, 16, 0, 0) if zip64 else b""
+        size = 0xFFFFFFFF if zip64 else 0
+        date, time = self._dos_date_time(z_info.date_time)
+        self.members.append((z_info, name, flags, self.offset, zip64))
+        self._write(
+            struct.pack(
+                "<4sHHHHHLLLHH",
+                b"PK\x03\x04",
+                self._version(z_info, zip64),
+                flags,
+                z_info.compress_type,
+                time,
+                date,
+                0,
+                size,
+                size,
+                len(name),
+                len(extra),
+            )
+            + name
+            + extra
+        )
+
+    def write(self, data):
+        """Write (compressed) data of the current member.
+
+        args:
+          data (bytes): the data to write
+        """
+        self._write(data)
+
+    def end_member(self, crc, compress_size, file_size):
+        """Write the data descriptor of the current member.
+
+        args:
+          crc (int): CRC-32 of the uncompressed data
+          compress_size (int): the number of bytes of data written
+          file_size (int): the size of the uncompressed data
+        """
+        z_info, _, _, _, zip64 = self.members[-1]
+        if not zip64 and max(compress_size, file_size) > ZIP64_LIMIT:
+            # the local header did not allow for ZIP64 sizes
+            raise OSError(f"{z_info.filename} changed whilst being archived")
+        z_info.CRC = crc
+        z_info.compress_size = compress_size
+        z_info.file_size = file_size
+        fmt = "<4sLQQ" if zip64 else "<4sLLL"
+        self._write(struct.pack(fmt, b"PK\x07\x08", crc, compress_size, file_size))
+
+    def close(self):
+        """Write the central directory and end of central directory records."""
+        start = self.offset
+        for z_info, name, flags, header_offset, local_zip64 in self.members:
+            values = []
+            file_size, compress_size, offset = (
+                z_info.file_size,
+                z_info.compress_size,
+                header_offset,
+            )
+            if file_size > ZIP64_LIMIT:
+                values.append(file_size)
+                file_size = 0xFFFFFFFF
+            if compress_size > ZIP64_LIMIT:
+                values.append(compress_size)
+                compress_size = 0xFFFFFFFF
+            if offset > ZIP64_LIMIT:
+                values.append(offset)
+                offset = 0xFFFFFFFF
+            extra = (
+                struct.pack(f"<HH{len(values)}Q", 1, 8 * len(values), *values)
+                if values
+                else b""
+            )
+            version = self._version(z_info, values or local_zip64)
+            date, time = self._dos_date_time(z_info.date_time)
+            self._write(
+                struct.pack(
+                    "<4sBBHHHHHLLLHHHHHLL",
+                    b"PK\x01\x02",
+                    version,
+                    z_info.create_system,
+                    version,
+                    flags,
+                    z_info.compress_type,
+                    time,
+                    date,
+                    z_info.CRC,
+                    compress_size,
+                    file_size,
+                    len(name),
+                    len(extra),
+                    0,
+                    0,
+                    0,
+                    z_info.external_attr,
+                    offset,
+                )
+                + name
+                + extra
+            )
+
+        count = len(self.members)
+        size = self.offset - start
+        if count > 0xFFFF or size > ZIP64_LIMIT or start > ZIP64_LIMIT:
+            end_offset = self.offset
+            self._write(
+                struct.pack(
+                    "<4sQHHLLQQQQ",
+                    b"PK\x06\x06",
+                    44,
+                    45,
+                    45,
+                    0,
+                    0,
+                    count,
+                    count,
+                    size,
+                    start,
+                )
+            )
+            self._write(struct.pack("<4sLQL", b"PK\x06\x07", 0, end_offset, 1))
+            count, size, start = (
+                min(count, 0xFFFF),
+                min(size, 0xFFFFFFFF),
+                min(start, 0xFFFFFFFF),
+            )
+        self._write(
+            struct.pack("<4sHHHHLLH", b"PK\x05\x06", 0, 0, count, count, size, start, 0)
+        )
+
+    @staticmethod
+    def _version(z_info, zip64):
+        # the version of the APPNOTE needed to extract a member
+        return max(
+            20,
+            45 if zip64 else 0,
+            VERSIONS_NEEDED.get(z_info.compress_type, 0),
+        )
+
+    @staticmethod
+    def _encode_name(filename):
+        try:
+            return filename.encode("ascii"), 0
+        except UnicodeEncodeError:
+            return filename.encode("utf-8"), 0x800
+
+    @staticmethod
+    def _dos_date_time(date_time):
+        year, month, day, hour, minute, second = date_time
+        return (
+            (year - 1980) << 9 | month << 5 | day,
+            hour << 11 | minute << 5 | second // 2,
+        )
+
+
+_crc_cache = OrderedDict()
+_crc_cache_lock = threading.Lock()
+
+
+def _cached_crc(path, stat):
+    key = (str(path), stat.st_size, stat.st_mtime_ns)
+    with _crc_cache_lock:
+        if key in _crc_cache:
+            _crc_cache.move_to_end(key)
+            return _crc_cache[key]
+    crc = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE_BYTES), b""):
+            crc = zlib.crc32(chunk, crc)
+    _store_crc(key, crc)
+    return crc
+
+
+def _store_crc(key, crc):
+    with _crc_cache_lock:
+        _crc_cache[key] = crc
+        _crc_cache.move_to_end(key)
+        while len(_crc_cache) > CRC_CACHE_ENTRIES:
+            _crc_cache.popitem(last=False)
+
+
+class StoredArchive:
+    """A zip archive of files stored without compression. The position of every
+    part of the archive is calculated from file sizes alone, so the total size is
+    known in advance and any byte range can be produced without generating the
+    archive up to that point, e.g. to resume an interrupted download.
+
+    The CRC of each file is written after its data (as for `zipfile_generator`) and
+    is calculated as the file is sent. CRCs are cached by path, size and
+    modification time so that later ranges of the same archive do not need to
+    read files again.
+    """
+
+    def __init__(self, dir_name, paths, root=None):
+        """
+        args:
+          dir_name (str): name of parent directory that will contain files in the
+            archive
+          paths (iterable of Path): the files to add to the archive
+          root (Path): if given, files keep their path relative to `root`
+        """
+        # 4-ples of ZipInfo, path, os.stat_result and local file header
+        self.members = []
+        etag = hashlib.sha256()
+        offset = 0
+        for path in paths:
+            z_info = _zip_info(dir_name, path, None, root)
+            stat = os.stat(path)
+            z_info.flag_bits |= 0x08  # CRC and sizes follow the file data
+            z_info.compress_size = z_info.file_size = stat.st_size
+            z_info.CRC = 0
+            z_info.header_offset = offset
+            header = z_info.FileHeader(self._zip64(z_info))
+            self.members.append((z_info, path, stat, header))
+            offset += len(header) + stat.st_size + self._descriptor_size(z_info)
+            etag.update(
+                f"{z_info.filename}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode()
+            )
+        self.central_directory_offset = offset
+        # the CRCs do not affect the size of the central directory
+        self.size = offset + len(self._central_directory())
+        self.etag = f'"{etag.hexdigest()}"'
+
+    def chunks(self, start=0, end=None):
+        """Generate the bytes of the archive from `start` up to but not including
+        `end`.
+
+        args:
+          start (int): the position of the first byte
+          end (int): the position after the last byte. Defaults to the end of the
+            archive.
+
+        yields:
+          (bytes): the next chunk of the archive, of at least CHUNK_SIZE_BYTES apart
+            from the last
+        """
+        end = self.size if end is None else end
+        stream = Stream()
+        for part in self._parts(start, end):
+            stream.write(part)
+            if stream.size >= CHUNK_SIZE_BYTES:
+                yield stream.get()
+        yield stream.get()
+
+    def _parts(self, start, end):
+        position = 0
+
+        def overlap(data):
+            # the portion of `data`, found at `position`, that is in range
+            lo, hi = max(start - position, 0), max(end - position, 0)
+            return data[lo:hi]
+
+        for z_info, path, stat, header in self.members:
+            if position >= end:
+                return
+            yield overlap(header)
+            position += len(header)
+
+            data_end = position + stat.st_size
+            if start < data_end and end > position:
+                crc = 0
+                with open(path, "rb") as f:
+                    f.seek(max(start - position, 0))
+                    remaining = min(end, data_end) - max(start, position)
+                    while remaining:
+                        chunk = f.read(min(remaining, CHUNK_SIZE_BYTES))
+                        if not chunk:
+                            raise OSError(f"{path} changed whilst being archived")
+                        crc = zlib.crc32(chunk, crc)
+                        remaining -= len(chunk)
+                        yield chunk
+                if start <= position and end >= data_end:
+                    # the whole file was read
+                    _store_crc((str(path), stat.st_size, stat.st_mtime_ns), crc)
+            position = data_end
+
+            descriptor_size = self._descriptor_size(z_info)
+            if start < position + descriptor_size and end > position:
+                z_info.CRC = _cached_crc(path, stat)
+                yield overlap(self._descriptor(z_info))
+            position += descriptor_size
+
+        if end > position:
+            for z_info, path, stat, _ in self.members:
+                z_info.CRC = _cached_crc(path, stat)
+            yield overlap(self._central_directory())
+
+    def _central_directory(self):
+        # the zipfile module writes the central directory on closing, starting from
+        # the reported position of the stream
+        stream = _OffsetStream(self.central_directory_offset)
+        zf = ZipFile(stream, mode="w")
+        zf.filelist.extend(z_info for z_info, _, _, _ in self.members)
+        zf.close()
+        return stream.get()
+
+    @staticmethod
+    def _zip64(z_info):
+        return z_info.file_size > ZIP64_LIMIT
+
+    def _descriptor_size(self, z_info):
+        return 24 if self._zip64(z_info) else 16
+
+    def _descriptor(self, z_info):
+        fmt = "<LLQQ" if self._zip64(z_info) else "<LLLL"
+        return struct.pack(
+            fmt, 0x08074B50, z_info.CRC, z_info.compress_size, z_info.file_size
+        )
+
+
+_DONE = object()
+
+
+def background_zipfile_generator(
+    dir_name, paths, policy=None, root=None, max_chunks=QUEUE_CHUNKS
+):
+    """As `zipfile_generator` but with the archive constructed by a background
+    thread, see `background_chunks`.
+
+    args:
+      dir_name (str): name of parent directory that will contain files in the archive
+      paths (iterable of Path): the files to add to the archive
+      policy (CompressionPolicy): how to compress each file
+      root (Path): if given, files keep their path relative to `root`
+      max_chunks (int): the number of chunks the thread may run ahead by
+
+    yields:
+      (bytes): next chunk of the archive
+    """
+    return background_chunks(
+        zipfile_generator(dir_name, paths, policy, root), max_chunks
+    )
+
+
+def background_chunks(chunks, max_chunks=QUEUE_CHUNKS):
+    """Iterate over `chunks` in a background thread. The thread blocks once
+    `max_chunks` chunks are waiting to be sent and stops if the generator is closed
+    early, e.g. because the client disconnected.
+
+    args:
+      chunks (iterable of bytes): the chunks to produce
+      max_chunks (int): the number of chunks the thread may run ahead by
+
+    yields:
+      (bytes): next chunk
+    """
+    pending = queue.Queue(maxsize=max_chunks)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if not put(chunk):
+                    return
+        except Exception as e:
+            put(e)
+        else:
+            put(_DONE)
+
+    thread = threading.Thread(target=produce, name="zip-stream", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = pending.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
@@ -26,3 +26,6 @@ DATABASES["default"]["NAME"] = (  # noqa: F405
 )
 
 JOBS_DIR = Path(os.environ["HOME"]) / "portal_jobs"
+
+# Refresh job statuses from the scheduler in a background thread
+START_STATUS_POLLER = True